@@ -1,10 +1,24 @@
 #last updated 10/27/21 by Isaiah Mumaw
 
 #import modules
+import os
+import sys
 import numpy as np
 import scipy.optimize as sp_opt
 import matplotlib.pyplot as plt
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from fitcache import FitCache
+from peaks import propose_roi, compton_roi
+from background import net_area
+from autocal import session_calibration
+from readers import IEC_header
+from rates import dead_time, peak_rate
+from decimate import plot_line, plot_spectra
+from waterfall import read_results, sweep, plot_sweep
+from calibration import scale_gain as scale_data    #gain of the scaling points through the origin
+
 ###############################################################################
 ###########################   PRIMARY FUNCTIONS   #############################
 ###############################################################################
@@ -90,57 +104,6 @@ def IEC_to_array(filepath):
 ###############################################################################
 ###############################################################################
 
-def scale_data(data,scale_array):
-    """Scales x axis of data based on scaling array. Data points between points of array are scaled linearly.
-    Data below scaling array is scaled to 0, and data above it is scaled to most recent points.
-    
-    Parameters:
-        data (2D array): numpy array where first row is x-axis and second row is y-axis
-        scale_array (2D array): numpy array with the first row being old x-axis values, and the second row being the corresponding scaled values
-    
-    Returns
-        data (2D array): scaled version of input array
-    """
-    
-    if len(scale_array)==0:
-        return data
-    
-    if len(scale_array)==2:
-        factor = (scale_array[1,1]-scale_array[1,0])/(scale_array[0,1]-scale_array[0,0])
-        data[0] *= factor
-        return data
-    
-    n=0
-    
-    for (i,current_channel) in enumerate(data[0]):
-        
-        scale_channel = scale_array[0,n]
-        scale_energy = scale_array[1,n]
-        
-        #condition when we have not exceed scaling range
-        if current_channel<=scale_channel:
-            
-            #condition when we under the scaling range (scale to origin)
-            if n==0:
-                data[0,i] = (scale_energy/scale_channel)*(current_channel-scale_channel) + scale_energy
-            
-            #condition when we are between scaling points
-            else:
-                data[0,i] = ((scale_energy-scale_array[1,n-1])/(scale_channel-scale_array[0,n-1]))*(current_channel-scale_channel) + scale_energy
-                
-            #advance to next scaling point if needed
-            if current_channel==scale_channel:
-                n+=1
-                
-        #condition when we are above scaling range (scale to previous points)
-        else:
-            data[0,i] = ((scale_energy-scale_array[1,n-1])/(scale_channel-scale_array[0,n-1]))*(current_channel-scale_channel) + scale_energy
-
-    return data
-
-###############################################################################
-###############################################################################
-
 def fit_to_curve(data, lowerbound=None, upperbound=None):
     """Fits some data to a user-defined curve within given bounds
     
@@ -265,11 +228,17 @@ if __name__ == "__main__":
     
     print("\nProgram started")
     
+    #fits are remembered for the whole session, so refits return instantly
+    fits = FitCache()
+    
+    #calibration chosen for each data folder
+    folder_cal = {}
+    
     while True:
         
         #try:
         print("\n---------------------------------------------------------------------------")
-        print("\nSelect one of the following: \n1: Run raw data analysis \n2: Run fit energy equation \n3: Run cross section plotter \n4: Exit")
+        print("\nSelect one of the following: \n1: Run raw data analysis \n2: Run fit energy equation \n3: Run cross section plotter \n4: Overlay all trials of a folder \n5: Angle vs energy map of all trials \n6: Exit")
         choice = input("\nYour choice: ")
         choice = int(choice)
         
@@ -279,10 +248,26 @@ if __name__ == "__main__":
             filepath = fix_filepath(filepath)
             
             data,scale_array = IEC_to_array(filepath)
-            data = scale_data(data,scale_array)
+            header = IEC_header(filepath)
+            
+            #calibration spectrum of the session (Cs-137), fitted once per folder
+            folder = os.path.dirname(os.path.abspath(filepath))
+            if folder not in folder_cal:
+                cal = session_calibration(filepath, "Cs-137")
+                if cal is not None:
+                    print("\nFound calibration spectrum "+os.path.basename(cal.filepath)+": "+str(cal))
+                    if int(input("Use it for every trial in this folder? Yes=1, No=2: "))!=1:
+                        cal = None
+                folder_cal[folder] = cal
+            
+            if folder_cal[folder] is not None:
+                data = folder_cal[folder].apply(data)
+            else:
+                data = scale_data(data,scale_array)
             
             trial = input("Trial #: ")
-            plt.plot(data[0],data[1])
+            angle = input("Scattering angle in degrees (Enter if unknown): ")
+            plot_line(plt.gca(),data[0],data[1])
             plt.title("Trial "+str(trial))
             plt.xlabel("Energy (keV)")
             plt.ylabel("Counts")
@@ -291,22 +276,43 @@ if __name__ == "__main__":
             
             while True:
             
-                lower, upper = input("Lower and upper bounds of Gaussian analysis: ").split()
+                bounds = input("Lower and upper bounds of Gaussian analysis (Enter for automatic): ").split()
+                
+                if len(bounds)==0:
+                    #scattered photopeak is the one nearest the Compton energy, else the strongest peak
+                    if angle.strip():
+                        roi = compton_roi(data, float(angle))
+                    else:
+                        roi = propose_roi(data, min_channel=20, threshold=10)
+                    if roi is None:
+                        print("No peak found, enter the bounds by hand")
+                        continue
+                    lower, upper = roi
+                    print("Using bounds %.1f to %.1f"%(lower, upper))
+                else:
+                    lower, upper = bounds
      
-                params, covars, split_data = fit_to_curve(data, int(lower), int(upper))
+                params, covars, split_data = fits.fit(data, "gauss", int(lower), int(upper))
                 std_devs = np.sqrt(np.diag(covars))
                 
                 print("\nEXPERIMENTAL RESULTS:")
                 print("Mean = %.5f ± %.5f"%(params[1],std_devs[1]))
                 print("Std. = %.5f ± %.5f"%(params[0],std_devs[0]))
                 print("Total counts = "+str(np.sum(data[1])))
+                print("Net peak counts = %.0f ± %.0f (SNIP background)"%net_area(data, float(lower), float(upper), window=60))
+                
+                #rates per second of live time, as used for the cross section (Ztheta)
+                live = header["live_time"]
+                print("Live time = %.3f s (dead time %.2f%%)"%(live, 100*dead_time(live, header["real_time"])))
+                print("Count rate = %.3f ± %.3f counts/s"%(np.sum(data[1])/live, np.sqrt(np.sum(data[1]))/live))
+                print("Net peak rate = %.4f ± %.4f counts/s"%peak_rate(data, float(lower), float(upper), live, window=60))
                 
-                plt.plot(data[0],data[1],label="Raw data")
+                plot_line(plt.gca(),data[0],data[1],label="Raw data")
                 
                 gauss_x = np.linspace(data[0,0],data[0,-1],1000)
                 gauss_y = gauss(gauss_x,params[0],params[1],params[2])
                 
-                plt.plot(gauss_x,gauss_y,label="Fit curve")
+                plt.plot(gauss_x,gauss_y,color="C1",label="Fit curve")
                 plt.title("Trial "+str(trial))
                 plt.xlabel("Energy (keV)")
                 plt.ylabel("Counts")
@@ -403,6 +409,56 @@ if __name__ == "__main__":
             plt.show()           
         
         elif choice==4:
+            
+            folder = input("\nFolder of trials (type or drag/drop): ")
+            folder = os.path.abspath(fix_filepath(folder))
+            
+            #trials in order of their number, without the calibration spectra
+            names = [f for f in os.listdir(folder) if f.upper().endswith(".IEC") and not f.lower().startswith("calibration")]
+            names.sort(key=lambda f: int("0"+"".join(c for c in f if c.isdigit())))
+            
+            spectra = []
+            for name in names:
+                data,scale_array = IEC_to_array(os.path.join(folder,name))
+                if folder_cal.get(folder) is not None:
+                    spectra.append(folder_cal[folder].apply(data))
+                else:
+                    spectra.append(scale_data(data,scale_array))
+            
+            #all trials as one decimated collection, colored in order of trial
+            plot_spectra(plt.gca(),spectra,colors=plt.cm.viridis(np.linspace(0,1,len(spectra))),linewidths=0.8)
+            plt.title("%d trials"%len(spectra))
+            plt.xlabel("Energy (keV)")
+            plt.ylabel("Counts")
+            plt.show()
+        
+        elif choice==5:
+            
+            folder = input("\nFolder of trials (type or drag/drop): ")
+            folder = os.path.abspath(fix_filepath(folder))
+            
+            #angles of the trials come from the results sheet next to the folder
+            results_path = os.path.join(os.path.dirname(folder),"RESULTS.csv")
+            if not os.path.exists(results_path):
+                results_path = fix_filepath(input("Filepath of results sheet with trial angles: "))
+            
+            paths = [os.path.join(folder,f) for f in os.listdir(folder) if f.upper().endswith(".IEC") and not f.lower().startswith("calibration")]
+            #same energy axis as options 1 and 4
+            if folder_cal.get(folder) is not None:
+                calibrate = lambda data, cal_pts: folder_cal[folder].apply(data)
+            else:
+                calibrate = scale_data
+            
+            result = sweep(paths, read_results(results_path), calibrate=calibrate)
+            
+            if result is not None:
+                im = plot_sweep(plt.gca(), result["image"], result["edges"], result["angles"], result["trials"],
+                                result["means"], result["errors"])
+                plt.colorbar(im, label="Counts / peak")
+                plt.title("Scattering energies")
+                plt.show()
+        
+        elif choice==6:
             print("\nExiting program.\n")
             break
         
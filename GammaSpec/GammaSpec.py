@@ -1,10 +1,17 @@
 #by Isaiah Mumaw
 
 #import modules
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from background import snip
+from gammalines import identify_spectrum
+
 #########################################################################################################
 
 def convert( filepath, calibrate=True, verbose=False ):
@@ -149,7 +156,8 @@ def str_to_arr( in_string, dtype=str ):
 
 def calibrate( raw_data, cal_pts ):
     
-    dat = linregress(cal_pts[0], cal_pts[1])
+    #cal_pts rows are (energy, channel), fit energy as a function of channel
+    dat = linregress(cal_pts[1], cal_pts[0])
     
     raw_data[0] *= dat[0]
     raw_data[0] += dat[1]
@@ -166,15 +174,31 @@ data, dat = calibrate( raw_data, cal )
 
 print( dat )
 
+#likely sources of the photopeaks
+ranking, assigned, lines = identify_spectrum( data )
+
+for ( energy, error, nuclide ) in zip( lines[0], lines[1], assigned ):
+    print( "Peak at %.1f ± %.1f keV: %s"%( energy, error, nuclide if nuclide else "no match" ) )
+
+for result in ranking[:3]:
+    print( "%s (score %.2f, %d lines)"%( result["nuclide"], result["score"], len(result["lines"]) ) )
+
+#continuum under the photopeaks
+background = snip( data[1] )
+
 plt.figure("Linear plot")
 plt.plot( data[0], data[1] )
+plt.plot( data[0], background, "--", label="Continuum (SNIP)" )
 plt.xlabel("Energy (keV)")
 plt.ylabel("Counts")
+plt.legend()
 
 plt.figure("Log plot")
 plt.plot( data[0], data[1] )
+plt.plot( data[0], background, "--", label="Continuum (SNIP)" )
 plt.xlabel("Energy (keV)")
 plt.ylabel("Counts")
+plt.legend()
 
 ax = plt.gca()
 ax.set_yscale("log")
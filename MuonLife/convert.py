@@ -1,10 +1,14 @@
+import os
 import lab_3 as l3
 
-data,array,err = l3.IEC_to_array("/Users/isaiahmumaw/Documents/College/Fall 2021/Modern Phys Lab/Lab 3/time_cal.IEC")
+#paths are relative to this file, see also SpecTools/recipes/muon_time_cal.toml
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DATA")
 
-f = open("/Users/isaiahmumaw/Documents/College/Fall 2021/Modern Phys Lab/Lab 3/time_cal.csv", "w")
+data,array = l3.IEC_to_array(os.path.join(folder, "time_cal.IEC"))
+
+f = open(os.path.join(folder, "time_cal.csv"), "w")
 
 for i in range(len(data[0])):
     f.write(str(data[0,i])+","+str(data[1,i])+"\n")
 
-f.close()
\ No newline at end of file
+f.close()
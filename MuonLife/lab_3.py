@@ -1,11 +1,20 @@
 #last updated 10/27/21 by Isaiah Mumaw
 
 #import modules
+import os
+import sys
 import numpy as np
 import scipy.optimize as sp_opt
 import matplotlib.pyplot as plt
 import time
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from fitcache import FitCache
+from peaks import decay_roi
+from decimate import plot_line
+from calibration import scale_gain as scale_data    #gain of the scaling points through the origin
+
 ###############################################################################
 ###########################   PRIMARY FUNCTIONS   #############################
 ###############################################################################
@@ -90,57 +99,6 @@ def IEC_to_array(filepath):
 ###############################################################################
 ###############################################################################
 
-def scale_data(data,scale_array):
-    """Scales x axis of data based on scaling array. Data points between points of array are scaled linearly.
-    Data below scaling array is scaled to 0, and data above it is scaled to most recent points.
-    
-    Parameters:
-        data (2D array): numpy array where first row is x-axis and second row is y-axis
-        scale_array (2D array): numpy array with the first row being old x-axis values, and the second row being the corresponding scaled values
-    
-    Returns
-        data (2D array): scaled version of input array
-    """
-    
-    if len(scale_array)==0:
-        return data
-    
-    if len(scale_array)==2:
-        factor = scale_array[1,0]/scale_array[0,0]
-        data[0] *= factor
-        return data
-    
-    n=0
-    
-    for (i,current_channel) in enumerate(data[0]):
-        
-        scale_channel = scale_array[0,n]
-        scale_energy = scale_array[1,n]
-        
-        #condition when we have not exceed scaling range
-        if current_channel<=scale_channel:
-            
-            #condition when we under the scaling range (scale to origin)
-            if n==0:
-                data[0,i] = (scale_energy/scale_channel)*(current_channel-scale_channel) + scale_energy
-            
-            #condition when we are between scaling points
-            else:
-                data[0,i] = ((scale_energy-scale_array[1,n-1])/(scale_channel-scale_array[0,n-1]))*(current_channel-scale_channel) + scale_energy
-                
-            #advance to next scaling point if needed
-            if current_channel==scale_channel:
-                n+=1
-                
-        #condition when we are above scaling range (scale to previous points)
-        else:
-            data[0,i] = ((scale_energy-scale_array[1,n-1])/(scale_channel-scale_array[0,n-1]))*(current_channel-scale_channel) + scale_energy
-
-    return data
-
-###############################################################################
-###############################################################################
-
 def fit_to_curve(data, func, lowerbound=None, upperbound=None):
     """Fits some data to a user-defined curve within given bounds
     
@@ -186,11 +144,12 @@ def fit_to_curve(data, func, lowerbound=None, upperbound=None):
 
 def lab3_plotter(data,params):
     
-    plt.plot(data[0],data[1],label="Raw Data")
+    #both drawn at screen resolution, the fit curve has 100 points per channel
+    plot_line(plt.gca(),data[0],data[1],label="Raw Data")
     
     fit_xpts = np.linspace(data[0,0],data[0,-1],len(data[0])*100)
     fit_ypts = expon_decay(fit_xpts,params[0],params[1])
-    plt.plot(fit_xpts,fit_ypts,label="Fit curve")
+    plot_line(plt.gca(),fit_xpts,fit_ypts,method="lttb",label="Fit curve")
     
     return
 
@@ -220,6 +179,9 @@ if __name__ == "__main__":
     
     print("\nProgram started")
     
+    #fits are remembered for the whole session, so refits return instantly
+    fits = FitCache()
+    
     while True:
         
         print("\n---------------------------------------------------------------------------")
@@ -249,14 +211,18 @@ if __name__ == "__main__":
                                 scale_array = np.array([[channels],[period]])
                                 data = scale_data(data,scale_array)
                                 
-                                bounds = input("\nEnter lower and upper bounds of data to analyze (in microseconds) (separated by spaces): ").split()
+                                bounds = input("\nEnter lower and upper bounds of data to analyze (in microseconds) (separated by spaces, or Enter for automatic): ").split()
                                 
                                 try:
+                                    if len(bounds)==0:
+                                        bounds = decay_roi(data)
+                                        print("Using bounds %.3f to %.3f"%(bounds[0], bounds[1]))
+                                    
                                     lower = float(bounds[0])
                                     upper = float(bounds[1])
                                     
                                     if lower<upper:
-                                        params, covars, data = fit_to_curve(data,expon_decay,lowerbound=lower,upperbound=upper)
+                                        params, covars, data = fits.fit(data,"expon_decay",lowerbound=lower,upperbound=upper)
                                         std_dev = np.sqrt(np.diag(covars))
                                             
                                         title = input("\nEnter a plot title (or press Enter to skip): ")
@@ -1,10 +1,16 @@
 #last updated 9/17/21 by Isaiah Mumaw
 
 #import modules
+import os
+import sys
 from scipy.stats import skewnorm
 import numpy as np
 import matplotlib.pyplot as plt
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from transforms import cuts
+
 
 def convert(filepath,num_channels,threshold=2,range_min=0,range_max=1000000000):
     """Converts .csv file to a readable format
@@ -35,19 +41,13 @@ def convert(filepath,num_channels,threshold=2,range_min=0,range_max=1000000000):
             count = int(row[1])
             
             raw_data[0,i-1] = channel
-          
-            if count>=threshold and ((i-1)>=range_min) and ((i-1)<=range_max):
-                raw_data[1,i-1] = count
+            raw_data[1,i-1] = count
     
-    #now create an array where each channel is listed once per count
-    data = np.empty(sum(raw_data[1]),dtype=int)
-    index = 0
+    #keep counts at or above threshold within range_min..range_max
+    cuts(range_min,range_max,threshold)(raw_data[1],out=raw_data[1])
     
-    #populate array
-    for (i,value) in enumerate(raw_data[1]):    #cycle through count set
-        for j in range(value):                  #cycle through each count
-            data[index+j] = raw_data[0,i]       #list channel associated with count
-        index+=value                            #move marker to prevent overwrite
+    #now create an array where each channel is listed once per count
+    data = np.repeat(raw_data[0],raw_data[1])
     
     return raw_data, data
 
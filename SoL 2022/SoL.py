@@ -8,12 +8,19 @@
 ##################################  MODULES  ##################################
 ###############################################################################
 
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import skewnorm
 from scipy.stats import norm
 import scipy.stats as sps
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from decimate import plot_line
+from transforms import cuts
+
 ###############################################################################
 #################################  FUNCTIONS  #################################
 ###############################################################################
@@ -117,12 +124,7 @@ def filter_data( data, min_x, max_x, min_y, max_y ):
     """
     
     filtered_data = np.copy(data)
-    
-    for i in range(len(data[0])):
-        if i<min_x or i>max_x or data[1][i]<min_y:
-            filtered_data[1,i] = 0
-        elif data[1,i] > max_y:
-            filtered_data[1,i] = max_y
+    cuts( min_x, max_x, min_y, max_y )( filtered_data[1], out=filtered_data[1] )
     
     return filtered_data
 
@@ -161,7 +163,7 @@ if __name__=="__main__":
                 print("Plotting raw data...")
                 
                 #plot raw data - no filter applied
-                plt.plot(data[0],data[1])
+                plot_line(plt.gca(),data[0],data[1])
                 plt.title("Raw Data")
                 plt.xlabel("Channels")
                 plt.ylabel("Counts")
@@ -196,8 +198,9 @@ if __name__=="__main__":
                     print("Mean: ", mean)
                     print("Variance: ", var)
                     
-                    plt.plot(data[0],data[1],label="Data")
-                    plt.plot(x_pts,y_pts,label="Fit curve")
+                    #fit curve has 100 points per channel, drawn at screen resolution
+                    plot_line(plt.gca(),data[0],data[1],label="Data")
+                    plot_line(plt.gca(),x_pts,y_pts,method="lttb",label="Fit curve")
                     
                     plt.title(title)
                     plt.xlabel("Channels")
@@ -0,0 +1,216 @@
+# Filename: accumulator.py
+# Purpose: Channel-by-channel statistics (mean, variance, min, max) over many
+#          repeated runs for stability studies, without keeping the runs in
+#          memory. Runs are added one at a time or in batches (Welford's update),
+#          and accumulators filled by parallel workers can be merged.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import readers
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+class SpectrumAccumulator:
+    """Running statistics of each channel over a series of spectra
+
+    Parameters:
+        num_channels (int, optional): channels per spectrum. Taken from the first
+            spectrum added if not given
+    """
+
+    def __init__( self, num_channels=None ):
+
+        self.count = 0
+        self.total = None           #sum of counts over all spectra
+        self._mean = None
+        self._m2 = None             #sum of squared differences from the mean
+        self._min = None
+        self._max = None
+
+        if num_channels is not None:
+            self._allocate( num_channels )
+
+    def _allocate( self, num_channels ):
+
+        self.total = np.zeros( num_channels )
+        self._mean = np.zeros( num_channels )
+        self._m2 = np.zeros( num_channels )
+        self._min = np.full( num_channels, np.inf )
+        self._max = np.full( num_channels, -np.inf )
+
+    ###########################################################################
+
+    def add( self, counts ):
+        """Adds one spectrum, or a stack of spectra (one per row)"""
+
+        counts = np.atleast_2d( np.asarray( counts, dtype=float ) )
+
+        if self._mean is None:
+            self._allocate( counts.shape[1] )
+
+        if counts.shape[1]!=len(self._mean):
+            print( "Value Error: spectrum has %d channels, expected %d (skipped)"%( counts.shape[1], len(self._mean) ) )
+            return self
+
+        if len(counts)==1:
+            #Welford's update for a single spectrum
+            self.count += 1
+            delta = counts[0] - self._mean
+            self._mean += delta/self.count
+            self._m2 += delta*( counts[0]-self._mean )
+            self.total += counts[0]
+            np.minimum( self._min, counts[0], out=self._min )
+            np.maximum( self._max, counts[0], out=self._max )
+
+        else:
+            #statistics of the batch, then combined as for merge()
+            self._combine( len(counts), np.sum( counts, axis=0 ), np.mean( counts, axis=0 ),
+                           np.sum( ( counts-np.mean( counts, axis=0 ) )**2, axis=0 ),
+                           np.min( counts, axis=0 ), np.max( counts, axis=0 ) )
+
+        return self
+
+    def merge( self, other ):
+        """Adds the spectra of another accumulator (e.g. from a parallel worker)"""
+
+        if other.count==0:
+            return self
+
+        if self._mean is None:
+            self._allocate( len(other._mean) )
+
+        self._combine( other.count, other.total, other._mean, other._m2, other._min, other._max )
+
+        return self
+
+    def _combine( self, count, total, mean, m2, low, high ):
+        """Chan's formula for the union of two sets of spectra"""
+
+        combined = self.count + count
+        delta = mean - self._mean
+
+        self._m2 += m2 + delta**2*self.count*count/combined
+        self._mean += delta*count/combined
+        self.total += total
+        self.count = combined
+        np.minimum( self._min, low, out=self._min )
+        np.maximum( self._max, high, out=self._max )
+
+    ###########################################################################
+
+    @property
+    def mean( self ):
+        return self._mean.copy()
+
+    @property
+    def variance( self ):
+        """Sample variance of each channel across the spectra"""
+        return self._m2/( self.count-1 ) if self.count>1 else np.full( len(self._mean), np.nan )
+
+    @property
+    def std( self ):
+        return np.sqrt( self.variance )
+
+    @property
+    def min( self ):
+        return self._min.copy()
+
+    @property
+    def max( self ):
+        return self._max.copy()
+
+    def dispersion( self ):
+        """Variance over mean of each channel, 1 for counts that only vary by
+        Poisson statistics, more if the runs drift"""
+
+        with np.errstate( divide="ignore", invalid="ignore" ):
+            return np.where( self._mean>0, self.variance/self._mean, np.nan )
+
+    def summary( self ):
+        """Summary spectra as a 2D array: channel, mean, std, min, max"""
+
+        return np.array( [ np.arange( len(self._mean) ), self.mean, self.std, self.min, self.max ] )
+
+###############################################################################
+
+def accumulate_files( paths, num_channels=None ):
+    """Accumulates the spectra of a list of files, one file at a time
+
+    Parameters:
+        paths (list): filepaths of .IEC or .csv files with the same number of channels
+        num_channels (int, optional): channels per spectrum
+
+    Returns:
+        acc (SpectrumAccumulator): statistics of the files that could be read
+    """
+
+    acc = SpectrumAccumulator( num_channels )
+
+    for path in paths:
+        data = readers.read_spectrum( path )[0]
+        if data is not None:
+            acc.add( data[1] )
+
+    return acc
+
+###############################################################################
+
+def parallel_accumulate( paths, workers=None ):
+    """accumulate_files() split over a pool of processes, with the partial
+    accumulators of the workers merged at the end
+
+    Parameters:
+        paths (list): filepaths of .IEC or .csv files with the same number of channels
+        workers (int, optional): number of processes. Defaults to the number of CPUs
+
+    Returns:
+        acc (SpectrumAccumulator): statistics of all files
+    """
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [ paths[i::workers] for i in range( workers ) if len( paths[i::workers] )>0 ]
+
+    acc = SpectrumAccumulator()
+
+    with ProcessPoolExecutor( len(chunks) ) as pool:
+        for partial in pool.map( accumulate_files, chunks ):
+            acc.merge( partial )
+
+    return acc
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Channel statistics over repeated runs" )
+    parser.add_argument( "paths", nargs="+", help=".IEC or .csv files with the same number of channels" )
+    parser.add_argument( "-o", "--output", help="csv of channel, mean, std, min, max" )
+    parser.add_argument( "-j", "--workers", type=int, default=1, help="number of processes" )
+    args = parser.parse_args()
+
+    acc = accumulate_files( args.paths ) if args.workers==1 else parallel_accumulate( args.paths, args.workers )
+
+    if acc.count==0:
+        sys.exit(1)
+
+    print( "%d spectra, %d channels, mean total %.0f counts, median dispersion %.3f"%(
+           acc.count, len(acc.mean), np.sum( acc.mean ), np.nanmedian( acc.dispersion() ) ) )
+
+    if args.output:
+        np.savetxt( args.output, acc.summary().T, delimiter=",", header="Channel,Mean,Std,Min,Max", comments="" )
+
+    sys.exit(0)
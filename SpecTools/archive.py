@@ -0,0 +1,300 @@
+# Filename: archive.py
+# Purpose: Packs the spectra of a catalog (see catalog.py) into one binary file
+#          so that they are read without opening and parsing thousands of text
+#          files. Spectra with the same number of channels are stored as rows of
+#          one counts matrix, in order of lab and acquisition, next to a
+#          metadata table (the catalog entries). Matrices are read by memory
+#          mapping, so a run of spectra (e.g. all Compton trials) is a single
+#          contiguous read of only the rows that are used.
+# Date Created: 10/19/26
+#
+# File layout: 8 byte magic "SPECARC1", 8 byte little-endian length of the JSON
+# header, the JSON header (groups with channels, rows, dtype and offset of their
+# matrix, and entries with the metadata, group and row of every spectrum), then
+# the matrices, each starting on a 4096 byte boundary.
+#
+#   python archive.py pack catalog.db -o spectra.arc
+#   python archive.py info spectra.arc --lab ComptonScatter
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import json
+import struct
+import argparse
+
+import numpy as np
+
+import readers
+import catalog
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+MAGIC = b"SPECARC1"
+ALIGN = 4096
+DTYPE = "<f8"
+
+#metadata kept for each spectrum (cal_pts is stored as a list of two rows)
+FIELDS = [ "path", "lab", "name", "kind", "title", "live_time", "real_time", "channels",
+           "date", "acquired", "cal_pts" ]
+
+###############################################################################
+
+def is_spectrum( entry ):
+    """True for catalog entries holding a spectrum: .IEC files, and csv files
+    with Channel,Counts columns (not results sheets or line tables)"""
+
+    if entry["kind"]=="IEC":
+        return True
+
+    if entry["kind"]!="csv":
+        return False
+
+    with open( entry["path"], "r", encoding="utf-8-sig" ) as fin:
+        return fin.readline().strip().lower().startswith( "channel" )
+
+###############################################################################
+
+def pack( entries, filepath ):
+    """Writes spectra into an archive file
+
+    Parameters:
+        entries (list): catalog entries (from catalog.query()) of the files to pack,
+            entries that are not spectra or cannot be read are left out
+        filepath (string): archive file to write
+
+    Returns:
+        packed (int): number of spectra written
+    """
+
+    groups = {}
+
+    for entry in sorted( entries, key=lambda e: ( e["lab"] or "", e["acquired"] or "", e["path"] ) ):
+        if not is_spectrum( entry ):
+            continue
+
+        try:
+            data, cal_pts = readers.read_spectrum( entry["path"] )
+        except ValueError:
+            data = None
+
+        if data is None:
+            print("File Type Error: could not read "+entry["path"])
+            continue
+
+        meta = { field:entry.get( field ) for field in FIELDS }
+        meta["cal_pts"] = np.asarray( cal_pts, dtype=float ).tolist()
+        meta["channels"] = data.shape[1]
+
+        groups.setdefault( data.shape[1], [] ).append( ( meta, data[1] ) )
+
+    #header first, to know where the matrices start
+    table = []
+    layout = []
+
+    for ( g, channels ) in enumerate( sorted( groups ) ):
+        layout.append( { "channels":channels, "rows":len( groups[channels] ), "dtype":DTYPE, "offset":0 } )
+        for ( row, ( meta, counts ) ) in enumerate( groups[channels] ):
+            table.append( dict( meta, group=g, row=row ) )
+
+    header = _header( layout, table )
+    offset = _align( len(header) )
+    for group in layout:
+        group["offset"] = offset
+        offset = _align( offset + group["rows"]*group["channels"]*np.dtype( DTYPE ).itemsize )
+
+    header = _header( layout, table )
+
+    with open( filepath, "wb" ) as fout:
+        fout.write( header )
+        for group in layout:
+            fout.seek( group["offset"] )
+            for ( meta, counts ) in groups[ group["channels"] ]:
+                fout.write( np.asarray( counts, dtype=DTYPE ).tobytes() )
+        fout.truncate( offset )
+
+    return len(table)
+
+###############################################################################
+
+class Archive:
+    """Read access to an archive file. Matrices are memory mapped, so opening is
+    cheap and only the rows that are used are read from disk.
+
+    Parameters:
+        filepath (string): archive file from pack()
+
+    Attributes:
+        entries (list): metadata of every spectrum, with its group and row
+        groups (list): channels, rows, dtype and offset of every counts matrix
+    """
+
+    def __init__( self, filepath ):
+
+        self.filepath = filepath
+
+        with open( filepath, "rb" ) as fin:
+            if fin.read( 8 )!=MAGIC:
+                raise ValueError( filepath+" is not a spectrum archive" )
+            length = struct.unpack( "<Q", fin.read( 8 ) )[0]
+            header = json.loads( fin.read( length ).decode("utf-8") )
+
+        self.groups = header["groups"]
+        self.entries = header["entries"]
+        self._matrices = {}
+
+    def __len__( self ):
+
+        return len( self.entries )
+
+    def matrix( self, group ):
+        """Memory-mapped counts matrix of a group, one row per spectrum"""
+
+        if group not in self._matrices:
+            info = self.groups[group]
+            self._matrices[group] = np.memmap( self.filepath, dtype=info["dtype"], mode="r", offset=info["offset"],
+                                               shape=( info["rows"], info["channels"] ) )
+
+        return self._matrices[group]
+
+    ###########################################################################
+
+    def counts( self, index ):
+        """Counts of one spectrum (a read-only view of the archive)"""
+
+        entry = self.entries[index]
+
+        return self.matrix( entry["group"] )[ entry["row"] ]
+
+    def spectrum( self, index ):
+        """One spectrum as readers.read_spectrum() gives it
+
+        Returns:
+            data (2D array): first row is channels and second row is counts
+            cal_pts (2D array): calibration points stored in the file
+        """
+
+        counts = self.counts( index )
+        cal_pts = np.array( self.entries[index]["cal_pts"], dtype=float ).reshape( 2, -1 )
+
+        return np.array( [ np.arange( len(counts) ), counts ], dtype=float ), cal_pts
+
+    def stack( self, indices ):
+        """Counts of several spectra with the same number of channels, one per
+        row. Neighbouring rows (e.g. a whole lab) come back as a view of one
+        contiguous block, anything else as a copy.
+
+        Parameters:
+            indices (list): indices into entries
+
+        Returns:
+            stack (2D array): counts, one row per index
+        """
+
+        indices = list( indices )
+        if len(indices)==0:
+            return np.zeros( (0,0) )
+
+        groups = { self.entries[i]["group"] for i in indices }
+        if len(groups)>1:
+            print("Value Error: spectra have different numbers of channels")
+            return None
+
+        matrix = self.matrix( groups.pop() )
+        rows = np.array( [ self.entries[i]["row"] for i in indices ] )
+
+        if np.all( np.diff( rows )==1 ):
+            return matrix[ rows[0]:rows[-1]+1 ]
+
+        return matrix[rows]
+
+    ###########################################################################
+
+    def select( self, after=None, before=None, title=None, lab=None, kind=None, name=None,
+                live_time=None, real_time=None, channels=None, calibrated=None ):
+        """Indices of the spectra matching all given conditions, with the same
+        parameters as catalog.query()"""
+
+        low = None if after is None else catalog.iso_date( after )
+        high = None if before is None else catalog.iso_date( before if len(before)>8 else before+" 23:59:59" )
+
+        def matches( entry ):
+
+            if low is not None and ( entry["acquired"] is None or entry["acquired"]<low ):
+                return False
+            if high is not None and ( entry["acquired"] is None or entry["acquired"]>high ):
+                return False
+
+            for ( field, value ) in [ ("title",title), ("lab",lab), ("kind",kind), ("channels",channels) ]:
+                if value is not None and entry[field]!=value:
+                    return False
+
+            if name is not None and name not in entry["name"]:
+                return False
+
+            for ( field, bounds ) in [ ("live_time",live_time), ("real_time",real_time) ]:
+                if bounds is not None and ( entry[field] is None or not bounds[0]<=entry[field]<=bounds[1] ):
+                    return False
+
+            if calibrated is not None and ( len( entry["cal_pts"][0] )>0 )!=calibrated:
+                return False
+
+            return True
+
+        return [ i for ( i, entry ) in enumerate( self.entries ) if matches( entry ) ]
+
+###############################################################################
+#############################  HELPER FUNCTIONS  ##############################
+###############################################################################
+
+def _header( groups, entries ):
+    """Magic, length and JSON of the header"""
+
+    text = json.dumps( { "version":1, "groups":groups, "entries":entries } ).encode("utf-8")
+
+    return MAGIC + struct.pack( "<Q", len(text) ) + text
+
+def _align( offset ):
+    """Next multiple of ALIGN"""
+
+    return -( -offset//ALIGN )*ALIGN
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Pack catalogued spectra into one archive file" )
+    commands = parser.add_subparsers( dest="command", required=True )
+
+    write = commands.add_parser( "pack", help="write an archive from a catalog" )
+    write.add_argument( "catalog", help="catalog database from catalog.py" )
+    write.add_argument( "-o", "--output", required=True, help="archive file" )
+    write.add_argument( "--lab", default=None, help="only pack this lab" )
+
+    info = commands.add_parser( "info", help="list the spectra of an archive" )
+    info.add_argument( "archive", help="archive file" )
+    info.add_argument( "--lab", default=None )
+    info.add_argument( "--title", default=None )
+    args = parser.parse_args()
+
+    if args.command=="pack":
+        count = pack( catalog.query( args.catalog, lab=args.lab ), args.output )
+        print( "%d spectra packed into %s (%.1f MB)"%( count, args.output, os.path.getsize( args.output )/2**20 ) )
+        sys.exit(0)
+
+    arc = Archive( args.archive )
+    for i in arc.select( lab=args.lab, title=args.title ):
+        entry = arc.entries[i]
+        print( "%4d %-19s %-8s %6d  %s"%( i, entry["acquired"] or "", entry["title"] or entry["kind"], entry["channels"], entry["name"] ) )
+
+    for ( g, group ) in enumerate( arc.groups ):
+        print( "group %d: %d spectra of %d channels"%( g, group["rows"], group["channels"] ) )
+
+    sys.exit(0)
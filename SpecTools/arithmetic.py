@@ -0,0 +1,285 @@
+# Filename: arithmetic.py
+# Purpose: Spectrum arithmetic that used to be done in spreadsheets (e.g.
+#          time_cal.xlsx): sums of runs, weighted sums, background subtraction
+#          scaled by live time, and rebinning that keeps the total counts. Every
+#          operation carries the variance of each channel along, and works on one
+#          spectrum or a stack of spectra (one per row) without loops.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import readers
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def poisson( counts, variance=None ):
+    """Variance of counts, Poisson unless given"""
+
+    if variance is None:
+        return np.maximum( np.asarray( counts, dtype=float ), 0 )
+
+    return np.asarray( variance, dtype=float )
+
+###############################################################################
+
+def total( stack, variance=None ):
+    """Sum of a stack of spectra (e.g. muondet1 and muondet2)
+
+    Parameters:
+        stack (2D array): spectra with the same channels, one per row
+        variance (2D array, optional): variance of each channel. Defaults to Poisson
+
+    Returns:
+        counts (array): summed spectrum
+        variance (array): variance of each channel of the sum
+    """
+
+    stack = np.asarray( stack, dtype=float )
+
+    return np.sum( stack, axis=0 ), np.sum( poisson( stack, variance ), axis=0 )
+
+###############################################################################
+
+def weighted_sum( stack, weights, variance=None ):
+    """Weighted sum of a stack of spectra
+
+    Parameters:
+        stack (2D array): spectra with the same channels, one per row
+        weights (array): weight of each spectrum
+        variance (2D array, optional): variance of each channel. Defaults to Poisson
+
+    Returns:
+        counts (array): sum of weight*spectrum
+        variance (array): sum of weight^2*variance
+    """
+
+    stack = np.asarray( stack, dtype=float )
+    weights = np.asarray( weights, dtype=float )
+
+    return weights @ stack, ( weights**2 ) @ poisson( stack, variance )
+
+###############################################################################
+
+def subtract( counts, background, live_time=1., background_live_time=1., variance=None, background_variance=None ):
+    """Subtracts a background spectrum scaled to the live time of the measurement
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        background (array): background spectrum (or one per row of counts)
+        live_time (float or array): live time of each spectrum
+        background_live_time (float or array): live time of the background
+        variance, background_variance (array, optional): variance of each
+            channel. Default to Poisson
+
+    Returns:
+        net (array): counts minus scaled background, same shape as counts
+        variance (array): variance of each channel of net
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    background = np.asarray( background, dtype=float )
+
+    scale = np.asarray( live_time, dtype=float )/np.asarray( background_live_time, dtype=float )
+    if np.ndim( scale )==1:
+        scale = scale[:,None]
+
+    net = counts - scale*background
+    var = poisson( counts, variance ) + scale**2*poisson( background, background_variance )
+
+    return net, np.broadcast_to( var, net.shape ).copy()
+
+###############################################################################
+
+def rebin( counts, factor, variance=None ):
+    """Sums every factor neighbouring channels into one. Channels left over at
+    the end go into a last, narrower bin, so no counts are lost.
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        factor (int): number of channels per new bin
+        variance (array, optional): variance of each channel. Defaults to Poisson
+
+    Returns:
+        counts (array): rebinned counts
+        variance (array): variance of each new bin
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    var = poisson( counts, variance )
+    starts = np.arange( 0, counts.shape[-1], int(factor) )
+
+    return np.add.reduceat( counts, starts, axis=-1 ), np.add.reduceat( var, starts, axis=-1 )
+
+###############################################################################
+
+def rebin_data( data, factor, variance=None ):
+    """rebin() for data with an x axis, the new x value of each bin is the mean
+    x of its channels
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        factor (int): number of channels per new bin
+        variance (array, optional): variance of each channel. Defaults to Poisson
+
+    Returns:
+        rebinned (2D array): rebinned data
+        variance (array): variance of each new bin
+    """
+
+    counts, var = rebin( data[1], factor, variance )
+    x = rebin( data[0], factor )[0]/np.diff( np.r_[ np.arange( 0, len(data[0]), int(factor) ), len(data[0]) ] )
+
+    return np.array( [ x, counts ] ), var
+
+###############################################################################
+
+def edge_positions( edges, new_edges ):
+    """Fractional position of new edges among old edges (one set per row)
+
+    Parameters:
+        edges (2D array): increasing old edges, one row per spectrum
+        new_edges (array): increasing new edges, shared by every row
+
+    Returns:
+        position (2D array): for each row, index of old bin plus fraction inside it,
+            clipped to the old range
+    """
+
+    rows, n = edges.shape[0], edges.shape[1]-1
+
+    #evenly spaced edges (e.g. a gain and offset) need no search
+    width = ( edges[:,-1]-edges[:,0] )/n
+    if np.allclose( edges, edges[:,:1] + width[:,None]*np.arange( n+1 )[None,:], rtol=0, atol=1e-9*np.max( np.abs( width ) ) ):
+        return np.clip( ( new_edges[None,:]-edges[:,:1] )/width[:,None], 0, n )
+
+    #stack the rows end to end so that one searchsorted covers all of them
+    low = np.minimum( edges[:,0], new_edges[0] )
+    span = np.maximum( edges[:,-1], new_edges[-1] ) - low + 1
+    shift = np.r_[ 0, np.cumsum( span )[:-1] ] - low
+
+    flat = ( edges + shift[:,None] ).ravel()
+    index = np.searchsorted( flat, ( new_edges[None,:] + shift[:,None] ).ravel(), side="right" ).reshape( rows, -1 )
+    index -= ( n+1 )*np.arange( rows )[:,None] + 1
+    index = np.clip( index, 0, n-1 )
+
+    lower = np.take_along_axis( edges, index, axis=1 )
+    upper = np.take_along_axis( edges, index+1, axis=1 )
+    fraction = np.clip( ( new_edges[None,:]-lower )/( upper-lower ), 0, 1 )
+
+    return index + fraction
+
+###############################################################################
+
+def rebin_edges( counts, edges, new_edges, variance=None ):
+    """Moves counts onto arbitrary new bins, sharing each old bin between the new
+    bins it overlaps in proportion to the overlap. Counts inside the new range are
+    kept exactly, and the variance is shared the same way (as if the counts of a
+    split bin were divided at random).
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        edges (array): increasing edges of the old bins (channels+1 values), or
+            one row of edges per spectrum
+        new_edges (array): increasing edges of the new bins
+        variance (array, optional): variance of each channel. Defaults to Poisson
+
+    Returns:
+        counts (array): counts in each new bin
+        variance (array): variance of each new bin
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    stack = np.atleast_2d( counts )
+    var = np.atleast_2d( poisson( counts, variance ) )
+    rows, n = stack.shape
+
+    edges = np.broadcast_to( np.asarray( edges, dtype=float ), (rows, n+1) )
+    new_edges = np.asarray( new_edges, dtype=float )
+
+    position = edge_positions( edges, new_edges )
+    index = np.minimum( position.astype(int), n-1 )
+    fraction = position-index
+
+    #flat indices into the cumulative sums of all rows
+    index += ( n+1 )*np.arange( rows )[:,None]
+
+    def share( values ):
+        cumsum = np.zeros( (rows, n+1) )
+        np.cumsum( values, axis=1, out=cumsum[:,1:] )
+        cumsum = cumsum.ravel()
+        below = cumsum[index]
+        return np.diff( below + fraction*( cumsum[index+1]-below ), axis=1 )
+
+    rebinned = share( stack ), share( var )
+
+    shape = counts.shape[:-1] + ( len(new_edges)-1, )
+
+    return rebinned[0].reshape( shape ), rebinned[1].reshape( shape )
+
+###############################################################################
+
+def channel_edges( num_channels ):
+    """Edges of channels 0 to num_channels-1, each channel centered on its number"""
+
+    return np.arange( num_channels+1 ) - 0.5
+
+###############################################################################
+
+def write_csv( filepath, data, variance=None ):
+    """Writes data in the (channel, counts) csv format read by readers.CSV_to_array(),
+    with the variance as an extra column if given"""
+
+    if variance is None:
+        np.savetxt( filepath, np.transpose( data ), delimiter=",", header="Channel,Counts", comments="" )
+    else:
+        np.savetxt( filepath, np.transpose( [ data[0], data[1], variance ] ), delimiter=",",
+                    header="Channel,Counts,Variance", comments="" )
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Sum, subtract or rebin spectra" )
+    parser.add_argument( "operation", choices=["sum","subtract","rebin"] )
+    parser.add_argument( "paths", nargs="+", help="spectra (.IEC or .csv). For subtract, the "
+                                                   "measurement then the background" )
+    parser.add_argument( "-o", "--output", required=True, help="output .csv" )
+    parser.add_argument( "--factor", type=int, default=2, help="channels per bin for rebin" )
+    parser.add_argument( "--live", type=float, nargs=2, default=(1.,1.),
+                         help="live times of measurement and background for subtract" )
+    args = parser.parse_args()
+
+    spectra = [ readers.read_spectrum( path )[0] for path in args.paths ]
+    if any( s is None for s in spectra ):
+        sys.exit(1)
+
+    if args.operation=="sum":
+        if len( { s.shape for s in spectra } )>1:
+            print("Value Error: spectra must have the same number of channels")
+            sys.exit(1)
+        counts, variance = total( [ s[1] for s in spectra ] )
+        data = np.array( [ spectra[0][0], counts ] )
+
+    elif args.operation=="subtract":
+        counts, variance = subtract( spectra[0][1], spectra[1][1], *args.live )
+        data = np.array( [ spectra[0][0], counts ] )
+
+    else:
+        data, variance = rebin_data( spectra[0], args.factor )
+
+    write_csv( args.output, data, variance )
+    print( "%s: %d channels, %.0f counts"%( os.path.basename( args.output ), data.shape[1], np.sum( data[1] ) ) )
+
+    sys.exit(0)
@@ -0,0 +1,332 @@
+# Filename: autocal.py
+# Purpose: Energy calibration found from the spectrum of a known source, instead
+#          of the channel/energy pairs typed into the MCA software. Peaks are
+#          matched to the line list of the source by trying every pairing of
+#          two peaks with two lines, and the best match is refined with a linear
+#          or quadratic fit. One calibration spectrum per session folder is
+#          fitted once and then used for every trial in that folder.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import argparse
+import threading
+
+import numpy as np
+
+import linelib
+import readers
+import peaks
+import profiling
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+class Calibration:
+    """Polynomial channel to energy calibration with the points it was fitted to
+
+    Attributes:
+        coeffs (array): polynomial coefficients, highest power first (np.polyval)
+        channels (array): fitted peak centroids (channels)
+        energies (array): reference energy matched to each centroid (keV)
+        residuals (array): energies minus calibrated centroids (keV)
+        source (string): description of the reference lines
+        filepath (string): calibration spectrum, if read from a file
+    """
+
+    def __init__( self, coeffs, channels, energies, source="", filepath=None ):
+
+        self.coeffs = np.asarray( coeffs, dtype=float )
+        self.channels = np.asarray( channels, dtype=float )
+        self.energies = np.asarray( energies, dtype=float )
+        self.residuals = self.energies - np.polyval( self.coeffs, self.channels )
+        self.source = source
+        self.filepath = filepath
+
+    @property
+    def degree( self ):
+        return len( self.coeffs )-1
+
+    def __call__( self, channels ):
+        """Energy of channels"""
+        return np.polyval( self.coeffs, channels )
+
+    @profiling.timed( "calibrate" )
+    def apply( self, data ):
+        """Returns copy of data with the x axis (channels) calibrated"""
+
+        scaled = np.array( data, dtype=float )
+        scaled[0] = self( scaled[0] )
+
+        return scaled
+
+    def cal_pts( self ):
+        """Matched points in the (channels, energies) layout of readers.IEC_to_array()"""
+        return np.array( [ self.channels, self.energies ] )
+
+    def __repr__( self ):
+        terms = " + ".join( "%.6g*x^%d"%( c, p ) for ( p, c ) in zip( range( self.degree, -1, -1 ), self.coeffs ) )
+        rms = np.sqrt( np.mean( self.residuals**2 ) ) if len(self.residuals)>0 else 0.
+        return "Calibration(E = %s, %d points, rms residual %.3g keV)"%( terms, len(self.channels), rms )
+
+###############################################################################
+
+def reference_lines( source, min_intensity=1., merge=1., library=None ):
+    """Line list of a calibration source
+
+    Parameters:
+        source (string, list): nuclide name (e.g. "Cs-137"), list of nuclide names,
+            or list of line energies (keV)
+        min_intensity (float, optional): skip weaker lines (percent per decay)
+        merge (float, optional): lines closer than this (keV) are combined into
+            their intensity weighted mean, as they can not be told apart
+        library (string, optional): line table in SpecTools/data. Defaults to
+            gamma_lines.csv
+
+    Returns:
+        energies (array): line energies, sorted (keV)
+        intensities (array): intensity of each line (equal if energies were given)
+    """
+
+    if isinstance( source, str ):
+        source = [source]
+
+    if all( isinstance( s, str ) for s in source ):
+        lib = linelib.load_library( library if library is not None else "gamma_lines.csv" )
+        lines = lib[ np.isin( lib["Nuclide"], source ) & ( lib["Intensity"]>=min_intensity ) ]
+        energies = np.array( lines["Energy"], dtype=float )
+        intensities = np.array( lines["Intensity"], dtype=float )
+
+    else:
+        energies = np.sort( np.asarray( source, dtype=float ) )
+        intensities = np.full( len(energies), 100. )
+
+    if len(energies)==0:
+        return energies, intensities
+
+    #group lines with neighbours closer than merge
+    group = np.r_[ 0, np.cumsum( np.diff( energies )>merge ) ]
+    total = np.bincount( group, weights=intensities )
+    energies = np.bincount( group, weights=energies*intensities )/total
+
+    return energies, total
+
+###############################################################################
+
+def match_lines( channels, sigma, energies, intensities, num_channels=None, max_offset=None ):
+    """Finds the linear map from channel to energy that puts the most peaks on
+    reference lines, trying every pairing of two peaks with two lines
+
+    Parameters:
+        channels (array): peak channels
+        sigma (array): width of each peak (channels), a line matches a peak if it
+            falls within one width of it
+        energies, intensities (array): output of reference_lines()
+        num_channels (int, optional): channels in the spectrum, used to find strong
+            lines that should have been seen. Defaults to the highest peak channel
+        max_offset (float, optional): largest energy of channel 0 (keV). Defaults
+            to a tenth of the highest line energy
+
+    Returns:
+        gain, offset (float): energy = gain*channel + offset, or None, None
+        pairs (2D array): matched (peak index, energy) of each peak, energy is the
+            intensity weighted mean of every line on the peak
+    """
+
+    channels = np.asarray( channels, dtype=float )
+    sigma = np.asarray( sigma, dtype=float )
+
+    if num_channels is None:
+        num_channels = np.max( channels )+1
+    if max_offset is None:
+        max_offset = 0.1*np.max( energies )
+
+    #every (peak i < peak j) with every (line a < line b)
+    i, j = np.triu_indices( len(channels), 1 )
+    a, b = np.triu_indices( len(energies), 1 )
+
+    if len(i)==0 or len(a)==0:
+        return None, None, np.empty( (2,0) )
+
+    lo = np.minimum( channels[i], channels[j] )
+    hi = np.maximum( channels[i], channels[j] )
+    keep = hi>lo
+    lo = lo[keep]
+    hi = hi[keep]
+
+    gain = ( ( energies[b]-energies[a] )[None,:]/( hi-lo )[:,None] ).ravel()
+    offset = ( energies[a][None,:] - gain.reshape( len(lo), len(a) )*lo[:,None] ).ravel()
+
+    valid = np.abs( offset )<=max_offset
+    gain = gain[valid]
+    offset = offset[valid]
+
+    if len(gain)==0:
+        return None, None, np.empty( (2,0) )
+
+    #channel of every line under every hypothesis, against every peak: (hypotheses, lines, peaks)
+    line_channel = ( energies[None,:]-offset[:,None] )/gain[:,None]
+    near = np.abs( line_channel[:,:,None]-channels[None,None,:] )<=sigma[None,None,:]
+
+    peak_matched = np.any( near, axis=1 )
+    line_matched = np.any( near, axis=2 )
+
+    #strong lines inside the spectrum that no peak accounts for
+    strong = intensities>=0.1*np.max( intensities )
+    inside = ( line_channel>=0 ) & ( line_channel<num_channels )
+    missing = np.sum( inside & strong[None,:] & ~line_matched, axis=1 )
+
+    fraction = ( line_matched*intensities[None,:] ).sum( axis=1 )/np.sum( intensities )
+    score = np.sum( peak_matched, axis=1 ) - missing + 0.5*fraction
+
+    best = np.argmax( score )
+    weights = near[best]*intensities[:,None]                #(lines, peaks)
+    matched = np.nonzero( peak_matched[best] )[0]
+    blended = ( energies @ weights[:,matched] )/np.sum( weights[:,matched], axis=0 )
+
+    return gain[best], offset[best], np.array( [ matched, blended ] )
+
+###############################################################################
+
+def auto_calibrate( data, source, degree=1, max_peaks=8, min_channel=0, merge=1., min_intensity=1.,
+                    max_offset=None, **kwargs ):
+    """Calibrates a spectrum of a known source from its peaks
+
+    Parameters:
+        data (2D array): first row is channels and second row is counts
+        source: nuclide name(s) or line energies, see reference_lines()
+        degree (int, optional): 1 for linear, 2 for quadratic calibration. Falls
+            back to linear if there are too few matched peaks
+        max_peaks (int, optional): number of most significant peaks to match
+        min_channel (int, optional): ignore peaks below this channel (noise edge)
+        merge, min_intensity (float, optional): see reference_lines()
+        max_offset (float, optional): see match_lines()
+        **kwargs: passed on to peaks.find_peaks()
+
+    Returns:
+        cal (Calibration): fitted calibration, or None if no match was found
+    """
+
+    energies, intensities = reference_lines( source, min_intensity, merge )
+
+    found = peaks.find_peaks( data[1], min_channel=min_channel, **kwargs )[:max_peaks]
+
+    if len(found)==0 or len(energies)==0:
+        print("Value Error: no peaks or reference lines to calibrate with")
+        return None
+
+    if len(energies)==1 or len(found)==1:
+        #one point, line through the origin
+        best = found[0]
+        return Calibration( [ energies[ np.argmax( intensities ) ]/best["channel"], 0. ],
+                            [ best["channel"] ], [ energies[ np.argmax( intensities ) ] ], str(source) )
+
+    gain, offset, pairs = match_lines( found["channel"], found["sigma"], energies, intensities,
+                                       len(data[1]), max_offset )
+
+    if gain is None or pairs.shape[1]<2:
+        print("Value Error: peaks do not match the lines of "+str(source))
+        return None
+
+    matched = found[ pairs[0].astype(int) ]
+
+    #centroids from Gaussian fits, falling back to the peak channel
+    channel_data = np.array( [ np.arange( len(data[1]) ), data[1] ], dtype=float )
+    centroids = np.array( matched["channel"], dtype=float )
+
+    for k in range( len(matched) ):
+        for ( params, errors, peak ) in peaks.fit_peaks( channel_data, matched[k:k+1] ):
+            if abs( params[1]-peak["channel"] )<=peak["sigma"]:
+                centroids[k] = params[1]
+
+    degree = min( degree, len(centroids)-1 )
+    coeffs = np.polyfit( centroids, pairs[1], degree )
+
+    return Calibration( coeffs, centroids, pairs[1], str(source) )
+
+###############################################################################
+
+_session_cache = {}
+_session_lock = threading.Lock()
+
+def session_calibration( filepath, source, pattern="calibration*.IEC", degree=1, **kwargs ):
+    """Calibration from the calibration spectrum in the same folder as a trial.
+    Each calibration spectrum is only fitted once per process (until it changes).
+
+    Parameters:
+        filepath (string): filepath of a trial, or the session folder itself
+        source: nuclide name(s) or line energies, see reference_lines()
+        pattern (string, optional): glob pattern of the calibration spectrum
+        degree (int, optional): 1 for linear, 2 for quadratic
+        **kwargs: passed on to auto_calibrate()
+
+    Returns:
+        cal (Calibration): calibration of the folder, or None if there is no
+            calibration spectrum or it could not be matched
+    """
+
+    folder = filepath if os.path.isdir( filepath ) else os.path.dirname( os.path.abspath( filepath ) )
+    found = sorted( glob.glob( os.path.join( folder, pattern ) ) )
+
+    if len(found)==0:
+        return None
+
+    calpath = os.path.abspath( found[0] )
+    stat = os.stat( calpath )
+    key = ( calpath, stat.st_mtime_ns, stat.st_size, repr(source), degree, repr( sorted( kwargs.items() ) ) )
+
+    with _session_lock:
+        if key in _session_cache:
+            return _session_cache[key]
+
+    data, cal_pts = readers.cached_read_spectrum( calpath )
+    cal = None if data is None else auto_calibrate( data, source, degree, **kwargs )
+
+    if cal is not None:
+        cal.filepath = calpath
+
+    with _session_lock:
+        _session_cache[key] = cal
+
+    return cal
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Energy calibration from a spectrum of a known source" )
+    parser.add_argument( "path", help="calibration spectrum (.IEC)" )
+    parser.add_argument( "source", nargs="+", help="nuclide names (e.g. Cs-137) or line energies (keV)" )
+    parser.add_argument( "--degree", type=int, default=1, help="1 for linear, 2 for quadratic" )
+    parser.add_argument( "--min-channel", type=int, default=0, help="ignore peaks below this channel" )
+    args = parser.parse_args()
+
+    try:
+        source = [ float(s) for s in args.source ]
+    except ValueError:
+        source = args.source
+
+    data, cal_pts = readers.IEC_to_array( args.path )
+    if data is None:
+        sys.exit(1)
+
+    cal = auto_calibrate( data, source, args.degree, min_channel=args.min_channel )
+    if cal is None:
+        sys.exit(1)
+
+    print( cal )
+    for ( channel, energy, residual ) in zip( cal.channels, cal.energies, cal.residuals ):
+        print( "channel %8.2f -> %8.2f keV (residual %+.2f keV)"%( channel, energy, residual ) )
+
+    if np.size( cal_pts )>0:
+        print( "stored calibration points:", ", ".join( "%g -> %g keV"%( c, e ) for ( c, e ) in cal_pts.T ) )
+
+    sys.exit(0)
@@ -0,0 +1,114 @@
+# Filename: background.py
+# Purpose: Continuum background of gamma and XRF spectra by iterative clipping
+#          (SNIP), so that net peak areas can be found without acquiring a
+#          separate noise spectrum as lab_2 does. Works on one spectrum or a
+#          stack of spectra at once.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import numpy as np
+
+import profiling
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def lls( counts ):
+    """Log-log-sqrt transform, compresses peaks so the clipping follows the continuum"""
+
+    return np.log( np.log( np.sqrt( counts+1 )+1 )+1 )
+
+def inverse_lls( values ):
+    """Inverse of lls()"""
+
+    return ( np.exp( np.exp( values )-1 )-1 )**2 - 1
+
+###############################################################################
+
+@profiling.timed( "background" )
+def snip( counts, window=24, transform=True, decreasing=True ):
+    """Estimates the continuum background with the SNIP algorithm. At every step
+    each channel is replaced by the mean of the channels a distance p away on
+    either side, if that is lower, for p up to the window.
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        window (int, optional): largest clipping distance in channels, should be
+            about the full width of the widest peak. Defaults to 24
+        transform (bool, optional): if true, clips in log-log-sqrt space. Defaults to true
+        decreasing (bool, optional): if true, goes from the widest window down to
+            the narrowest, which gives a smoother background. Defaults to true
+
+    Returns:
+        background (array): background estimate, same shape as counts
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    values = np.atleast_2d( np.maximum( counts, 0 ) )
+
+    values = lls( values ) if transform else values.copy()
+
+    n = values.shape[1]
+    window = min( int(window), (n-1)//2 )
+    steps = range( window, 0, -1 ) if decreasing else range( 1, window+1 )
+
+    clipped = np.empty_like( values )
+
+    for p in steps:
+        mean = clipped[:,:n-2*p]
+        np.add( values[:,:n-2*p], values[:,2*p:], out=mean )
+        mean *= 0.5
+        np.minimum( values[:,p:n-p], mean, out=values[:,p:n-p] )
+
+    if transform:
+        values = np.maximum( inverse_lls( values ), 0 )
+
+    return values.reshape( counts.shape )
+
+###############################################################################
+
+def subtract_background( data, window=24, **kwargs ):
+    """Returns copy of data with the SNIP background removed
+
+    Parameters:
+        data (2D array): first row is x-axis and second row is counts
+        window (int, optional): largest clipping distance in channels
+        **kwargs: passed on to snip()
+
+    Returns:
+        net (2D array): data with background subtracted (negative values set to 0)
+    """
+
+    net = np.array( data, dtype=float )
+    net[1] = np.maximum( net[1] - snip( net[1], window, **kwargs ), 0 )
+
+    return net
+
+###############################################################################
+
+def net_area( data, lowerbound, upperbound, background=None, window=24 ):
+    """Net counts of a peak between two bounds on the x axis
+
+    Parameters:
+        data (2D array): first row is x-axis and second row is counts
+        lowerbound, upperbound (float): bounds of the peak on the x axis
+        background (array, optional): background counts, found with snip() if not given
+        window (int, optional): largest clipping distance used if background is not given
+
+    Returns:
+        net (float): counts above background
+        error (float): statistical error on net, from the gross counts
+    """
+
+    if background is None:
+        background = snip( data[1], window )
+
+    inside = ( data[0]>=lowerbound ) & ( data[0]<=upperbound )
+    gross = np.sum( data[1,inside] )
+    net = gross - np.sum( background[inside] )
+
+    return net, np.sqrt( gross + np.sum( background[inside] ) )
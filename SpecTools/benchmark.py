@@ -0,0 +1,426 @@
+# Filename: benchmark.py
+# Purpose: Times the slow stages of the lab scripts (file parsing, calibration,
+#          lab_2.convert() with a noise floor, the per-count loops of lab_1.convert()
+#          and get_skew_fit(), and fit_to_curve(), both the SpecTools versions and
+#          the own copies of lab_3 and lab_4) on synthetic spectra of 512 to
+#          64k channels at low and high count totals, and on files from the
+#          archive as a realistic baseline. Writes a JSON report tagged with the
+#          git commit so that runs on different commits can be compared.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import importlib.util
+
+import numpy as np
+
+import readers
+import calibration
+import models
+from pipeline import Pipeline
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+REPO = os.path.join( os.path.dirname( os.path.abspath(__file__) ), ".." )
+
+SIZES = [ 512, 4096, 16384, 65536 ]
+LEVELS = { "low":1e4, "high":1e6 }
+
+#real files, with the noise floor used for lab_2.convert() where there is one
+ARCHIVE = { "xrf":( "XRF-Moseley/iec files/can.IEC", "XRF-Moseley/iec files/table lab 2.IEC" ),
+            "compton":( "ComptonScatter/DATA/Trial 1.IEC", None ),
+            "sol2021":( "SoL 2021/csv files/Trial 2.csv", None ),
+            "sol2022":( "SoL 2022/DATA/IEC/100.IEC", None ) }
+
+###############################################################################
+
+def load_script( name, path ):
+    """Imports a lab script by path (they are not packages). Scripts must keep
+    their interactive parts under if __name__=="__main__"."""
+
+    spec = importlib.util.spec_from_file_location( name, os.path.join( REPO, path ) )
+    module = importlib.util.module_from_spec( spec )
+    spec.loader.exec_module( module )
+
+    return module
+
+###############################################################################
+
+def synthetic_spectrum( num_channels, total_counts, seed=0 ):
+    """Poisson counts of a few Gaussian peaks on a falling continuum, with peak
+    widths that scale with the number of channels
+
+    Parameters:
+        num_channels (int): number of channels
+        total_counts (float): expected total counts
+        seed (int, optional): seed of the random numbers
+
+    Returns:
+        counts (array): integer counts of each channel
+        peak (tuple): lower and upper channel around the largest peak
+    """
+
+    rng = np.random.default_rng( seed )
+    x = np.arange( num_channels, dtype=float )
+    width = max( 2., num_channels/400 )
+
+    shape = 0.4*np.exp( -x/( 0.3*num_channels ) )/( 0.3*num_channels )
+    for ( position, area ) in [ (0.18,0.3), (0.45,0.15), (0.52,0.08), (0.8,0.07) ]:
+        shape += area*models.gauss( x, width, position*num_channels, 1. )
+
+    counts = rng.poisson( total_counts*shape/np.sum( shape ) )
+    peak = ( int( 0.18*num_channels-4*width ), int( 0.18*num_channels+4*width ) )
+
+    return counts, peak
+
+###############################################################################
+
+def synthetic_cal_pts( num_channels ):
+    """Six calibration points (2D array, channels then energies) spread over the
+    channels, slightly nonlinear"""
+
+    channels = np.round( np.linspace( 0.1, 0.9, 6 )*num_channels )
+    energies = 0.02*channels*( 1 + 1e-6*channels )*4096/num_channels
+
+    return np.array( [ channels, energies ] )
+
+###############################################################################
+
+def write_IEC( filepath, counts, cal_pts=None, live_time=600., real_time=600.5, title="SYNTH",
+               date="19/10/26 12:00:00" ):
+    """Writes counts as an .IEC file in the layout of the MCA exports in the
+    archive (CRLF rows starting with A004, calibration points in the SPARE block
+    and five counts per data row after USERDEFINED)
+
+    Parameters:
+        filepath (string): filepath of new file
+        counts (array): counts of each channel
+        cal_pts (2D array, optional): up to six calibration points (channels, energies)
+        live_time, real_time (float, optional): acquisition times (seconds)
+        title (string, optional): detector name of row 0
+        date (string, optional): date of row 2 (dd/mm/yy hh:mm:ss)
+    """
+
+    counts = np.asarray( counts )
+    num_channels = len(counts)
+
+    pairs = np.zeros( (6,2) )
+    if cal_pts is not None:
+        pairs[:cal_pts.shape[1]] = np.transpose( [ cal_pts[1], cal_pts[0] ] )
+
+    rows = [ "%-64s"%( "%16s   1   1     0"%title ),
+             "%14.6f%14.6f%6d"%( live_time, real_time, num_channels ),
+             "%-64s"%date ]
+    rows += [ "%14g%14g%14g%14g"%( 0, 1, 0, 0 ) ]*2 + [ " "*64 ]*4 + [ "%-64s"%"SPARE" ]
+    rows += [ "%16g%16g%16g%16g"%( *pairs[i], *pairs[i+1] ) for i in range( 0, 6, 2 ) ]
+    rows += [ "%16g%16g%16g%16g"%( 0, 0, 0, 0 ) ]*30 + [ " "*64 ]*11 + [ "%-64s"%"USERDEFINED" ]
+
+    padded = np.zeros( 5*( ( num_channels+4 )//5 ), dtype=int )
+    padded[:num_channels] = counts
+    rows += [ "%6d"%i + "".join( "%10d"%value for value in padded[i:i+5] ) + "   " for i in range( 0, len(padded), 5 ) ]
+
+    with open( filepath, "w", newline="" ) as fout:
+        fout.write( "".join( "A004"+row+"\r\n" for row in rows ) )
+
+###############################################################################
+
+def write_csv( filepath, counts ):
+    """Writes counts as a (Channel, Counts) .csv file with integer counts, as read
+    by lab_1.convert() and SoL.CSV_to_array()"""
+
+    np.savetxt( filepath, np.transpose( [ np.arange( len(counts) ), counts ] ), fmt="%d", delimiter=",",
+                header="Channel,Counts", comments="" )
+
+###############################################################################
+
+def synthetic_cases( directory, sizes=SIZES, levels=LEVELS ):
+    """Writes synthetic .IEC, noise floor .IEC and .csv files for every size and
+    count level into directory
+
+    Returns:
+        cases (list): one dictionary per case with the file paths and data in memory
+    """
+
+    cases = []
+
+    for num_channels in sizes:
+        cal_pts = synthetic_cal_pts( num_channels )
+        noise, dummy = synthetic_spectrum( num_channels, 0.05*max( levels.values() ), seed=1 )
+
+        noisepath = os.path.join( directory, "noise_%d.IEC"%num_channels )
+        write_IEC( noisepath, noise, cal_pts )
+
+        for ( level, total_counts ) in levels.items():
+            counts, peak = synthetic_spectrum( num_channels, total_counts )
+            name = "synthetic_%d_%s"%( num_channels, level )
+
+            case = { "name":name, "channels":num_channels, "counts":int( np.sum( counts ) ), "peak":peak,
+                     "iec":os.path.join( directory, name+".IEC" ), "csv":os.path.join( directory, name+".csv" ),
+                     "noise":noisepath, "data":np.array( [ np.arange( num_channels ), counts ], dtype=float ),
+                     "cal_pts":cal_pts }
+
+            write_IEC( case["iec"], counts, cal_pts )
+            write_csv( case["csv"], counts )
+            cases.append( case )
+
+    return cases
+
+###############################################################################
+
+def archive_cases( archive=ARCHIVE ):
+    """Cases for the real files of the archive that are present"""
+
+    cases = []
+
+    for ( name, ( path, noise ) ) in archive.items():
+        path = os.path.join( REPO, path )
+        if not os.path.exists( path ):
+            continue
+
+        data, cal_pts = readers.read_spectrum( path )
+        if data is None:
+            continue
+
+        #largest peak above the low channel noise
+        width = max( 10, len(data[0])//100 )
+        top = 20 + int( np.argmax( data[1,20:] ) )
+
+        case = { "name":"archive_"+name, "channels":data.shape[1], "counts":int( np.sum( data[1] ) ),
+                 "peak":( max( top-width, 0 ), top+width ), "data":data }
+
+        #the scaling stages need points (scale_gain indexes the first ones)
+        if cal_pts.shape[1]>0:
+            case["cal_pts"] = cal_pts
+
+        key = "csv" if path.endswith(".csv") else "iec"
+        case[key] = path
+        if noise is not None:
+            case["noise"] = os.path.join( REPO, noise )
+
+        cases.append( case )
+
+    return cases
+
+###############################################################################
+
+def stages():
+    """Stages to time: name, keys the case needs, and a function of the case"""
+
+    lab_1 = load_script( "lab_1", "SoL 2021/lab_1.py" )
+    lab_2 = load_script( "lab_2", "XRF-Moseley/lab_2.py" )
+    lab_3 = load_script( "lab_3", "MuonLife/lab_3.py" )
+    lab_4 = load_script( "lab_4", "ComptonScatter/lab_4.py" )
+    SoL = load_script( "SoL", "SoL 2022/SoL.py" )
+
+    def padded( case ):
+        return 5*( ( case["channels"]+4 )//5 )
+
+    def pipeline( case ):
+        #cold cache on every call, or all but the first would skip reading the file
+        readers.clear_cache()
+        return Pipeline().smooth( 10, 2 ).clip().crop( *case["peak"] ).fit( "gauss" ).run( case["iec"] )
+
+    #lab_3 and lab_4 both scale with calibration.scale_gain. lab_3 fits a decay,
+    #over the whole spectrum (the synthetic continuum falls exponentially)
+    return [ ( "IEC_to_array", ["iec"], lambda case: readers.IEC_to_array( case["iec"] ) ),
+             ( "lab_3.IEC_to_array", ["iec"], lambda case: lab_3.IEC_to_array( case["iec"] ) ),
+             ( "lab_4.IEC_to_array", ["iec"], lambda case: lab_4.IEC_to_array( case["iec"] ) ),
+             ( "scale_data", ["cal_pts"], lambda case: calibration.scale_data( case["data"], case["cal_pts"] ) ),
+             ( "scale_gain", ["cal_pts"], lambda case: calibration.scale_gain( case["data"], case["cal_pts"] ) ),
+             ( "lab_2.convert", ["iec","noise"], lambda case: lab_2.convert( case["iec"], padded( case ), case["noise"] ) ),
+             ( "lab_1.convert", ["csv"], lambda case: lab_1.convert( case["csv"], case["channels"] ) ),
+             ( "get_skew_fit", [], lambda case: SoL.get_skew_fit( case["data"].astype(int), case["channels"] ) ),
+             ( "fit_to_curve", [], lambda case: models.fit_to_curve( case["data"], "gauss", *case["peak"] ) ),
+             ( "lab_3.fit_to_curve", [], lambda case: lab_3.fit_to_curve( case["data"], lab_3.expon_decay ) ),
+             ( "lab_4.fit_to_curve", [], lambda case: lab_4.fit_to_curve( case["data"], *case["peak"] ) ),
+             ( "pipeline", ["iec"], pipeline ) ]
+
+###############################################################################
+
+def measure( func, repeat=5, budget=10. ):
+    """Times repeated calls of func, then measures the peak memory of one call
+
+    Parameters:
+        func (function): function without arguments
+        repeat (int, optional): number of timed calls
+        budget (float, optional): seconds after which no more calls are timed
+            (at least one call is always timed)
+
+    Returns:
+        result (dict): calls, best and median time (seconds), peak_memory (bytes)
+    """
+
+    times = []
+    start = time.perf_counter()
+
+    while len(times)<repeat and ( len(times)==0 or time.perf_counter()-start<budget ):
+        before = time.perf_counter()
+        func()
+        times.append( time.perf_counter()-before )
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return { "calls":len(times), "best":min(times), "median":float( np.median(times) ), "peak_memory":peak }
+
+###############################################################################
+
+def run( cases, repeat=5, budget=10., only=None, verbose=True ):
+    """Runs every stage on every case that has what the stage needs
+
+    Parameters:
+        cases (list): cases from synthetic_cases() and archive_cases()
+        repeat, budget: see measure()
+        only (list, optional): names of stages to run. Defaults to all
+        verbose (bool, optional): prints each result as it is measured
+
+    Returns:
+        results (list): one dictionary per stage and case
+    """
+
+    results = []
+
+    for ( stage, needs, func ) in stages():
+        if only and stage not in only:
+            continue
+
+        for case in cases:
+            if any( key not in case for key in needs ):
+                continue
+
+            result = { "stage":stage, "case":case["name"], "channels":case["channels"], "counts":case["counts"] }
+
+            devnull = open( os.devnull, "w" )
+            stdout, sys.stdout = sys.stdout, devnull      #lab scripts print as they go
+            try:
+                result.update( measure( lambda: func( case ), repeat, budget ) )
+            except Exception as error:
+                result["error"] = repr( error )
+            finally:
+                sys.stdout = stdout
+                devnull.close()
+
+            results.append( result )
+            if verbose:
+                print( format_result( result ) )
+
+    return results
+
+###############################################################################
+
+def git_commit():
+    """Commit hash of the repository and whether the tree has local changes"""
+
+    try:
+        commit = subprocess.run( ["git","rev-parse","HEAD"], cwd=REPO, capture_output=True, text=True ).stdout.strip()
+        status = subprocess.run( ["git","status","--porcelain","--untracked-files=no"], cwd=REPO,
+                                 capture_output=True, text=True ).stdout.strip()
+    except OSError:
+        return "unknown", False
+
+    return commit or "unknown", len(status)>0
+
+###############################################################################
+
+def report( results ):
+    """Results with the commit and environment they were measured on"""
+
+    commit, dirty = git_commit()
+
+    return { "commit":commit, "dirty":dirty, "date":time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+             "python":platform.python_version(), "numpy":np.__version__, "machine":platform.platform(),
+             "cpus":os.cpu_count(), "results":results,
+             "skipped":[ { "format":"CNF", "reason":"no CNF reader in the repository" } ] }
+
+###############################################################################
+
+def compare( old, new, threshold=1.25 ):
+    """Compares the best times of two reports stage by stage
+
+    Parameters:
+        old, new (dict): reports from report()
+        threshold (float, optional): ratio of times above which a stage counts as slower
+
+    Returns:
+        rows (list): (stage, case, old time, new time, ratio) of stages in both reports
+        regressions (list): rows with ratio above threshold
+    """
+
+    before = { ( r["stage"], r["case"] ):r["best"] for r in old["results"] if "best" in r }
+
+    rows = [ ( r["stage"], r["case"], before[ ( r["stage"], r["case"] ) ], r["best"], r["best"]/before[ ( r["stage"], r["case"] ) ] )
+             for r in new["results"] if ( r["stage"], r["case"] ) in before and "best" in r ]
+
+    return rows, [ row for row in rows if row[4]>threshold ]
+
+###############################################################################
+#############################  HELPER FUNCTIONS  ##############################
+###############################################################################
+
+def format_result( result ):
+    """One line of the results table"""
+
+    if "error" in result:
+        return "%-18s %-24s failed: %s"%( result["stage"], result["case"], result["error"] )
+
+    return "%-18s %-24s %8d ch %9d counts %10.2f ms (x%d) %10.2f MB"%( result["stage"], result["case"],
+           result["channels"], result["counts"], 1e3*result["best"], result["calls"], result["peak_memory"]/2**20 )
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Benchmark the analysis stages on synthetic and archive spectra" )
+    parser.add_argument( "-o", "--output", default=None, help="JSON report" )
+    parser.add_argument( "--sizes", type=int, nargs="+", default=SIZES, help="channels of synthetic spectra" )
+    parser.add_argument( "--stages", nargs="+", default=None, help="only run these stages" )
+    parser.add_argument( "--repeat", type=int, default=5, help="timed calls per stage" )
+    parser.add_argument( "--budget", type=float, default=10., help="seconds of timed calls per stage and case" )
+    parser.add_argument( "--no-archive", action="store_true", help="skip the archive files" )
+    parser.add_argument( "--compare", default=None, help="earlier JSON report to compare against" )
+    parser.add_argument( "--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression" )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = synthetic_cases( directory, args.sizes )
+        if not args.no_archive:
+            cases += archive_cases()
+
+        results = run( cases, args.repeat, args.budget, args.stages )
+
+    output = report( results )
+
+    if args.output:
+        with open( args.output, "w" ) as fout:
+            json.dump( output, fout, indent=1 )
+
+    if args.compare:
+        with open( args.compare ) as fin:
+            rows, regressions = compare( json.load( fin ), output, args.threshold )
+
+        print( "\n%-14s %-24s %10s %10s %7s"%( "stage", "case", "old (ms)", "new (ms)", "ratio" ) )
+        for row in rows:
+            print( "%-14s %-24s %10.2f %10.2f %7.2f%s"%( row[0], row[1], 1e3*row[2], 1e3*row[3], row[4],
+                                                        "  slower" if row in regressions else "" ) )
+
+        if len(regressions)>0:
+            sys.exit(1)
+
+    sys.exit(0)
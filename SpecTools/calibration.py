@@ -0,0 +1,134 @@
+# Filename: calibration.py
+# Purpose: Channel to energy (or time) calibration for spectra read with readers.py,
+#          without modifying the input array. scale_data() interpolates through
+#          every calibration point (and the origin). That is not what lab_3 and
+#          lab_4 did: their scale_data() only applied the gain of the first two
+#          points through the origin, which scale_gain() keeps and both labs now
+#          use. The two differ by an offset. For the Compton trials (points at
+#          22 ch/32 keV and 383 ch/662 keV) scale_data() gives energies about
+#          6.4 keV below those of lab_4 and ComptonScatter/RESULTS.csv.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import numpy as np
+from scipy.stats import linregress
+
+import profiling
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+@profiling.timed( "calibrate" )
+def scale_data( data, cal_pts ):
+    """Scales x axis of data based on calibration points. Channels between points
+    are scaled linearly, channels below the first point are scaled towards the
+    origin, and channels above the last point follow the last two points.
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        cal_pts (2D array): first row is channels, second row is the corresponding scaled values
+
+    Returns:
+        scaled (2D array): scaled copy of input array
+    """
+
+    scaled = np.array( data, dtype=float )
+
+    if np.size( cal_pts )==0:
+        return scaled
+
+    scaled[0] = piecewise( data[0], cal_pts )
+
+    return scaled
+
+###############################################################################
+
+def piecewise( x, cal_pts ):
+    """Evaluates the piecewise-linear calibration used by scale_data() at x
+    (an array, or a single channel for which a single value is returned)"""
+
+    scalar = np.ndim( x )==0
+    x = np.atleast_1d( np.asarray( x, dtype=float ) )
+
+    order = np.argsort( cal_pts[0] )
+    chan = np.concatenate( ([0.], np.asarray(cal_pts[0],dtype=float)[order]) )
+    en = np.concatenate( ([0.], np.asarray(cal_pts[1],dtype=float)[order]) )
+
+    y = np.interp( x, chan, en )
+
+    #extend last segment past the final calibration point
+    above = x>chan[-1]
+    slope = (en[-1]-en[-2])/(chan[-1]-chan[-2])
+    y[above] = en[-1] + slope*(x[above]-chan[-1])
+
+    return y[0] if scalar else y
+
+###############################################################################
+
+def gain_calibration( cal_pts ):
+    """Gain through the origin, as lab_3 and lab_4 calibrate: the slope between
+    the first two points, or between the origin and the point if there is only
+    one (or the second is the zero padding of the lab readers)
+
+    Parameters:
+        cal_pts (2D array): first row is channels, second row is energies
+
+    Returns:
+        gain (float): energy = gain*channel
+    """
+
+    cal_pts = np.asarray( cal_pts, dtype=float )
+
+    if cal_pts.shape[1]==1:
+        return cal_pts[1,0]/cal_pts[0,0]
+
+    return ( cal_pts[1,1]-cal_pts[1,0] )/( cal_pts[0,1]-cal_pts[0,0] )
+
+@profiling.timed( "calibrate" )
+def scale_gain( data, cal_pts ):
+    """Returns copy of data with x axis scaled by gain_calibration( cal_pts ),
+    the calibration of lab_3 and lab_4 (see the module header for how it differs
+    from scale_data())"""
+
+    scaled = np.array( data, dtype=float )
+
+    if np.size( cal_pts )==0:
+        return scaled
+
+    scaled[0] *= gain_calibration( cal_pts )
+
+    return scaled
+
+###############################################################################
+
+def linear_calibration( cal_pts ):
+    """Least squares line through calibration points
+
+    Parameters:
+        cal_pts (2D array): first row is channels, second row is energies
+
+    Returns:
+        slope, intercept (float): energy = slope*channel + intercept
+    """
+
+    if np.shape( cal_pts )[1]==1:
+        return cal_pts[1,0]/cal_pts[0,0], 0.
+
+    fit = linregress( cal_pts[0], cal_pts[1] )
+
+    return fit.slope, fit.intercept
+
+###############################################################################
+
+@profiling.timed( "calibrate" )
+def apply_linear( data, slope, intercept=0. ):
+    """Returns copy of data with x axis mapped to slope*x + intercept"""
+
+    scaled = np.array( data, dtype=float )
+    scaled[0] = slope*scaled[0] + intercept
+
+    return scaled
@@ -0,0 +1,304 @@
+# Filename: catalog.py
+# Purpose: Catalog of every spectrum file of the labs (IEC, CNF, csv, xlsx) in
+#          an indexed SQLite table, built from the file headers only. Title,
+#          live and real time, channels, acquisition date and calibration points
+#          of .IEC files come from the rows above USERDEFINED, so the counts are
+#          never parsed. Files are scanned by a pool of threads, and files that
+#          have not changed since the last scan are skipped. Finding runs by date,
+#          detector, duration or calibration is then a query.
+# Date Created: 10/19/26
+#
+# Example, every 600 s COMPTON run of November 2021:
+#
+#   python catalog.py build .. -o catalog.db
+#   python catalog.py query catalog.db --title COMPTON --after 01/11/21 --before 30/11/21 --live-time 590 610
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import readers
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+#file types catalogued, the others are ignored
+KINDS = { ".iec":"IEC", ".cnf":"CNF", ".csv":"csv", ".xlsx":"xlsx" }
+
+#folders never scanned
+SKIP = [ ".git", "__pycache__", "out" ]
+
+COLUMNS = [ ("path","TEXT PRIMARY KEY"), ("lab","TEXT"), ("name","TEXT"), ("kind","TEXT"),
+            ("title","TEXT"), ("live_time","REAL"), ("real_time","REAL"), ("channels","INTEGER"),
+            ("date","TEXT"), ("acquired","TEXT"), ("cal_pts","TEXT"), ("num_cal_pts","INTEGER"),
+            ("size","INTEGER"), ("mtime","REAL") ]
+
+INDEXES = [ "acquired", "title", "live_time", "channels", "lab", "kind", "num_cal_pts" ]
+
+###############################################################################
+
+def find_files( root ):
+    """Every catalogued file below root, in sorted order"""
+
+    paths = []
+
+    for ( folder, subfolders, files ) in os.walk( root ):
+        subfolders[:] = sorted( s for s in subfolders if s not in SKIP )
+        paths += [ os.path.join( folder, f ) for f in sorted( files )
+                   if os.path.splitext( f )[1].lower() in KINDS ]
+
+    return paths
+
+###############################################################################
+
+def iso_date( date ):
+    """"dd/mm/yy hh:mm:ss" (as in IEC files) to "20yy-mm-dd hh:mm:ss", which
+    sorts in time order. Returns None if date is not in that form."""
+
+    try:
+        day, month, year = date[:8].split("/")
+        clock = date[8:].strip() or "00:00:00"
+        return "20%02d-%02d-%02d %s"%( int(year), int(month), int(day), clock )
+    except ValueError:
+        return None
+
+###############################################################################
+
+def scan_IEC( filepath ):
+    """Reads the header rows of an .IEC file, down to USERDEFINED
+
+    Returns:
+        header (dict): see readers.read_header(), plus cal_pts (array), or None
+    """
+
+    lines = []
+
+    try:
+        with open( filepath, "r" ) as fin:
+            for row in fin:
+                row = row.rstrip("\r\n")
+                if "USERDEFINED" in row:
+                    break
+                lines.append( row )
+    except OSError:
+        print("File Path Error: File not found")
+        return None
+
+    try:
+        header = readers.read_header( lines )
+    except (IndexError, ValueError):
+        print("File Type Error: "+filepath+" has no IEC header")
+        return None
+
+    header["cal_pts"] = readers.read_cal_pts( lines )
+
+    return header
+
+###############################################################################
+
+def scan_file( filepath, root ):
+    """Catalog entry of one file (a row of the table as a dictionary). Only .IEC
+    files have a header, csv files get their number of channels from their
+    rows and other types only their name, size and modification time."""
+
+    stat = os.stat( filepath )
+    relative = os.path.relpath( filepath, root )
+
+    entry = { column:None for ( column, kind ) in COLUMNS }
+    entry.update( { "path":os.path.abspath( filepath ), "lab":relative.split( os.sep )[0] if os.sep in relative else "",
+                    "name":os.path.basename( filepath ), "kind":KINDS[ os.path.splitext( filepath )[1].lower() ],
+                    "size":stat.st_size, "mtime":stat.st_mtime, "num_cal_pts":0 } )
+
+    if entry["kind"]=="IEC":
+        header = scan_IEC( filepath )
+        if header is not None:
+            cal_pts = header.pop( "cal_pts" )
+            entry.update( header )
+            entry["acquired"] = iso_date( header["date"] )
+            entry["cal_pts"] = json.dumps( cal_pts.tolist() )
+            entry["num_cal_pts"] = cal_pts.shape[1]
+
+    elif entry["kind"]=="csv":
+        with open( filepath, "r" ) as fin:
+            entry["channels"] = max( sum( 1 for row in fin if row.strip() )-1, 0 )
+
+    return entry
+
+###############################################################################
+
+def connect( filepath ):
+    """Opens (and creates if needed) a catalog database"""
+
+    db = sqlite3.connect( filepath )
+    db.row_factory = sqlite3.Row
+
+    db.execute( "CREATE TABLE IF NOT EXISTS spectra (%s)"%", ".join( "%s %s"%c for c in COLUMNS ) )
+    for column in INDEXES:
+        db.execute( "CREATE INDEX IF NOT EXISTS spectra_%s ON spectra (%s)"%( column, column ) )
+
+    return db
+
+###############################################################################
+
+def build( roots, filepath, workers=None, rescan=False ):
+    """Scans folders into a catalog database. Files whose size and modification
+    time are already in the catalog are not read again, and files that have
+    been deleted are removed from it.
+
+    Parameters:
+        roots (list): folders to scan (the lab is the first folder below the root)
+        filepath (string): catalog database
+        workers (int, optional): number of threads. Defaults to the number of CPUs
+        rescan (bool, optional): read every file again
+
+    Returns:
+        counts (dict): scanned, unchanged and removed number of files
+    """
+
+    db = connect( filepath )
+
+    known = { row["path"]:( row["size"], row["mtime"] ) for row in db.execute( "SELECT path, size, mtime FROM spectra" ) }
+    found = [ ( path, root ) for root in roots for path in find_files( root ) ]
+
+    todo = []
+    for ( path, root ) in found:
+        stat = os.stat( path )
+        if rescan or known.get( os.path.abspath( path ) )!=( stat.st_size, stat.st_mtime ):
+            todo.append( ( path, root ) )
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor( workers ) as pool:
+        entries = list( pool.map( lambda job: scan_file( *job ), todo ) )
+
+    gone = set( known ) - { os.path.abspath( path ) for ( path, root ) in found }
+
+    with db:
+        names = [ column for ( column, kind ) in COLUMNS ]
+        db.executemany( "INSERT OR REPLACE INTO spectra (%s) VALUES (%s)"%( ", ".join( names ), ", ".join( "?"*len(names) ) ),
+                        [ [ entry[n] for n in names ] for entry in entries ] )
+        db.executemany( "DELETE FROM spectra WHERE path=?", [ (path,) for path in gone ] )
+
+    db.close()
+
+    return { "scanned":len(entries), "unchanged":len(found)-len(todo), "removed":len(gone) }
+
+###############################################################################
+
+def query( filepath, after=None, before=None, title=None, lab=None, kind=None, name=None,
+           live_time=None, real_time=None, channels=None, calibrated=None ):
+    """Finds catalogued files
+
+    Parameters:
+        filepath (string): catalog database
+        after, before (string, optional): acquired on or after / on or before these
+            dates, dd/mm/yy (whole days) or dd/mm/yy hh:mm:ss
+        title (string, optional): detector or experiment name of the header, e.g. "COMPTON"
+        lab (string, optional): folder of the lab, e.g. "ComptonScatter"
+        kind (string, optional): "IEC", "CNF", "csv" or "xlsx"
+        name (string, optional): part of the file name, e.g. "bad"
+        live_time, real_time (tuple, optional): (lowest, highest) time in seconds
+        channels (int, optional): number of channels
+        calibrated (bool, optional): with (or without) calibration points
+
+    Returns:
+        entries (list): matching entries as dictionaries, cal_pts as 2D arrays,
+            in order of acquisition
+    """
+
+    where, values = [], []
+
+    if after is not None:
+        where.append( "acquired >= ?" )
+        values.append( iso_date( after ) )
+    if before is not None:
+        where.append( "acquired <= ?" )
+        values.append( iso_date( before if len(before)>8 else before+" 23:59:59" ) )
+
+    for ( column, value ) in [ ("title",title), ("lab",lab), ("kind",kind), ("channels",channels) ]:
+        if value is not None:
+            where.append( column+" = ?" )
+            values.append( value )
+
+    if name is not None:
+        where.append( "name LIKE ?" )
+        values.append( "%"+name+"%" )
+
+    for ( column, bounds ) in [ ("live_time",live_time), ("real_time",real_time) ]:
+        if bounds is not None:
+            where.append( column+" BETWEEN ? AND ?" )
+            values += [ float( bounds[0] ), float( bounds[1] ) ]
+
+    if calibrated is not None:
+        where.append( "num_cal_pts > 0" if calibrated else "num_cal_pts = 0" )
+
+    sql = "SELECT * FROM spectra"
+    if len(where)>0:
+        sql += " WHERE "+" AND ".join( where )
+    sql += " ORDER BY acquired, path"
+
+    db = connect( filepath )
+    entries = [ dict( row ) for row in db.execute( sql, values ) ]
+    db.close()
+
+    for entry in entries:
+        entry["cal_pts"] = np.array( json.loads( entry["cal_pts"] ), dtype=float ).reshape( 2, -1 ) if entry["cal_pts"] else np.zeros( (2,0) )
+
+    return entries
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Catalog of the spectrum files of all labs" )
+    commands = parser.add_subparsers( dest="command", required=True )
+
+    scan = commands.add_parser( "build", help="scan folders into a catalog" )
+    scan.add_argument( "roots", nargs="+", help="folders to scan" )
+    scan.add_argument( "-o", "--output", required=True, help="catalog database (.db)" )
+    scan.add_argument( "-j", "--workers", type=int, default=None, help="number of threads" )
+    scan.add_argument( "--rescan", action="store_true", help="read unchanged files again" )
+
+    find = commands.add_parser( "query", help="find files in a catalog" )
+    find.add_argument( "catalog", help="catalog database (.db)" )
+    find.add_argument( "--after", default=None, help="dd/mm/yy" )
+    find.add_argument( "--before", default=None, help="dd/mm/yy" )
+    find.add_argument( "--title", default=None, help="detector or experiment, e.g. COMPTON" )
+    find.add_argument( "--lab", default=None )
+    find.add_argument( "--kind", default=None, choices=sorted( KINDS.values() ) )
+    find.add_argument( "--name", default=None, help="part of the file name" )
+    find.add_argument( "--live-time", type=float, nargs=2, default=None, metavar=("LOWEST","HIGHEST") )
+    find.add_argument( "--real-time", type=float, nargs=2, default=None, metavar=("LOWEST","HIGHEST") )
+    find.add_argument( "--channels", type=int, default=None )
+    find.add_argument( "--calibrated", action="store_true", help="only files with calibration points" )
+    find.add_argument( "--uncalibrated", action="store_true", help="only files without calibration points" )
+    args = parser.parse_args()
+
+    if args.command=="build":
+        counts = build( args.roots, args.output, args.workers, args.rescan )
+        print( "%(scanned)d files scanned, %(unchanged)d unchanged, %(removed)d removed"%counts )
+        sys.exit(0)
+
+    calibrated = True if args.calibrated else ( False if args.uncalibrated else None )
+    entries = query( args.catalog, args.after, args.before, args.title, args.lab, args.kind, args.name,
+                     args.live_time, args.real_time, args.channels, calibrated )
+
+    for entry in entries:
+        print( "%-19s %-8s %10s %7s  %s"%( entry["acquired"] or "", entry["title"] or entry["kind"],
+                                          "" if entry["live_time"] is None else "%.1f s"%entry["live_time"],
+                                          entry["channels"] or "", os.path.relpath( entry["path"] ) ) )
+
+    print( "%d files"%len(entries) )
+
+    sys.exit(0)
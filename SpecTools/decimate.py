@@ -0,0 +1,252 @@
+# Filename: decimate.py
+# Purpose: Plots spectra and dense fit curves with only as many points as the
+#          axes have pixels. Each spectrum is reduced to the min and max of every
+#          pixel column (or by largest-triangle-three-buckets), many spectra are
+#          drawn as one LineCollection, and the visible range is reduced again at
+#          full resolution whenever the axes are zoomed or panned.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+import matplotlib as mpl
+from matplotlib.collections import LineCollection
+
+import readers
+import calibration
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def minmax( x, y, bins ):
+    """Keeps the lowest and highest point of each of bins runs of neighbouring
+    points, in order, so that peaks and dips survive at any zoom
+
+    Parameters:
+        x, y (array): points in order of x
+        bins (int): number of runs (about the width of the plot in pixels)
+
+    Returns:
+        x, y (array): at most 2*bins points
+    """
+
+    x = np.asarray( x, dtype=float )
+    y = np.asarray( y, dtype=float )
+    n = len(y)
+
+    if n<=2*bins:
+        return x, y
+
+    per_bin = int( np.ceil( n/bins ) )
+    bins = int( np.ceil( n/per_bin ) )
+
+    low = np.full( bins*per_bin, np.inf )
+    high = np.full( bins*per_bin, -np.inf )
+    low[:n] = y
+    high[:n] = y
+
+    offset = per_bin*np.arange( bins )
+    lowest = offset + np.argmin( low.reshape( bins, per_bin ), axis=1 )
+    highest = offset + np.argmax( high.reshape( bins, per_bin ), axis=1 )
+
+    #whichever of the two comes first in x is drawn first
+    index = np.sort( np.stack( [ lowest, highest ], axis=1 ), axis=1 ).ravel()
+
+    return x[index], y[index]
+
+###############################################################################
+
+def lttb( x, y, num_points ):
+    """Largest-triangle-three-buckets downsampling: keeps the first and last
+    point, and from each bucket in between the point making the largest
+    triangle with the point kept before it and the mean of the next bucket.
+    Smoother than minmax() for curves, at the cost of a loop over buckets.
+
+    Parameters:
+        x, y (array): points in order of x
+        num_points (int): number of points to keep (at least 3)
+
+    Returns:
+        x, y (array): num_points points
+    """
+
+    x = np.asarray( x, dtype=float )
+    y = np.asarray( y, dtype=float )
+    n = len(y)
+
+    if n<=num_points or num_points<3:
+        return x, y
+
+    edges = np.linspace( 1, n-1, num_points-1 ).astype(int)
+    edges[-1] = n-1
+
+    #mean of every bucket, the last one standing for the final point
+    counts = np.diff( edges )
+    mean_x = np.r_[ np.add.reduceat( x[:n-1], edges[:-1] )/counts, x[-1] ]
+    mean_y = np.r_[ np.add.reduceat( y[:n-1], edges[:-1] )/counts, y[-1] ]
+
+    index = np.zeros( num_points, dtype=int )
+    index[-1] = n-1
+    kept = 0
+
+    for b in range( num_points-2 ):
+        start, stop = edges[b], edges[b+1]
+        area = np.abs( ( x[kept]-mean_x[b+1] )*( y[start:stop]-y[kept] )
+                       - ( x[kept]-x[start:stop] )*( mean_y[b+1]-y[kept] ) )
+        kept = start + int( np.argmax( area ) )
+        index[b+1] = kept
+
+    return x[index], y[index]
+
+###############################################################################
+
+METHODS = { "minmax":lambda x, y, width: minmax( x, y, width ),
+            "lttb":lambda x, y, width: lttb( x, y, 2*width ) }
+
+###############################################################################
+
+class DecimatedLines:
+    """Spectra drawn as one LineCollection, decimated to the pixel width of the
+    axes and redone for the visible range whenever the x limits change
+
+    Parameters:
+        ax (Axes): axes to draw on
+        spectra (list): (x, y) pairs, or a 2D array per spectrum, x increasing
+        method (string, optional): "minmax" (default) or "lttb"
+        colors (list, optional): color of each spectrum. Defaults to the color cycle
+        **kwargs: passed on to LineCollection (e.g. label, linewidths, alpha)
+    """
+
+    def __init__( self, ax, spectra, method="minmax", colors=None, **kwargs ):
+
+        self.ax = ax
+        self.spectra = [ ( np.asarray( s[0], dtype=float ), np.asarray( s[1], dtype=float ) ) for s in spectra ]
+        self.reduce = METHODS[method]
+
+        if colors is None:
+            cycle = mpl.rcParams["axes.prop_cycle"].by_key().get( "color", ["C0"] )
+            colors = [ cycle[i%len(cycle)] for i in range( len(self.spectra) ) ]
+
+        self.collection = LineCollection( [], colors=colors, **kwargs )
+        ax.add_collection( self.collection )
+
+        #limits from all points, not just the decimated ones
+        if len(self.spectra)>0:
+            ax.update_datalim( [ ( min( np.min(x) for (x,y) in self.spectra ), min( np.nanmin(y) for (x,y) in self.spectra ) ),
+                                 ( max( np.max(x) for (x,y) in self.spectra ), max( np.nanmax(y) for (x,y) in self.spectra ) ) ] )
+            ax.autoscale_view()
+
+        self.update()
+        self.callback = ax.callbacks.connect( "xlim_changed", self.update )
+
+    def pixels( self ):
+        """Width of the axes in pixels"""
+
+        return max( int( self.ax.get_window_extent().width ), 16 )
+
+    def update( self, ax=None ):
+        """Decimates the visible part of every spectrum again"""
+
+        lower, upper = self.ax.get_xlim()
+        lower, upper = min( lower, upper ), max( lower, upper )
+        width = self.pixels()
+
+        segments = []
+        for ( x, y ) in self.spectra:
+            #one point either side of the view so lines run off the edge
+            start = max( np.searchsorted( x, lower )-1, 0 )
+            stop = np.searchsorted( x, upper, side="right" )+1
+            xs, ys = self.reduce( x[start:stop], y[start:stop], width )
+            segments.append( np.column_stack( [ xs, ys ] ) )
+
+        self.collection.set_segments( segments )
+
+    def remove( self ):
+        """Removes the lines and stops following the axes"""
+
+        self.ax.callbacks.disconnect( self.callback )
+        self.collection.remove()
+
+###############################################################################
+
+def plot_spectra( ax, spectra, method="minmax", colors=None, **kwargs ):
+    """Draws many spectra as one decimated LineCollection (see DecimatedLines)"""
+
+    return DecimatedLines( ax, spectra, method, colors, **kwargs )
+
+def plot_line( ax, x, y, method="minmax", color=None, **kwargs ):
+    """Decimated replacement for ax.plot(x, y) of one spectrum or curve. Unless
+    a color is given, takes the color of the axes.prop_cycle one past the lines
+    and collections already on the axes. That cycle is not the one ax.plot()
+    advances, so lines added with ax.plot() afterwards should be given a color."""
+
+    if color is None:
+        cycle = mpl.rcParams["axes.prop_cycle"].by_key().get( "color", ["C0"] )
+        color = cycle[ ( len(ax.lines)+len(ax.collections) )%len(cycle) ]
+
+    return DecimatedLines( ax, [ ( x, y ) ], method, [ color ], **kwargs )
+
+###############################################################################
+
+def read_calibrated( paths ):
+    """Reads spectra and calibrates each with the SPARE points stored in it
+
+    Returns:
+        spectra (list): calibrated 2D arrays of the files that could be read
+        names (list): file names of the spectra
+    """
+
+    spectra = []
+    names = []
+
+    for path in paths:
+        data, cal_pts = readers.cached_read_spectrum( path )
+        if data is not None:
+            spectra.append( calibration.scale_data( data, cal_pts ) )
+            names.append( os.path.basename( path ) )
+
+    return spectra, names
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    import matplotlib.pyplot as plt
+
+    parser = argparse.ArgumentParser( description="Overlay many spectra in one interactive plot" )
+    parser.add_argument( "paths", nargs="+", help=".IEC or .csv files, or folders of .IEC files" )
+    parser.add_argument( "--method", default="minmax", choices=sorted( METHODS ) )
+    parser.add_argument( "--log", action="store_true", help="logarithmic counts axis" )
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        paths += sorted( glob.glob( os.path.join( glob.escape( path ), "*.IEC" ) ) ) if os.path.isdir( path ) else [path]
+
+    spectra, names = read_calibrated( paths )
+    if len(spectra)==0:
+        sys.exit(1)
+
+    fig, ax = plt.subplots()
+    colors = plt.cm.viridis( np.linspace( 0, 1, len(spectra) ) )
+    plot_spectra( ax, spectra, args.method, colors, linewidths=0.8 )
+
+    if args.log:
+        ax.set_yscale( "log" )
+
+    ax.set_title( "%d spectra"%len(spectra) )
+    ax.set_xlabel( "Energy (keV)" )
+    ax.set_ylabel( "Counts" )
+    plt.show()
+
+    sys.exit(0)
@@ -0,0 +1,280 @@
+# Filename: export.py
+# Purpose: Saves report figures (spectrum with fit, and fit residuals) for every
+#          file of an archive without opening any windows. Figures are drawn on
+#          the Agg canvas by a pool of processes, one figure per job, so a few
+#          hundred figures keep every core busy. Fits already made by recipes.py
+#          (its results .json files) are reused instead of being redone.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import readers
+import calibration
+import models
+import peaks
+import waterfall
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+#parameter names of the fit models, as in the results files of recipes.py
+PARAMS = { "gauss":["std","mean","norm"], "expon_decay":["A","tau"] }
+
+###############################################################################
+
+def load_fits( paths ):
+    """Reads fits from results .json files of recipes.py
+
+    Parameters:
+        paths (list): results files (or folders of them)
+
+    Returns:
+        fits (dict): absolute input path -> fit dictionary (model, params,
+            errors, lower, upper, calibration) for files fitted with gauss or
+            expon_decay
+    """
+
+    fits = {}
+
+    for path in paths:
+        files = sorted( glob.glob( os.path.join( glob.escape( path ), "*.json" ) ) ) if os.path.isdir( path ) else [path]
+
+        for filepath in files:
+            try:
+                with open( filepath ) as fin:
+                    results = json.load( fin )
+            except (OSError, ValueError):
+                print("File Path Error: could not read "+filepath)
+                continue
+
+            for ( model, names ) in PARAMS.items():
+                if all( name in results for name in names ):
+                    fits[ os.path.abspath( results["input"] ) ] = {
+                        "model":model, "params":[ results[n] for n in names ],
+                        "errors":[ results.get( n+"_error", np.nan ) for n in names ],
+                        "lower":results.get( "lower" ), "upper":results.get( "upper" ),
+                        "calibration":results.get( "calibration", "none" ) }
+
+    return fits
+
+###############################################################################
+
+def fit_spectrum( data, model="gauss", lowerbound=None, upperbound=None, angle=None ):
+    """Fits a spectrum for its figure. Without bounds, the ROI is found as in
+    recipes.py (the Compton photopeak if the scattering angle in degrees is
+    given, else the strongest peak, or the decay region for expon_decay)
+
+    Returns:
+        fit (dict): model, params, errors, lower, upper (None if the fit failed)
+    """
+
+    try:
+        if lowerbound is None or upperbound is None:
+            if model=="expon_decay":
+                lowerbound, upperbound = peaks.decay_roi( data )
+            elif angle is not None:
+                lowerbound, upperbound = peaks.compton_roi( data, angle )
+            else:
+                lowerbound, upperbound = peaks.propose_roi( data, min_channel=20, threshold=10. )
+
+        params, covars, sub = models.fit_to_curve( data, model, lowerbound, upperbound )
+
+    except (RuntimeError, ValueError, TypeError, IndexError):
+        return None
+
+    if params is None:
+        return None
+
+    return { "model":model, "params":list( params ), "errors":list( np.sqrt( np.diag( covars ) ) ),
+             "lower":float( lowerbound ), "upper":float( upperbound ) }
+
+###############################################################################
+
+def render( job ):
+    """Draws and saves the figure of one file (runs in a worker process)
+
+    Parameters:
+        job (dict): path, outputs (list of filepaths), calibrate (bool), model,
+            fit (dict or None, fitted here if None), angle (or None), title, xlabel
+
+    Returns:
+        result (dict): path, outputs, fit, seconds, or error
+    """
+
+    start = time.perf_counter()
+
+    from matplotlib.figure import Figure
+    from decimate import plot_line
+
+    data, cal_pts = readers.cached_read_spectrum( job["path"] )
+    if data is None:
+        return { "path":job["path"], "error":"could not read file" }
+
+    data = calibration.scale_data( data, cal_pts ) if job["calibrate"] else np.array( data, dtype=float )
+
+    fit = job.get( "fit" )
+    if fit is None:
+        fit = fit_spectrum( data, job["model"], angle=job.get( "angle" ) )
+
+    fig = Figure( figsize=(8,6) )
+    top, bottom = fig.subplots( 2, 1, sharex=True, gridspec_kw={ "height_ratios":[3,1] } )
+
+    plot_line( top, data[0], data[1], label="Data", linewidths=0.8 )
+    top.set_title( job["title"] )
+    top.set_ylabel( "Counts" )
+    bottom.set_xlabel( job["xlabel"] )
+    bottom.set_ylabel( "Residual (σ)" )
+    bottom.axhline( 0, color="gray", linewidth=0.8 )
+
+    if fit is not None:
+        func = models.MODELS[ fit["model"] ]
+        lower, upper = models.get_bounds( data, fit["lower"], fit["upper"] )
+        sub = data[:,lower:upper]
+
+        x = np.linspace( sub[0,0], sub[0,-1], 1000 )
+        top.plot( x, func( x, *fit["params"] ), color="C1", label="Fit curve" )
+        top.axvspan( sub[0,0], sub[0,-1], color="gray", alpha=0.15, label="Fit region" )
+
+        #residuals in units of the Poisson error of each channel
+        residuals = ( sub[1]-func( sub[0], *fit["params"] ) )/np.sqrt( np.maximum( sub[1], 1 ) )
+        bottom.plot( sub[0], residuals, ".", markersize=3 )
+
+        names = PARAMS[ fit["model"] ]
+        text = "\n".join( "%s = %.5g ± %.2g"%( n, p, e ) for ( n, p, e ) in zip( names, fit["params"], fit["errors"] ) )
+        top.text( 0.98, 0.7, text, transform=top.transAxes, ha="right", va="top", fontsize=8,
+                  bbox={ "facecolor":"white", "alpha":0.8, "edgecolor":"none" } )
+
+    top.legend( loc="upper right", fontsize=8 )
+
+    for output in job["outputs"]:
+        folder = os.path.dirname( output )
+        if folder:
+            os.makedirs( folder, exist_ok=True )
+        fig.savefig( output, dpi=job.get( "dpi", 120 ) )
+
+    return { "path":job["path"], "outputs":job["outputs"], "fit":fit, "seconds":time.perf_counter()-start }
+
+###############################################################################
+
+def _render_safely( job ):
+    """render() that reports errors instead of stopping the whole batch"""
+
+    try:
+        return render( job )
+    except Exception as err:
+        return { "path":job["path"], "error":repr(err) }
+
+def _init_worker():
+    """Non-interactive backend in every worker, whatever the parent uses"""
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+###############################################################################
+
+def export_figures( paths, folder, formats=("png",), model="gauss", fits=None, calibrate=True,
+                    workers=None, xlabel=None, angles=None ):
+    """Saves the figure of every file with a pool of processes
+
+    Parameters:
+        paths (list): .IEC or .csv files
+        folder (string): output folder, figures are named after the input files
+        formats (list, optional): file types to save, e.g. ["png","pdf","svg"]
+        model (string, optional): "gauss" or "expon_decay", for files without a fit
+        fits (dict, optional): precomputed fits from load_fits(). A fit is only
+            reused if it was made on the same x axis (no calibration, or the
+            calibration points of the file)
+        calibrate (bool, optional): calibrate with the points stored in each file
+        workers (int, optional): number of processes. Defaults to the number of CPUs
+        xlabel (string, optional): x axis label
+        angles (dict, optional): absolute filepath -> scattering angle in degrees,
+            to fit Compton trials at their scattered photopeak
+
+    Returns:
+        results (list): one dictionary per file from render()
+    """
+
+    fits = fits or {}
+    angles = angles or {}
+    jobs = []
+
+    for path in paths:
+        stem = os.path.splitext( os.path.basename( path ) )[0]
+        fit = fits.get( os.path.abspath( path ) )
+
+        #fits of recipes made on another x axis are redone here
+        axis = "piecewise" if calibrate and path.upper().endswith(".IEC") else "none"
+        if fit is not None and ( fit["calibration"]!=axis or fit["lower"] is None ):
+            fit = None
+
+        jobs.append( { "path":path, "outputs":[ os.path.join( folder, stem+"."+ext ) for ext in formats ],
+                       "calibrate":calibrate, "model":model, "fit":fit, "angle":angles.get( os.path.abspath( path ) ),
+                       "title":stem, "xlabel":xlabel or ( "Energy (keV)" if calibrate else "Channels" ) } )
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers==1:
+        _init_worker()
+        return [ _render_safely( job ) for job in jobs ]
+
+    with ProcessPoolExecutor( workers, initializer=_init_worker ) as pool:
+        return list( pool.map( _render_safely, jobs, chunksize=max( 1, len(jobs)//( 8*workers ) ) ) )
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Save spectrum, fit and residual figures of many files" )
+    parser.add_argument( "paths", nargs="+", help=".IEC or .csv files, or folders of them" )
+    parser.add_argument( "-o", "--output", required=True, help="output folder" )
+    parser.add_argument( "--formats", nargs="+", default=["png"], help="png, pdf and/or svg" )
+    parser.add_argument( "--model", default="gauss", choices=sorted( PARAMS ) )
+    parser.add_argument( "--fits", nargs="+", default=[], help="results .json files (or folders) of recipes.py to reuse" )
+    parser.add_argument( "--channels", action="store_true", help="do not calibrate" )
+    parser.add_argument( "--angles", default=None, help="results sheet with the angle of each Compton trial (RESULTS.csv)" )
+    parser.add_argument( "-j", "--workers", type=int, default=None, help="number of processes" )
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir( path ):
+            paths += sorted( glob.glob( os.path.join( glob.escape( path ), "*.IEC" ) ) )
+            paths += sorted( glob.glob( os.path.join( glob.escape( path ), "*.csv" ) ) )
+        else:
+            paths.append( path )
+
+    angles = {}
+    if args.angles:
+        sheet = waterfall.read_results( args.angles ) or {}
+        for path in paths:
+            trial = waterfall.trial_number( path )
+            if trial in sheet:
+                angles[ os.path.abspath( path ) ] = sheet[trial][0]
+
+    start = time.perf_counter()
+    results = export_figures( paths, args.output, args.formats, args.model, load_fits( args.fits ),
+                              not args.channels, args.workers, angles=angles )
+    elapsed = time.perf_counter() - start
+
+    failed = [ r for r in results if "error" in r ]
+    for r in failed:
+        print( os.path.basename( r["path"] )+": ERROR "+r["error"] )
+
+    print( "%d figures in %.1f s (%d failed)"%( len(results)-len(failed), elapsed, len(failed) ) )
+
+    sys.exit( 1 if failed else 0 )
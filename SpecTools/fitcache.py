@@ -0,0 +1,158 @@
+# Filename: fitcache.py
+# Purpose: Memoized fits for the interactive "try fitting again" loops of lab_3
+#          and lab_4. Fits are cached by (spectrum, model, bounds, options) with
+#          a bounded LRU, and fits with new bounds start from the parameters of
+#          the closest cached fit so that they converge in a few iterations.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import models
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def fingerprint( data ):
+    """Short hash identifying the contents of a spectrum array"""
+
+    data = np.ascontiguousarray( data )
+
+    return hashlib.blake2b( data.tobytes(), digest_size=16 ).hexdigest() + str( data.shape )
+
+###############################################################################
+
+class FitCache:
+    """Least recently used cache of fit results
+
+    Parameters:
+        maxsize (int, optional): number of fits kept. Defaults to 128
+    """
+
+    def __init__( self, maxsize=128 ):
+
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.seeded = 0
+        self.misses = 0
+
+    def __len__( self ):
+        return len( self.entries )
+
+    ###########################################################################
+
+    def fit( self, data, model="gauss", lowerbound=None, upperbound=None, **options ):
+        """Same as models.fit_to_curve(), but returns cached results where possible
+
+        Parameters:
+            data (2D array): numpy array where first row is x-axis and second row is y-axis
+            model (string, optional): name of model in models.MODELS. Defaults to "gauss"
+            lowerbound, upperbound (float, optional): bounds on x axis
+            **options: passed on to scipy.optimize.curve_fit
+
+        Returns:
+            params (array): array of parameters for model
+            covars (array): matrix of covariances for params
+            data (array): 2D array of data used in the fit
+        """
+
+        spectrum = fingerprint( data )
+        opts = tuple( sorted( (k, repr(v)) for (k,v) in options.items() ) )
+        key = ( spectrum, model, lowerbound, upperbound, opts )
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end( key )
+                self.hits += 1
+                params, covars = self.entries[key]
+                lower, upper = models.get_bounds( data, lowerbound, upperbound )
+                return params.copy(), covars.copy(), data[:,lower:upper]
+
+            p0 = self.closest( spectrum, model, lowerbound, upperbound, opts )
+
+            if p0 is None:
+                self.misses += 1
+            else:
+                self.seeded += 1
+
+        try:
+            params, covars, sub = models.fit_to_curve( data, model, lowerbound, upperbound, p0=p0, **options )
+        except RuntimeError:
+            if p0 is None:
+                raise
+            #seed led the fit astray, start over from the usual guesses
+            params, covars, sub = models.fit_to_curve( data, model, lowerbound, upperbound, **options )
+
+        if params is None:
+            return None, None, None
+
+        with self.lock:
+            self.entries[key] = ( params.copy(), covars.copy() )
+            self.entries.move_to_end( key )
+
+            while len( self.entries )>self.maxsize:
+                self.entries.popitem( last=False )
+
+        return params, covars, sub
+
+    ###########################################################################
+
+    def closest( self, spectrum, model, lowerbound, upperbound, opts ):
+        """Parameters of the cached fit with the nearest bounds, preferring fits
+        of the same spectrum. Returns None if no cached fit overlaps the bounds.
+        """
+
+        lower = -np.inf if lowerbound is None else lowerbound
+        upper = np.inf if upperbound is None else upperbound
+
+        best = None
+        best_dist = np.inf
+
+        for ( (spec, mod, lo, up, op), (params, covars) ) in self.entries.items():
+
+            if mod!=model or op!=opts:
+                continue
+
+            lo = -np.inf if lo is None else lo
+            up = np.inf if up is None else up
+
+            if lo>=upper or up<=lower:
+                continue
+
+            dist = np.nan_to_num( abs(lo-lower) ) + np.nan_to_num( abs(up-upper) )
+
+            if spec!=spectrum:
+                dist += 1e12
+
+            if dist<best_dist:
+                best = params
+                best_dist = dist
+
+        return None if best is None else list( best )
+
+    ###########################################################################
+
+    def clear( self ):
+        """Empties the cache"""
+
+        with self.lock:
+            self.entries.clear()
+
+###############################################################################
+
+default_cache = FitCache()
+
+def cached_fit_to_curve( data, model="gauss", lowerbound=None, upperbound=None, **options ):
+    """models.fit_to_curve() using a cache shared by the whole process"""
+
+    return default_cache.fit( data, model, lowerbound, upperbound, **options )
@@ -0,0 +1,240 @@
+# Filename: gammalines.py
+# Purpose: Identifies nuclides in calibrated gamma spectra (GammaSpec) from the
+#          fitted energies of their photopeaks, using the packaged table of gamma
+#          lines. Nuclides are ranked across all peaks of a spectrum, and the
+#          peak areas are checked against the tabulated line intensities.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+
+import linelib
+import readers
+import calibration
+import background
+import peaks
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+LIBRARY = "gamma_lines.csv"
+
+def identify( energies, errors=None, areas=None, tolerance=3., emin=None, emax=None, library=LIBRARY,
+              widths=None, efficiency=None, factor=3. ):
+    """Ranks nuclides by how well their gamma lines explain a set of peaks
+
+    Each line explains its nearest peak within the tolerance. A nuclide scores
+    for each peak it explains, by how close the line is, so one that explains
+    many peaks beats one that explains a single peak. The score is scaled by the
+    fraction of its line intensity inside [emin, emax] that was seen, so strong
+    lines that are missing count against it. If areas are given, each matched
+    peak gives an activity estimate area/(intensity*efficiency), and only the
+    fraction of matched intensity whose estimate is within a factor of the
+    nuclide's mean counts towards the score.
+
+    Parameters:
+        energies (array): peak energies (keV)
+        errors (array, optional): uncertainty of each energy (keV)
+        areas (array, optional): net counts of each peak
+        tolerance (float, optional): largest energy difference for a match (keV)
+        emin, emax (float, optional): energy range searched for peaks. Defaults
+            to the range of the energies given
+        library (string, optional): line table in SpecTools/data
+        widths (array, optional): widening of the tolerance for each peak (keV),
+            e.g. a few fitted standard deviations
+        efficiency (function, optional): detection efficiency at an energy (keV).
+            Defaults to a flat efficiency
+        factor (float, optional): largest ratio between the activity estimates of
+            lines of one nuclide before they count as inconsistent
+
+    Returns:
+        ranking (list): one dictionary per candidate nuclide, best first, with
+            nuclide, score, consistency (fraction of matched intensity with a
+            consistent area), lines (list of (table energy, intensity, peak index))
+            and missing (energies of lines at least as intense as a matched one
+            that were not seen)
+        assigned (list): nuclide assigned to each peak ("" if unmatched)
+    """
+
+    energies = np.atleast_1d( np.asarray( energies, dtype=float ) )
+    lib = linelib.load_library( library )
+
+    if len(energies)==0:
+        return [], []
+
+    if emin is None:
+        emin = np.min( energies ) - tolerance
+    if emax is None:
+        emax = np.max( energies ) + tolerance
+
+    if widths is not None:
+        tolerance = tolerance + np.asarray( widths, dtype=float )
+
+    peak, line, distance = linelib.candidates( energies, lib, tolerance, errors )
+
+    #a line explains one peak at most (its nearest), and only lines in range count
+    order = np.lexsort( ( np.abs( distance ), line ) )
+    first = order[ np.r_[ True, line[order][1:]!=line[order][:-1] ] ] if len(line)>0 else order
+    first = first[ ( lib["Energy"][ line[first] ]>=emin ) & ( lib["Energy"][ line[first] ]<=emax ) ]
+    peak, line, distance = peak[first], line[first], distance[first]
+
+    if len(line)==0:
+        return [], [""]*len(energies)
+
+    intensity = lib["Intensity"][line]/100.
+    closeness = np.exp( -0.5*distance**2 )
+
+    nuclides, which = np.unique( lib["Nuclide"][line], return_inverse=True )
+
+    #intensity seen vs. intensity expected in the searched range
+    visible = linelib.in_range( lib, emin, emax )
+    visible = visible[ np.isin( visible["Nuclide"], nuclides ) ]
+    visible_which = np.searchsorted( nuclides, visible["Nuclide"] )
+    expected = np.bincount( visible_which, weights=visible["Intensity"]/100., minlength=len(nuclides) )
+
+    #every peak a nuclide explains counts once, so a nuclide seen in many peaks
+    #beats one that explains a single peak just as closely
+    explained = np.zeros( ( len(nuclides), len(energies) ) )
+    np.maximum.at( explained, ( which, peak ), closeness )
+    score = np.sum( explained, axis=1 )
+
+    seen = np.bincount( which, weights=intensity, minlength=len(nuclides) )
+
+    score *= seen/np.maximum( expected, 1e-12 )
+
+    #activity estimate of every match, compared with the nuclide's weighted mean in log space
+    consistency = np.ones( len(nuclides) )
+
+    if areas is not None:
+        areas = np.asarray( areas, dtype=float )[peak]
+        eff = np.ones( len(line) ) if efficiency is None else np.asarray( efficiency( lib["Energy"][line] ), dtype=float )
+
+        usable = areas>0
+        log_ratio = np.log( np.where( usable, areas, 1. )/( intensity*eff ) )
+
+        w = intensity*usable
+        total = np.bincount( which, weights=w, minlength=len(nuclides) )
+        mean = np.bincount( which, weights=w*log_ratio, minlength=len(nuclides) )/np.maximum( total, 1e-12 )
+
+        agree = usable & ( np.abs( log_ratio-mean[which] )<=np.log( factor ) )
+        consistency = np.bincount( which, weights=intensity*agree, minlength=len(nuclides) )/np.maximum( total, 1e-12 )
+        consistency[ total==0 ] = 1.
+
+        score *= consistency
+
+    #each peak goes to the candidate with the best nuclide score times closeness
+    pair_score = score[which]*closeness
+    order = np.lexsort( ( -pair_score, peak ) )
+    first = order[ np.r_[ True, peak[order][1:]!=peak[order][:-1] ] ]
+
+    assigned = [""]*len(energies)
+    for i in first:
+        if pair_score[i]>0:
+            assigned[ peak[i] ] = str( nuclides[ which[i] ] )
+
+    #weakest matched line of each nuclide, anything stronger should have been seen
+    weakest = np.full( len(nuclides), np.inf )
+    np.minimum.at( weakest, which, lib["Intensity"][line] )
+
+    ranking = []
+
+    for i in np.argsort( -score, kind="stable" ):
+        if score[i]<=0:
+            continue
+
+        matched = [ ( float(lib["Energy"][l]), float(lib["Intensity"][l]), int(p) ) for (p,l) in zip( peak[which==i], line[which==i] ) ]
+        found = { m[0] for m in matched }
+        mine = visible[ visible_which==i ]
+        missing = [ float(e) for (e,I) in zip( mine["Energy"], mine["Intensity"] ) if I>=weakest[i] and float(e) not in found ]
+
+        ranking.append( { "nuclide":str(nuclides[i]), "score":float(score[i]), "consistency":float(consistency[i]),
+                          "lines":matched, "missing":missing } )
+
+    return ranking, assigned
+
+###############################################################################
+
+def identify_spectrum( data, tolerance=3., min_energy=20., window=24, efficiency=None, sigmas=3.,
+                       max_width=5., **kwargs ):
+    """Finds and fits the peaks of a calibrated gamma spectrum and identifies the nuclides
+
+    Parameters:
+        data (2D array): first row is energy (keV) and second row is counts
+        tolerance (float, optional): largest energy difference for a match (keV),
+            added in quadrature to the fitted uncertainty of each peak
+        min_energy (float, optional): ignore peaks below this energy (noise edge)
+        window (int, optional): SNIP window for the continuum under the peaks
+        efficiency (function, optional): detection efficiency, see identify()
+        sigmas (float, optional): fitted standard deviations of each peak added
+            to its tolerance. A linear calibration is off by a few keV at the low
+            end (e.g. 121.78 keV of Eu-152 fits at 116 keV), more than a fixed
+            tolerance allows
+        max_width (float, optional): fits with a larger standard deviation (keV)
+            are not photopeaks (Compton edges, backscatter) and are left out
+        **kwargs: passed on to peaks.find_peaks()
+
+    Returns:
+        ranking, assigned: see identify()
+        lines (2D array): energy, energy error, net area and standard deviation
+            of each fitted peak
+    """
+
+    net = background.subtract_background( data, window )
+
+    found = peaks.find_peaks( data[1], **kwargs )
+    found = found[ data[0][ found["channel"] ]>=min_energy ]
+
+    fits = peaks.fit_peaks( net, found )
+    width = np.gradient( data[0] )
+
+    lines = np.array( [ ( params[1], errors[1], params[2]/width[ peak["channel"] ], abs( params[0] ) )
+                        for ( params, errors, peak ) in fits
+                        if data[0,0]<=params[1]<=data[0,-1] and abs( params[0] )<=max_width ] ).reshape( -1, 4 ).T
+
+    ranking, assigned = identify( lines[0], errors=lines[1], areas=lines[2], efficiency=efficiency, tolerance=tolerance,
+                                  emin=max( min_energy, data[0,0] ), emax=data[0,-1], widths=sigmas*lines[3] )
+
+    return ranking, assigned, lines
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Identify nuclides in gamma spectra" )
+    parser.add_argument( "paths", nargs="+", help=".IEC files or folders of .IEC files" )
+    parser.add_argument( "--tolerance", type=float, default=3., help="match tolerance (keV)" )
+    parser.add_argument( "--top", type=int, default=3, help="number of nuclides to list" )
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        files += sorted( glob.glob( os.path.join( path, "*.IEC" ) ) ) if os.path.isdir( path ) else [path]
+
+    for filepath in files:
+
+        data, cal_pts = readers.IEC_to_array( filepath )
+        if data is None:
+            continue
+
+        slope, intercept = calibration.linear_calibration( cal_pts )
+
+        start = time.perf_counter()
+        ranking, assigned, lines = identify_spectrum( calibration.apply_linear( data, slope, intercept ), args.tolerance )
+        elapsed = time.perf_counter() - start
+
+        guess = ", ".join( "%s (%.2g)"%( r["nuclide"], r["score"] ) for r in ranking[:args.top] )
+        print( "%s: %s [%.1f ms]"%( os.path.basename( filepath ), guess if guess else "no match", 1000*elapsed ) )
+
+    sys.exit(0)
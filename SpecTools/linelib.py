@@ -0,0 +1,90 @@
+# Filename: linelib.py
+# Purpose: Emission line tables (packaged in SpecTools/data) held as arrays
+#          sorted by energy, so that measured peaks can be matched against
+#          them by binary search instead of a scan of the whole table.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import numpy as np
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+DATA_DIR = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "data" )
+
+_libraries = {}
+
+def load_library( filepath ):
+    """Reads a line table (csv with a header row) into a structured array sorted
+    by the Energy column. Tables are only read once per process.
+
+    Parameters:
+        filepath (string): filepath of csv table, or name of a file in SpecTools/data
+
+    Returns:
+        library (structured array): one entry per line, sorted by energy
+    """
+
+    if not os.path.exists( filepath ):
+        filepath = os.path.join( DATA_DIR, filepath )
+
+    filepath = os.path.abspath( filepath )
+
+    if filepath not in _libraries:
+        table = np.genfromtxt( filepath, delimiter=",", names=True, dtype=None, encoding="utf-8" )
+        table = np.atleast_1d( table )
+        _libraries[filepath] = table[ np.argsort( table["Energy"], kind="stable" ) ]
+
+    return _libraries[filepath]
+
+###############################################################################
+
+def candidates( energies, library, tolerance, errors=None ):
+    """Finds every library line within tolerance of each measured energy
+
+    Parameters:
+        energies (array): measured peak energies
+        library (structured array): output of load_library()
+        tolerance (float or array): largest allowed difference in energy
+        errors (array, optional): uncertainty of each energy, added in quadrature
+            to the tolerance
+
+    Returns:
+        peak (array): index into energies of each match
+        line (array): index into library of each match
+        distance (array): energy difference in units of the combined tolerance
+    """
+
+    energies = np.atleast_1d( np.asarray( energies, dtype=float ) )
+    tolerance = np.broadcast_to( np.asarray( tolerance, dtype=float ), energies.shape )
+
+    if errors is not None:
+        tolerance = np.sqrt( tolerance**2 + np.asarray( errors, dtype=float )**2 )
+
+    table = library["Energy"]
+    start = np.searchsorted( table, energies-tolerance, side="left" )
+    stop = np.searchsorted( table, energies+tolerance, side="right" )
+    count = stop-start
+
+    #flatten the ranges [start,stop) of every peak into (peak, line) pairs
+    peak = np.repeat( np.arange( len(energies) ), count )
+    offset = np.arange( np.sum(count) ) - np.repeat( np.cumsum(count)-count, count )
+    line = np.repeat( start, count ) + offset
+
+    distance = ( table[line]-energies[peak] )/tolerance[peak]
+
+    return peak, line, distance
+
+###############################################################################
+
+def in_range( library, emin, emax ):
+    """Slice of the library between two energies"""
+
+    table = library["Energy"]
+
+    return library[ np.searchsorted( table, emin, side="left" ):np.searchsorted( table, emax, side="right" ) ]
@@ -0,0 +1,172 @@
+# Filename: models.py
+# Purpose: Fit functions shared by the lab scripts (Gaussian photopeaks, muon
+#          decay, skew-Gaussian time peaks and straight lines), with the
+#          initial guesses the interactive scripts used.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import numpy as np
+import scipy.optimize as sp_opt
+from scipy.stats import skewnorm
+from scipy.stats import linregress
+
+import profiling
+
+###############################################################################
+###############################  MODEL FUNCTIONS  #############################
+###############################################################################
+
+m = 9.10938356e-31
+c = 299792458
+
+def gauss( x, stnd_dev, mean, norm ):
+    return norm/( stnd_dev * np.sqrt(2*np.pi) ) * np.exp( ((x-mean)**2) / (-2*stnd_dev**2) )
+
+def expon_decay( x, Coeff, Tau ):
+    return Coeff*np.exp(-1*x/Tau)
+
+def line( x, slope, intercept ):
+    return slope*x + intercept
+
+def energy( theta, E_gamma ):
+    return E_gamma/(1+(E_gamma/(m*(c**2)*6.242e15))*(1-np.cos(theta)))
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def get_bounds( data, lowerbound=None, upperbound=None ):
+    """Finds the slice of data inside the given x-axis bounds, using the same
+    convention as fit_to_curve() in lab_3/lab_4
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        lowerbound, upperbound (float, optional): bounds on x axis
+
+    Returns:
+        lower, upper (int): indices so that data[:,lower:upper] is inside the bounds
+    """
+
+    lower = 0
+    upper = len(data[0])-1
+
+    if lowerbound is not None:
+        lower = max( int(np.searchsorted( data[0,:upper], lowerbound, side="right" ))-1, 0 )
+
+    if upperbound is not None:
+        upper = max( min( int(np.searchsorted( data[0], upperbound, side="left" )), upper ), 1 )
+
+    return lower, upper
+
+###############################################################################
+
+def guess_params( model, x, y ):
+    """Initial guesses for curve_fit, as used by the interactive scripts"""
+
+    if model=="gauss":
+        guess_mean = (x[-1]+x[0])/2
+        guess_std = guess_mean - x[0]
+        return [guess_std, guess_mean, max(y)]
+
+    if model=="expon_decay":
+        return [850, 2.2]
+
+    if model=="line":
+        return list( np.polyfit( x[:len(y)], y, 1 ) )
+
+    return None
+
+###############################################################################
+
+MODELS = { "gauss":gauss, "expon_decay":expon_decay, "line":line }
+
+@profiling.timed( "fit" )
+def fit_to_curve( data, model="gauss", lowerbound=None, upperbound=None, p0=None, **kwargs ):
+    """Fits data to one of the shared model functions within given bounds
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        model (string, optional): name of model in MODELS. Defaults to "gauss"
+        lowerbound, upperbound (float, optional): lower and upper bounds on which x axis points to analyze
+        p0 (list, optional): initial parameters. Defaults to guess_params()
+        **kwargs: passed on to scipy.optimize.curve_fit
+
+    Returns:
+        params (array): array of parameters for model
+        covars (array): matrix of covariances for params (see full scipy documentation)
+        data (array): 2D array of data used in the fit
+    """
+
+    if lowerbound is not None and upperbound is not None and lowerbound>=upperbound:
+        print("Value Error: lowerbound must be less than upperbound.")
+        return None, None, None
+
+    lower, upper = get_bounds( data, lowerbound, upperbound )
+    x = data[0,lower:upper]
+    y = data[1,lower:upper]
+
+    if p0 is None:
+        #as in lab_4, the guesses include the edge point just past the slice
+        p0 = guess_params( model, data[0,lower:upper+1], y )
+
+    if profiling.enabled and "full_output" not in kwargs:
+        #same fit, with the number of function evaluations for the profile
+        params, covars, info, message, flag = sp_opt.curve_fit( MODELS[model], x, y, p0=p0, full_output=True, **kwargs )
+        profiling.note( "nfev", info["nfev"] )
+    else:
+        params, covars = sp_opt.curve_fit( MODELS[model], x, y, p0=p0, **kwargs )
+
+    return params, covars, data[:,lower:upper]
+
+###############################################################################
+
+def norm_fit( data ):
+    """Maximum likelihood normal distribution of a histogram. Gives the same
+    result as scipy.stats.norm.fit on the data listed once per count (as in
+    get_skew_fit() of SoL.py) without building that list.
+
+    Parameters:
+        data (2D array): first row is channels and second row is counts
+
+    Returns:
+        mean (float): mean of data
+        std (float): standard deviation of data
+    """
+
+    weights = np.asarray( data[1], dtype=float )
+    total = np.sum( weights )
+
+    mean = np.sum( weights*data[0] )/total
+    std = np.sqrt( np.sum( weights*(data[0]-mean)**2 )/total )
+
+    return mean, std
+
+###############################################################################
+
+def skew_fit( data ):
+    """Skew-Gaussian fit of a histogram, as in get_fit() of lab_1.py
+
+    Parameters:
+        data (2D array): first row is channels and second row is counts
+
+    Returns:
+        skew, mean, std (float): skewnorm parameters
+    """
+
+    dist = np.repeat( data[0], np.asarray( data[1], dtype=int ) )
+
+    return skewnorm.fit( dist )
+
+###############################################################################
+
+def line_fit( x, y ):
+    """Straight line fit as in error_bars.py
+
+    Returns:
+        slope, intercept, r_value, p_value, std_err (float): see scipy.stats.linregress
+    """
+
+    return tuple( linregress( x, y ) )
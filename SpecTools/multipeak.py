@@ -0,0 +1,203 @@
+# Filename: multipeak.py
+# Purpose: Simultaneous fit of many overlapping Gaussian lines on a background,
+#          for XRF spectra where Ka/Kb and lines of neighbouring elements
+#          overlap. All lines share one width-vs-energy relation of the detector
+#          (sigma^2 = w0 + w1*E), and the fit uses an analytic Jacobian so that
+#          dozens of lines can be fitted at once.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import numpy as np
+from scipy.optimize import least_squares
+
+import peaks
+import background
+import profiling
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+LINE_DTYPE = [ ("energy",float), ("energy_error",float), ("area",float), ("area_error",float),
+               ("sigma",float) ]
+
+def unpack( params, num_lines ):
+    """Splits parameter vector into (w0, w1, b0, b1, means, areas)"""
+
+    return params[0], params[1], params[2], params[3], params[4:4+num_lines], params[4+num_lines:]
+
+###############################################################################
+
+def evaluate( params, x, width, center, num_lines, jacobian=False ):
+    """Evaluates the multi-line model (and optionally its Jacobian)
+
+    Parameters:
+        params (array): w0, w1, b0, b1, then line means, then line areas
+        x (array): energies of channels
+        width (array): energy width of each channel
+        center (float): reference energy of the linear background
+        num_lines (int): number of lines
+        jacobian (bool, optional): if true, also returns derivatives
+
+    Returns:
+        model (array): expected counts per channel
+        jac (2D array): derivative of model with respect to each parameter (if jacobian)
+    """
+
+    w0, w1, b0, b1, means, areas = unpack( params, num_lines )
+
+    var = w0 + w1*means                             #(lines,)
+    sigma = np.sqrt( var )
+    diff = x[None,:] - means[:,None]                #(lines, channels)
+    shape = width[None,:]*np.exp( -diff**2/(2*var[:,None]) )/( sigma[:,None]*np.sqrt(2*np.pi) )
+
+    model = b0 + b1*( x-center ) + areas @ shape
+
+    if not jacobian:
+        return model
+
+    jac = np.empty( (len(x), len(params)) )
+
+    #derivative of each line with respect to its variance
+    lines = areas[:,None]*shape
+    d_var = lines*( diff**2/(2*var[:,None]**2) - 1/(2*var[:,None]) )
+
+    jac[:,0] = np.sum( d_var, axis=0 )
+    jac[:,1] = means @ d_var
+    jac[:,2] = 1
+    jac[:,3] = x-center
+    jac[:,4:4+num_lines] = ( lines*diff/var[:,None] + w1*d_var ).T
+    jac[:,4+num_lines:] = shape.T
+
+    return model, jac
+
+###############################################################################
+
+@profiling.timed( "fit" )
+def fit_lines( data, energies=None, emin=None, emax=None, sigma=None, shift=None,
+               subtract_continuum=True, snip_window=24, **kwargs ):
+    """Fits all lines in an energy range of a calibrated spectrum at once
+
+    Parameters:
+        data (2D array): first row is energy and second row is counts
+        energies (array, optional): starting energies of the lines. Found with
+            peaks.find_peaks() if not given
+        emin, emax (float, optional): energy range of the fit. Defaults to whole spectrum
+        sigma (float, optional): starting line width (energy units). Defaults to
+            the width found by the peak search, or 3 channels
+        shift (float, optional): how far each line may move from its starting
+            energy. Defaults to 2 starting widths
+        subtract_continuum (bool, optional): if true, the SNIP continuum is removed
+            first, and the linear background only takes up what is left
+        snip_window (int, optional): clipping window for the continuum (channels)
+        **kwargs: passed on to peaks.find_peaks() when energies are not given
+
+    Returns:
+        lines (structured array): energy, energy_error, area (counts), area_error
+            and sigma of each line, sorted by energy
+        result (dict): width parameters w0, w1, background b0, b1, the model
+            curve and reduced chi squared of the fit
+    """
+
+    x_all = np.asarray( data[0], dtype=float )
+    y_all = np.asarray( data[1], dtype=float )
+
+    if subtract_continuum:
+        y_all = y_all - background.snip( y_all, snip_window )
+
+    inside = np.ones( len(x_all), dtype=bool )
+    if emin is not None:
+        inside &= x_all>=emin
+    if emax is not None:
+        inside &= x_all<=emax
+
+    x = x_all[inside]
+    y = y_all[inside]
+    width = np.gradient( x_all )[inside]
+
+    if energies is None:
+        found = peaks.find_peaks( np.asarray( data[1], dtype=float ), **kwargs )
+        found = found[ inside[ found["channel"] ] ]
+        energies = x_all[ found["channel"] ]
+        if sigma is None and len(found)>0:
+            sigma = np.median( found["sigma"]*np.gradient( x_all )[ found["channel"] ] )
+
+    energies = np.sort( np.asarray( energies, dtype=float ) )
+    num_lines = len(energies)
+
+    if num_lines==0:
+        print("Value Error: no lines to fit")
+        return np.empty( 0, dtype=LINE_DTYPE ), {}
+
+    if sigma is None:
+        sigma = 3*np.median( width )
+    if shift is None:
+        shift = 2*sigma
+
+    #starting areas from the counts at each line
+    index = np.clip( np.searchsorted( x, energies ), 0, len(x)-1 )
+    areas = np.maximum( y[index], 1. )*sigma*np.sqrt(2*np.pi)/width[index]
+
+    center = np.mean( x )
+    p0 = np.concatenate( ( [sigma**2, 0., 0., 0.], energies, areas ) )
+
+    lower = np.concatenate( ( [1e-6*sigma**2, 0., -np.inf, -np.inf], energies-shift, np.zeros(num_lines) ) )
+    upper = np.concatenate( ( [np.inf, np.inf, np.inf, np.inf], energies+shift, np.full(num_lines,np.inf) ) )
+
+    #poisson weights, from the counts before continuum subtraction
+    weights = 1/np.sqrt( np.maximum( np.asarray( data[1], dtype=float )[inside], 1. ) )
+
+    def residuals( params ):
+        return ( evaluate( params, x, width, center, num_lines )-y )*weights
+
+    def jacobian( params ):
+        return evaluate( params, x, width, center, num_lines, jacobian=True )[1]*weights[:,None]
+
+    fit = least_squares( residuals, p0, jac=jacobian, bounds=(lower,upper), x_scale="jac" )
+    profiling.note( "nfev", fit.nfev )
+
+    dof = max( len(x)-len(p0), 1 )
+    chi2 = 2*fit.cost/dof
+
+    try:
+        covars = np.linalg.pinv( fit.jac.T @ fit.jac )*max( chi2, 1. )
+    except np.linalg.LinAlgError:
+        covars = np.full( (len(p0),len(p0)), np.nan )
+
+    errors = np.sqrt( np.abs( np.diag( covars ) ) )
+    w0, w1, b0, b1, means, areas = unpack( fit.x, num_lines )
+
+    lines = np.empty( num_lines, dtype=LINE_DTYPE )
+    lines["energy"] = means
+    lines["energy_error"] = errors[4:4+num_lines]
+    lines["area"] = areas
+    lines["area_error"] = errors[4+num_lines:]
+    lines["sigma"] = np.sqrt( w0 + w1*means )
+
+    result = { "w0":w0, "w1":w1, "b0":b0, "b1":b1, "chi2":chi2, "nfev":fit.nfev,
+               "x":x, "model":evaluate( fit.x, x, width, center, num_lines ) }
+
+    return lines, result
+
+###############################################################################
+
+def write_moseley_csv( filepath, lines, Z ):
+    """Writes fitted line energies in the format read by convert_3() of lab_2
+
+    Parameters:
+        filepath (string): filepath of output csv
+        lines (structured array): output of fit_lines()
+        Z (list): atomic number of each line, lines with Z of 0 are skipped
+    """
+
+    fout = open( filepath, "w" )
+    fout.write("NumProtons,Energy,Error\n")
+
+    for ( line, z ) in zip( lines, Z ):
+        if z>0:
+            fout.write( "%d,%.4f,%.4f\n"%( z, line["energy"], line["energy_error"] ) )
+
+    fout.close()
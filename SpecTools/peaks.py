@@ -0,0 +1,336 @@
+# Filename: peaks.py
+# Purpose: Automatic peak search and fit windows, so that photopeaks (lab_4,
+#          GammaSpec, lab_2) and decay curves (lab_3) can be fitted without
+#          typing in bounds. Works on one spectrum or a stack of spectra at once.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import numpy as np
+from scipy.ndimage import convolve1d, maximum_filter1d
+
+import models
+from smoothing import gaussian_smooth
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+PEAK_DTYPE = [ ("spectrum",int), ("channel",int), ("lower",int), ("upper",int), ("sigma",float),
+               ("significance",float), ("gross",float), ("background",float), ("net",float) ]
+
+def second_derivative_kernel( sigma ):
+    """Negative second derivative of a Gaussian with zero sum, so that a flat or
+    linear background gives no response
+
+    Parameters:
+        sigma (float): width of Gaussian in channels
+
+    Returns:
+        kernel (array): 1D filter kernel
+    """
+
+    half = int( np.ceil( 4*sigma ) )
+    x = np.arange( -half, half+1, dtype=float )
+
+    kernel = (1/sigma**2 - x**2/sigma**4)*np.exp( -x**2/(2*sigma**2) )
+    kernel -= np.mean( kernel )
+
+    return kernel
+
+###############################################################################
+
+def significance( counts, widths=(2,4,8,16) ):
+    """Significance of the smoothed second derivative at several peak widths
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        widths (tuple, optional): peak widths (sigma, in channels) to search for
+
+    Returns:
+        sig (array): best significance at each channel, same shape as counts
+        scale (array): index into widths of the best width at each channel
+    """
+
+    counts = np.atleast_2d( np.asarray( counts, dtype=float ) )
+    variance = np.maximum( counts, 1. )     #poisson, with a floor for empty channels
+
+    sig = np.empty( (len(widths),) + counts.shape )
+
+    for ( i, width ) in enumerate( widths ):
+        kernel = second_derivative_kernel( width )
+        response = convolve1d( counts, kernel, axis=-1, mode="nearest" )
+        noise = np.sqrt( convolve1d( variance, kernel**2, axis=-1, mode="nearest" ) )
+        sig[i] = response/noise
+
+    scale = np.argmax( sig, axis=0 )
+    best = np.take_along_axis( sig, scale[None], axis=0 )[0]
+
+    return best, scale
+
+###############################################################################
+
+def find_peaks( counts, widths=(2,4,8,16), threshold=5., roi_width=3., min_channel=0, smoothing=0. ):
+    """Finds peaks in one spectrum or a stack of spectra and proposes a fit
+    window with a linear background estimate for each one
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        widths (tuple, optional): peak widths (sigma, in channels) to search for
+        threshold (float, optional): minimum significance (in standard deviations)
+        roi_width (float, optional): half width of fit window, in units of sigma
+        min_channel (int, optional): ignore peaks below this channel (e.g. noise edge)
+        smoothing (float, optional): sigma (channels) of Gaussian smoothing before the
+            search, for sparse spectra. Counts in the windows are not smoothed
+
+    Returns:
+        peaks (structured array): one entry per peak with fields spectrum, channel,
+            lower, upper (fit window, channels, upper exclusive), sigma, significance,
+            gross, background and net counts in the window. Sorted by spectrum,
+            then by decreasing significance.
+    """
+
+    counts = np.atleast_2d( np.asarray( counts, dtype=float ) )
+    n = counts.shape[1]
+    widths = np.asarray( widths, dtype=float )
+
+    sig, scale = significance( gaussian_smooth( counts, smoothing ) if smoothing>0 else counts, widths )
+
+    #local maximum over a neighbourhood as wide as the best peak width
+    local = np.empty( (len(widths),) + counts.shape )
+    for ( i, width ) in enumerate( widths ):
+        local[i] = maximum_filter1d( sig, 2*int(width)+1, axis=-1, mode="nearest" )
+    local = np.take_along_axis( local, scale[None], axis=0 )[0]
+
+    is_peak = ( sig>=threshold ) & ( sig==local )
+    is_peak[:,:min_channel] = False
+
+    spectrum, channel = np.nonzero( is_peak )
+    sigma = widths[ scale[spectrum,channel] ]
+
+    half = np.ceil( roi_width*sigma ).astype(int)
+    lower = np.clip( channel-half, 0, n-1 )
+    upper = np.clip( channel+half+1, 1, n )
+
+    #background from windows of one sigma just outside the fit window
+    side = np.maximum( sigma.astype(int), 1 )
+    cumsum = np.zeros( (counts.shape[0], n+1) )
+    cumsum[:,1:] = np.cumsum( counts, axis=1 )
+
+    def window_mean( start, stop ):
+        start = np.clip( start, 0, n )
+        stop = np.clip( stop, 0, n )
+        width = np.maximum( stop-start, 1 )
+        return ( cumsum[spectrum,stop]-cumsum[spectrum,start] )/width
+
+    left = window_mean( lower-side, lower )
+    right = window_mean( upper, upper+side )
+    left = np.where( lower>0, left, right )
+    right = np.where( upper<n, right, left )
+
+    gross = cumsum[spectrum,upper] - cumsum[spectrum,lower]
+    background = 0.5*( left+right )*( upper-lower )
+
+    peaks = np.empty( len(channel), dtype=PEAK_DTYPE )
+    peaks["spectrum"] = spectrum
+    peaks["channel"] = channel
+    peaks["lower"] = lower
+    peaks["upper"] = upper
+    peaks["sigma"] = sigma
+    peaks["significance"] = sig[spectrum,channel]
+    peaks["gross"] = gross
+    peaks["background"] = background
+    peaks["net"] = gross-background
+
+    order = np.lexsort( ( -peaks["significance"], peaks["spectrum"] ) )
+
+    return peaks[order]
+
+###############################################################################
+
+def propose_roi( data, highest=False, expected=None, avoid=(), **kwargs ):
+    """Fit window of the strongest peak of a (calibrated) spectrum
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        highest (bool, optional): if true, takes the peak with positive net counts
+            at the highest channel instead
+        expected (float, optional): x value the peak should be near (e.g. the
+            scattered energy of a Compton trial). The peak with positive net counts
+            nearest to it is taken, leaving out peaks that are nearer to one of avoid
+        avoid (tuple, optional): x values of other known peaks (e.g. the unscattered
+            line), only used with expected
+        **kwargs: passed on to find_peaks()
+
+    Returns:
+        lowerbound, upperbound (float): bounds on x axis, or None, None if no peak was found
+    """
+
+    peaks = find_peaks( data[1], **kwargs )
+
+    if highest or expected is not None:
+        peaks = peaks[ peaks["net"]>0 ]
+
+    if len(peaks)==0:
+        return None, None
+
+    if expected is not None:
+        x = data[0,peaks["channel"]]
+        lines = np.r_[ expected, np.asarray( avoid, dtype=float ) ]
+
+        #peaks belonging to another known line are only used if nothing else is found
+        own = np.argmin( np.abs( x[:,None]-lines[None,:] ), axis=1 )==0
+        if np.any( own ):
+            peaks, x = peaks[own], x[own]
+
+        best = peaks[ np.argmin( np.abs( x-expected ) ) ]
+
+    else:
+        best = peaks[ np.argmax( peaks["channel"] ) ] if highest else peaks[0]
+
+    return data[0,best["lower"]], data[0,best["upper"]-1]
+
+###############################################################################
+
+def compton_roi( data, angle, E_gamma=662., sigmas=2., **kwargs ):
+    """Fit window of the scattered photopeak of a Compton trial (lab_4). The
+    peak is the one nearest models.energy( angle, E_gamma ), not counting peaks
+    nearer to the unscattered line or to the backscatter peak, searched at
+    widths (4,8), which keep the backscatter and scattered peaks apart at back
+    angles. That search window is far narrower than the photopeak, so the peak
+    is fitted in it once and the window returned is the fitted mean ± sigmas
+    fitted standard deviations, cut at halfway to the backscatter peak below
+    and to the unscattered line above.
+
+    Parameters:
+        data (2D array): calibrated spectrum (keV)
+        angle (float): scattering angle (degrees)
+        E_gamma (float, optional): energy of the source line (keV)
+        sigmas (float, optional): half width of the window in fitted standard deviations
+        **kwargs: passed on to find_peaks(), replacing the defaults above and
+            roi_width=1.5, min_channel=20, threshold=10
+
+    Returns:
+        lowerbound, upperbound (float): bounds on x axis, or None, None if no peak was found
+    """
+
+    options = { "widths":(4,8), "roi_width":1.5, "min_channel":20, "threshold":10. }
+    options.update( kwargs )
+
+    expected = models.energy( np.radians( angle ), E_gamma )
+    backscatter = models.energy( np.pi, E_gamma )
+
+    lower, upper = propose_roi( data, expected=expected, avoid=( E_gamma, backscatter ), **options )
+    if lower is None:
+        return None, None
+
+    #second pass over the whole photopeak, as wide as the first fit says it is
+    try:
+        params, covars, sub = models.fit_to_curve( data, "gauss", lower, upper )
+    except (RuntimeError, ValueError, TypeError, IndexError):
+        return lower, upper
+
+    if params is None or not lower<=params[1]<=upper:
+        return lower, upper
+
+    mean, std = params[1], abs( params[0] )
+    wide_lower, wide_upper = mean-sigmas*std, mean+sigmas*std
+
+    if backscatter<mean:
+        wide_lower = max( wide_lower, 0.5*( mean+backscatter ) )
+    if E_gamma>mean:
+        wide_upper = min( wide_upper, 0.5*( mean+E_gamma ) )
+
+    return max( min( wide_lower, lower ), data[0,0] ), min( max( wide_upper, upper ), data[0,-1] )
+
+###############################################################################
+
+def decay_roi( data, smoothing=4, level=3. ):
+    """Fit window for a decay curve (lab_3): from just after the maximum of the
+    smoothed spectrum to where it falls into the flat background at the end
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        smoothing (float, optional): sigma of Gaussian smoothing, in channels
+        level (float, optional): window ends where counts are less than this many
+            standard deviations above the background
+
+    Returns:
+        lowerbound, upperbound (float): bounds on x axis
+    """
+
+    smooth = gaussian_smooth( np.asarray( data[1], dtype=float ), smoothing )
+    occupied = np.nonzero( smooth>0 )[0]
+    last = occupied[-1] if len(occupied)>0 else len(smooth)-1
+
+    start = min( int( np.argmax( smooth ) + 2*smoothing ), last-1 )
+
+    #background from the last tenth of the occupied channels
+    tail = smooth[ last - max( last//10, 1 ):last ]
+    background = np.median( tail )
+    cutoff = background + level*np.sqrt( max( background, 1. ) )
+
+    below = np.nonzero( smooth[start:last]<cutoff )[0]
+    stop = start + below[0] if len(below)>0 else last
+
+    stop = max( stop, start+3 )
+
+    return data[0,start], data[0,min(stop,len(smooth)-1)]
+
+###############################################################################
+
+def fit_peaks( data, peaks=None, max_peaks=None, **kwargs ):
+    """Fits a Gaussian to every peak found in a spectrum, without any prompts
+
+    Parameters:
+        data (2D array): numpy array where first row is x-axis and second row is y-axis
+        peaks (structured array, optional): output of find_peaks(). Found if not given
+        max_peaks (int, optional): only fit this many of the most significant peaks
+        **kwargs: passed on to find_peaks()
+
+    Returns:
+        fits (list): one (params, errors, peak) tuple per successful fit, where
+            params and errors follow models.gauss (std, mean, norm)
+    """
+
+    if peaks is None:
+        peaks = find_peaks( data[1], **kwargs )
+
+    fits = []
+
+    for peak in peaks[:max_peaks]:
+
+        lowerbound = data[0,peak["lower"]]
+        upperbound = data[0,peak["upper"]-1]
+
+        try:
+            params, covars, sub = models.fit_to_curve( data, "gauss", lowerbound, upperbound )
+        except (RuntimeError, ValueError, TypeError):
+            continue
+
+        if params is None:
+            continue
+
+        fits.append( ( params, np.sqrt( np.diag( covars ) ), peak ) )
+
+    return fits
+
+###############################################################################
+
+def fit_batch( stack, **kwargs ):
+    """Peak search over a stack of spectra followed by Gaussian fits of each peak
+
+    Parameters:
+        stack (3D array): spectra stacked along first axis, each as in fit_peaks()
+        **kwargs: passed on to find_peaks()
+
+    Returns:
+        fits (list): one list of fit_peaks() results per spectrum
+    """
+
+    peaks = find_peaks( stack[:,1], **kwargs )
+    starts = np.searchsorted( peaks["spectrum"], np.arange( len(stack)+1 ) )
+
+    return [ fit_peaks( stack[i], peaks[starts[i]:starts[i+1]] ) for i in range( len(stack) ) ]
@@ -0,0 +1,315 @@
+# Filename: pipeline.py
+# Purpose: Lazy processing chain (calibrate, subtract noise or background,
+#          smooth, clip, crop, fit) in place of the separate steps of
+#          lab_2.convert, scale_data and filter_data, each of which makes its own
+#          copy of the whole spectrum. The steps are only recorded until run() is
+#          called on a file. Then only the channels the final crop needs (the
+#          crop plus the reach of every smoothing or background step) are copied,
+#          once, into a single buffer, and every step works on that buffer in
+#          place.
+# Date Created: 10/19/26
+#
+# Example, the chain of lab_2 with a Gaussian fit of one line:
+#
+#   chain = Pipeline().calibrate().subtract( "iec files/table lab 2.IEC" ).smooth( 10, 2 ).clip()
+#   chain = chain.crop( 20, 30 ).fit( "gauss" )
+#   result = chain.run( "iec files/pinkdust.IEC" )       #data, params, errors, ...
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import readers
+import calibration
+import background
+import models
+import smoothing
+import transforms
+from profiling import stage
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+class Pipeline:
+    """Chain of processing steps, recorded by the methods below (each returns
+    the pipeline so calls can be chained) and run on a file or data array by
+    run(). Steps run in the order they were added, crop() and fit() apply to
+    the result of all of them.
+    """
+
+    def __init__( self ):
+
+        self.steps = []
+        self.bounds = ( None, None )
+        self.model = None
+        self._noise = {}
+
+    def __repr__( self ):
+
+        steps = [ "%s(%s)"%( name, ", ".join( "%s=%r"%kv for kv in kwargs.items() ) ) for ( name, kwargs ) in self.steps ]
+
+        return "Pipeline( %s )"%" -> ".join( steps or ["read"] )
+
+    ###########################################################################
+
+    def calibrate( self, cal_pts=None ):
+        """Scales the x axis piecewise-linearly, as calibration.scale_data, with
+        the given points, or the SPARE points of each file if None"""
+
+        self.steps.append( ( "calibrate", { "cal_pts":cal_pts } ) )
+        return self
+
+    def subtract( self, noise, scale=1. ):
+        """Subtracts a noise spectrum, interpolated at the x value of every channel
+        as in lab_2.convert. noise is an .IEC file (calibrated with its own
+        points) or a data array, scale multiplies it (e.g. a live time ratio)"""
+
+        self.steps.append( ( "subtract", { "noise":noise, "scale":scale } ) )
+        return self
+
+    def background( self, window=24 ):
+        """Subtracts the SNIP background (see background.snip)"""
+
+        self.steps.append( ( "background", { "window":int(window) } ) )
+        return self
+
+    def smooth( self, window=10, order=2 ):
+        """Savitzky-Golay smoothing (see smoothing.savgol)"""
+
+        self.steps.append( ( "smooth", { "window":int(window), "order":int(order) } ) )
+        return self
+
+    def gaussian( self, sigma ):
+        """Gaussian smoothing keeping the total counts (see smoothing.gaussian_smooth)"""
+
+        self.steps.append( ( "gaussian", { "sigma":float(sigma) } ) )
+        return self
+
+    def clip( self, lower=0, upper=None ):
+        """Limits counts to lower..upper, by default zeroing negative counts"""
+
+        self.steps.append( ( "clip", { "lower":lower, "upper":upper } ) )
+        return self
+
+    def floor( self, minimum ):
+        """Zeroes channels with fewer than minimum counts"""
+
+        self.steps.append( ( "floor", { "minimum":minimum } ) )
+        return self
+
+    def ceiling( self, maximum ):
+        """Caps counts at maximum"""
+
+        self.steps.append( ( "ceiling", { "maximum":maximum } ) )
+        return self
+
+    def crop( self, lower=None, upper=None ):
+        """Keeps only lower <= x <= upper (on the calibrated axis) of the result.
+        Channels further away than the other steps reach are never processed."""
+
+        self.bounds = ( lower, upper )
+        return self
+
+    def fit( self, model="gauss", lowerbound=None, upperbound=None, p0=None ):
+        """Fits a model of models.MODELS to the result, between the bounds (the
+        whole crop if None)"""
+
+        self.model = { "name":model, "lower":lowerbound, "upper":upperbound, "p0":p0 }
+        return self
+
+    ###########################################################################
+
+    def reach( self, num_channels ):
+        """Number of channels on either side of a channel that the steps read
+        to work it out, for a spectrum of num_channels channels"""
+
+        reach = 0
+
+        for ( name, kwargs ) in self.steps:
+            if name=="smooth":
+                reach += kwargs["window"]//2
+            elif name=="gaussian":
+                reach += len( smoothing.gaussian_kernel( kwargs["sigma"] ) )//2
+            elif name=="background":
+                #each SNIP pass reads p channels away, p = window..1
+                window = min( kwargs["window"], (num_channels-1)//2 )
+                reach += max( window*(window+1)//2, 2*window )
+
+        return reach
+
+    def channels( self, x ):
+        """Channels (start, stop) of x inside the crop"""
+
+        lower, upper = self.bounds
+        start = 0 if lower is None else int( np.searchsorted( x, lower, side="left" ) )
+        stop = len(x) if upper is None else int( np.searchsorted( x, upper, side="right" ) )
+
+        return start, max( stop, start )
+
+    ###########################################################################
+
+    def run( self, source ):
+        """Runs the steps on one spectrum
+
+        Parameters:
+            source (string or 2D array): .IEC or .csv file, or a data array (x in
+                the first row, counts in the second)
+
+        Returns:
+            result (dict): input, data (the cropped result), channels (start and
+                stop of the crop in the original channels), and model, params,
+                errors, lower, upper if fitted, or error if something failed
+        """
+
+        name = source if isinstance( source, str ) else "array"
+
+        if isinstance( source, str ):
+            data, cal_pts = readers.cached_read_spectrum( source )
+            if data is None:
+                return { "input":name, "error":"could not read input" }
+        else:
+            data, cal_pts = np.asarray( source ), np.zeros( (2,0) )
+
+        n = data.shape[1]
+
+        #x of every channel first, it is cheap and places the crop
+        x = np.array( data[0], dtype=float )
+        for ( step, kwargs ) in self.steps:
+            if step=="calibrate":
+                points = cal_pts if kwargs["cal_pts"] is None else np.asarray( kwargs["cal_pts"], dtype=float )
+                if np.size( points )>0:
+                    x = calibration.piecewise( np.array( data[0], dtype=float ), points )
+
+        start, stop = self.channels( x )
+        if stop-start<2:
+            return { "input":name, "error":"crop holds less than two channels" }
+
+        reach = self.reach( n )
+        first, last = max( start-reach, 0 ), min( stop+reach, n )
+
+        #the one copy: channels the crop depends on
+        buffer = np.empty( (2,last-first) )
+        buffer[0] = x[first:last]
+        buffer[1] = data[1,first:last]
+        counts = buffer[1]
+
+        for ( step, kwargs ) in self.steps:
+            with stage( step, name ):
+                if step=="subtract":
+                    noise = self.noise( kwargs["noise"] )
+                    counts -= kwargs["scale"]*np.interp( buffer[0], noise[0], noise[1] )
+                elif step=="background":
+                    counts -= background.snip( counts, min( kwargs["window"], (n-1)//2 ) )
+                elif step=="smooth":
+                    counts[:] = smoothing.savgol( counts, kwargs["window"], kwargs["order"] )
+                elif step=="gaussian":
+                    counts[:] = smoothing.gaussian_smooth( counts, kwargs["sigma"] )
+                elif step=="clip":
+                    transforms.clip( counts, kwargs["lower"], kwargs["upper"], out=counts )
+                elif step=="floor":
+                    transforms.floor( counts, kwargs["minimum"], out=counts )
+                elif step=="ceiling":
+                    transforms.ceiling( counts, kwargs["maximum"], out=counts )
+
+        result = { "input":name, "data":buffer[:,start-first:stop-first], "channels":( start, stop ) }
+
+        if self.model is not None:
+            result.update( self._fit( result["data"] ) )
+
+        return result
+
+    def map( self, sources, workers=None ):
+        """run() on many spectra with a pool of threads (numpy releases the GIL
+        in the heavy steps), results in the order of sources"""
+
+        workers = workers or os.cpu_count() or 1
+
+        if workers==1:
+            return [ self.run( source ) for source in sources ]
+
+        with ThreadPoolExecutor( workers ) as pool:
+            return list( pool.map( self.run, sources ) )
+
+    ###########################################################################
+
+    def noise( self, noise ):
+        """Calibrated noise spectrum of a subtract() step, read once"""
+
+        if not isinstance( noise, str ):
+            return np.asarray( noise, dtype=float )
+
+        if noise not in self._noise:
+            data, cal_pts = readers.cached_read_spectrum( noise )
+            if data is None:
+                raise ValueError( "could not read noise file "+noise )
+            self._noise[noise] = calibration.scale_data( data, cal_pts )
+
+        return self._noise[noise]
+
+    def _fit( self, data ):
+        """Fit of the cropped result, as in export.fit_spectrum"""
+
+        model = self.model
+
+        try:
+            with stage( "fit" ):
+                params, covars, sub = models.fit_to_curve( data, model["name"], model["lower"], model["upper"], p0=model["p0"] )
+        except (RuntimeError, ValueError, TypeError, IndexError) as err:
+            return { "model":model["name"], "error":repr(err) }
+
+        if params is None:
+            return { "model":model["name"], "error":"invalid bounds" }
+
+        return { "model":model["name"], "params":[ float(p) for p in params ],
+                 "errors":[ float(e) for e in np.sqrt( np.diag( covars ) ) ],
+                 "lower":float( sub[0,0] ), "upper":float( sub[0,-1] ) }
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Calibrate, clean up, crop and fit many spectra in one pass" )
+    parser.add_argument( "paths", nargs="+", help=".IEC or .csv files, or folders of .IEC files" )
+    parser.add_argument( "--noise", default=None, help="noise spectrum (.IEC) to subtract" )
+    parser.add_argument( "--snip", type=int, default=0, help="SNIP background window (0 for none)" )
+    parser.add_argument( "--smooth", type=int, nargs=2, default=None, metavar=("WINDOW","ORDER"), help="Savitzky-Golay smoothing" )
+    parser.add_argument( "--crop", type=float, nargs=2, default=(None,None), metavar=("LOWER","UPPER") )
+    parser.add_argument( "--model", default=None, choices=sorted( models.MODELS ), help="fit the cropped spectrum" )
+    parser.add_argument( "--channels", action="store_true", help="do not calibrate" )
+    parser.add_argument( "-j", "--workers", type=int, default=None, help="number of threads" )
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        paths += sorted( glob.glob( os.path.join( glob.escape( path ), "*.IEC" ) ) ) if os.path.isdir( path ) else [path]
+
+    chain = Pipeline()
+    if not args.channels:
+        chain.calibrate()
+    if args.noise:
+        chain.subtract( args.noise ).clip()
+    if args.snip>0:
+        chain.background( args.snip ).clip()
+    if args.smooth:
+        chain.smooth( *args.smooth ).clip()
+    chain.crop( *args.crop )
+    if args.model:
+        chain.fit( args.model )
+
+    for result in chain.map( paths, args.workers ):
+        summary = { k:v for (k,v) in result.items() if k!="data" }
+        print( json.dumps( summary ) )
+
+    sys.exit(0)
@@ -0,0 +1,328 @@
+# Filename: profiling.py
+# Purpose: Opt-in timing of the analysis stages (parsing, calibration, noise and
+#          background subtraction, smoothing, fitting) to find out which one
+#          makes a reprocessing run slow. Records wall time, calls, fit function
+#          evaluations and (optionally) peak memory per stage and per file,
+#          prints a summary table and exports a Chrome trace (open in
+#          chrome://tracing or ui.perfetto.dev). When off, instrumented functions
+#          only pay for one flag check.
+# Date Created: 10/19/26
+#
+# Switch on with enable() or by setting the environment variables before running
+# any script that uses SpecTools:
+#
+#   SPECTOOLS_PROFILE=1            record, print the summary at exit
+#   SPECTOOLS_PROFILE=memory       same, also tracks peak memory (slower)
+#   SPECTOOLS_TRACE=trace.json     also write the Chrome trace at exit
+#
+# Only the calling process is recorded, so run recipes with threads (the default)
+# rather than --processes when profiling.
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+import tracemalloc
+import contextlib
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+enabled = False
+memory = False
+
+_events = []                    #finished stages, in order of finishing
+_events_lock = threading.Lock()
+_local = threading.local()      #stack of open stages of each thread
+_origin = time.perf_counter()
+
+_NULL = contextlib.nullcontext()
+
+###############################################################################
+
+def enable( track_memory=False ):
+    """Starts recording stages
+
+    Parameters:
+        track_memory (bool, optional): also record the peak memory of each stage
+            with tracemalloc, which slows numpy-heavy code down noticeably
+    """
+
+    global enabled, memory
+
+    enabled = True
+    memory = track_memory
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    """Stops recording stages (recorded stages are kept until reset())"""
+
+    global enabled, memory
+
+    enabled = False
+    if memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    memory = False
+
+def reset():
+    """Forgets all recorded stages"""
+
+    with _events_lock:
+        del _events[:]
+
+###############################################################################
+
+class Stage:
+    """Context manager recording one stage. Stages opened inside another stage
+    belong to the same file unless given their own.
+
+    Parameters:
+        name (string): name of the stage, e.g. "parse" or "fit"
+        file (string, optional): file being processed
+    """
+
+    def __init__( self, name, file=None ):
+
+        self.name = name
+        self.file = file
+        self.args = {}
+        self.peak = 0
+
+    def __enter__( self ):
+
+        stack = _stack()
+        if self.file is None and len(stack)>0:
+            self.file = stack[-1].file
+
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack)>0:
+                stack[-1].peak = max( stack[-1].peak, peak )
+            self.base = current
+            tracemalloc.reset_peak()
+
+        stack.append( self )
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__( self, *exc ):
+
+        end = time.perf_counter()
+        stack = _stack()
+        stack.pop()
+
+        event = { "name":self.name, "file":self.file, "start":self.start-_origin, "duration":end-self.start,
+                  "pid":os.getpid(), "tid":threading.get_ident() }
+        event.update( self.args )
+
+        if memory:
+            self.peak = max( self.peak, tracemalloc.get_traced_memory()[1] )
+            event["peak_memory"] = self.peak - self.base
+            if len(stack)>0:
+                stack[-1].peak = max( stack[-1].peak, self.peak )
+
+        with _events_lock:
+            _events.append( event )
+
+        return False
+
+###############################################################################
+
+def stage( name, file=None ):
+    """Stage(), or a context manager doing nothing when recording is off"""
+
+    if not enabled:
+        return _NULL
+
+    return Stage( name, file )
+
+###############################################################################
+
+def timed( name, file_arg=None ):
+    """Decorator recording every call of a function as a stage
+
+    Parameters:
+        name (string): name of the stage
+        file_arg (int, optional): position of the argument holding the filepath
+    """
+
+    def decorate( func ):
+
+        @functools.wraps( func )
+        def wrapper( *args, **kwargs ):
+
+            if not enabled:
+                return func( *args, **kwargs )
+
+            file = args[file_arg] if file_arg is not None and len(args)>file_arg else None
+            with Stage( name, file ):
+                return func( *args, **kwargs )
+
+        return wrapper
+
+    return decorate
+
+###############################################################################
+
+def note( key, value ):
+    """Adds a value (e.g. nfev of a fit) to the innermost open stage, summed if
+    the stage notes it more than once"""
+
+    if not enabled:
+        return
+
+    stack = _stack()
+    if len(stack)>0:
+        stack[-1].args[key] = stack[-1].args.get( key, 0 ) + value
+
+###############################################################################
+
+class Laps:
+    """Records consecutive stages of long functions without wrapping each part:
+    every call ends the stage that began at the previous call (or at creation).
+
+    Parameters:
+        file (string, optional): file being processed
+    """
+
+    def __init__( self, file=None ):
+
+        self.file = file
+        self.last = time.perf_counter()
+
+    def __call__( self, name ):
+
+        end = time.perf_counter()
+        stack = _stack()
+        file = self.file if self.file is not None or len(stack)==0 else stack[-1].file
+
+        with _events_lock:
+            _events.append( { "name":name, "file":file, "start":self.last-_origin, "duration":end-self.last,
+                              "pid":os.getpid(), "tid":threading.get_ident() } )
+
+        self.last = time.perf_counter()
+
+def laps( file=None ):
+    """Laps(), or a function doing nothing when recording is off"""
+
+    if not enabled:
+        return _no_lap
+
+    return Laps( file )
+
+###############################################################################
+
+def events():
+    """Copy of the recorded stages, as dictionaries with name, file, start and
+    duration (seconds), pid, tid, and nfev or peak_memory (bytes) if recorded"""
+
+    with _events_lock:
+        return [ dict( event ) for event in _events ]
+
+###############################################################################
+
+def summary( by_file=False ):
+    """Totals per stage (and per file)
+
+    Parameters:
+        by_file (bool, optional): if true, one row per file and stage
+
+    Returns:
+        rows (list): dictionaries with stage, file, calls, total, mean and max
+            time (seconds), nfev and peak_memory (bytes), largest total first
+    """
+
+    totals = {}
+
+    for event in events():
+        key = ( event["name"], event["file"] if by_file else None )
+        row = totals.setdefault( key, { "stage":key[0], "file":key[1], "calls":0, "total":0., "max":0.,
+                                        "nfev":0, "peak_memory":0 } )
+
+        row["calls"] += 1
+        row["total"] += event["duration"]
+        row["max"] = max( row["max"], event["duration"] )
+        row["nfev"] += event.get( "nfev", 0 )
+        row["peak_memory"] = max( row["peak_memory"], event.get( "peak_memory", 0 ) )
+
+    rows = sorted( totals.values(), key=lambda row: -row["total"] )
+    for row in rows:
+        row["mean"] = row["total"]/row["calls"]
+
+    return rows
+
+###############################################################################
+
+def format_summary( by_file=False ):
+    """summary() as a table"""
+
+    rows = summary( by_file )
+    width = max( [ len( os.path.basename( row["file"] or "" ) ) for row in rows ] + [4] ) if by_file else 0
+
+    lines = [ "%-18s %*s %7s %11s %11s %11s %8s %10s"%( "stage", width, "file" if by_file else "", "calls", "total (ms)",
+                                                        "mean (ms)", "max (ms)", "nfev", "peak (MB)" ) ]
+
+    for row in rows:
+        name = os.path.basename( row["file"] or "" ) if by_file else ""
+        lines.append( "%-18s %*s %7d %11.2f %11.3f %11.3f %8d %10.2f"%( row["stage"], width, name, row["calls"],
+                      1e3*row["total"], 1e3*row["mean"], 1e3*row["max"], row["nfev"], row["peak_memory"]/2**20 ) )
+
+    return "\n".join( lines )
+
+###############################################################################
+
+def write_trace( filepath ):
+    """Writes the recorded stages as a Chrome trace (JSON trace event format)"""
+
+    trace = []
+
+    for event in events():
+        args = { k:v for (k,v) in event.items() if k not in ["name","start","duration","pid","tid"] }
+        trace.append( { "name":event["name"], "cat":"spectools", "ph":"X", "ts":1e6*event["start"],
+                        "dur":1e6*event["duration"], "pid":event["pid"], "tid":event["tid"], "args":args } )
+
+    with open( filepath, "w" ) as fout:
+        json.dump( { "traceEvents":trace, "displayTimeUnit":"ms" }, fout )
+
+###############################################################################
+#############################  HELPER FUNCTIONS  ##############################
+###############################################################################
+
+def _stack():
+    """Open stages of the current thread"""
+
+    if not hasattr( _local, "stack" ):
+        _local.stack = []
+
+    return _local.stack
+
+def _no_lap( name ):
+    return None
+
+def _report_at_exit():
+    """Summary (and trace) of a run switched on by SPECTOOLS_PROFILE"""
+
+    if len( events() )==0:
+        return
+
+    print( "\n"+format_summary(), file=sys.stderr )
+
+    if os.environ.get( "SPECTOOLS_TRACE" ):
+        write_trace( os.environ["SPECTOOLS_TRACE"] )
+
+###############################################################################
+
+if os.environ.get( "SPECTOOLS_PROFILE", "" ) not in ["", "0"]:
+    enable( os.environ["SPECTOOLS_PROFILE"]=="memory" )
+    atexit.register( _report_at_exit )
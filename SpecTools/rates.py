@@ -0,0 +1,170 @@
+# Filename: rates.py
+# Purpose: Count rates from the live and real times in the IEC header, so that
+#          runs of different length (Compton angles, XRF samples) can be compared.
+#          Counts are divided by the live time, which already excludes the time
+#          the MCA was busy, and the dead time fraction is reported alongside.
+#          Works on one spectrum or a stack of spectra (one per row).
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import readers
+import arithmetic
+import background
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def dead_time( live_time, real_time ):
+    """Fraction of the real time the MCA could not record events"""
+
+    live_time = np.asarray( live_time, dtype=float )
+    real_time = np.asarray( real_time, dtype=float )
+
+    return 1 - live_time/real_time
+
+###############################################################################
+
+def per_row( values, counts ):
+    """Shapes one value per spectrum so that it divides a stack of spectra row-wise"""
+
+    values = np.asarray( values, dtype=float )
+
+    if np.ndim( values )==1 and np.ndim( counts )==2:
+        return values[:,None]
+
+    return values
+
+###############################################################################
+
+def to_rate( counts, live_time, variance=None ):
+    """Count rate of each channel
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        live_time (float or array): live time of each spectrum (seconds)
+        variance (array, optional): variance of counts. Defaults to Poisson
+
+    Returns:
+        rate (array): counts per second of live time
+        variance (array): variance of the rate
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    live = per_row( live_time, counts )
+
+    return counts/live, arithmetic.poisson( counts, variance )/live**2
+
+###############################################################################
+
+def dead_time_correct( counts, live_time, real_time, variance=None ):
+    """Counts that would have been recorded over the real time with no dead time
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        live_time, real_time (float or array): times of each spectrum (seconds)
+        variance (array, optional): variance of counts. Defaults to Poisson
+
+    Returns:
+        corrected (array): counts scaled by real/live time
+        variance (array): variance of the corrected counts
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    scale = per_row( real_time, counts )/per_row( live_time, counts )
+
+    return counts*scale, arithmetic.poisson( counts, variance )*scale**2
+
+###############################################################################
+
+def peak_rate( data, lowerbound, upperbound, live_time, background_counts=None, window=24 ):
+    """Net count rate of a peak above the SNIP continuum
+
+    Parameters:
+        data (2D array): first row is x-axis and second row is counts
+        lowerbound, upperbound (float): bounds of the peak on the x axis
+        live_time (float): live time of the spectrum (seconds)
+        background_counts (array, optional): continuum under the peak, found with
+            background.snip() if not given
+        window (int, optional): SNIP window used if background_counts is not given
+
+    Returns:
+        rate (float): net counts per second of live time
+        error (float): statistical error on rate
+    """
+
+    net, error = background.net_area( data, lowerbound, upperbound, background_counts, window )
+
+    return net/live_time, error/live_time
+
+###############################################################################
+
+def read_rates( paths, correct=False ):
+    """Reads spectra with the same number of channels as a stack of count rates
+
+    Parameters:
+        paths (list): filepaths of .IEC files
+        correct (bool, optional): if true, returns dead time corrected counts
+            instead of rates
+
+    Returns:
+        rates (2D array): one row per file, counts per second of live time (or
+            corrected counts), or None if a file could not be read
+        variance (2D array): variance of each channel
+        times (2D array): live and real time of each file, one row per file
+    """
+
+    spectra = [ readers.cached_read_spectrum( path )[0] for path in paths ]
+    headers = [ readers.IEC_header( path ) for path in paths ]
+
+    if any( s is None for s in spectra ) or any( h is None for h in headers ):
+        return None, None, None
+
+    if len( { s.shape for s in spectra } )>1:
+        print("Value Error: spectra must have the same number of channels")
+        return None, None, None
+
+    stack = np.array( [ s[1] for s in spectra ] )
+    times = np.array( [ [ h["live_time"], h["real_time"] ] for h in headers ] )
+
+    if correct:
+        values, variance = dead_time_correct( stack, times[:,0], times[:,1] )
+    else:
+        values, variance = to_rate( stack, times[:,0] )
+
+    return values, variance, times
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Live time, dead time and count rate of IEC files" )
+    parser.add_argument( "paths", nargs="+", help=".IEC files" )
+    args = parser.parse_args()
+
+    print( "%-24s %12s %12s %8s %12s"%( "file", "live (s)", "real (s)", "dead", "rate (1/s)" ) )
+
+    for path in args.paths:
+
+        header = readers.IEC_header( path )
+        data = readers.cached_read_spectrum( path )[0]
+
+        if header is None or data is None:
+            continue
+
+        rate = np.sum( data[1] )/header["live_time"]
+        print( "%-24s %12.3f %12.3f %7.2f%% %12.3f"%( os.path.basename( path ), header["live_time"], header["real_time"],
+                                                      100*dead_time( header["live_time"], header["real_time"] ), rate ) )
+
+    sys.exit(0)
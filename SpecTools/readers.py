@@ -0,0 +1,286 @@
+# Filename: readers.py
+# Purpose: Shared file readers for the spectra in the archive (IEC 1455 exports
+#          from the MCA software and the two-column csv files made from them).
+#          Parsing is vectorized so that batch jobs are not bound by the reader.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import threading
+import numpy as np
+
+import profiling
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+@profiling.timed( "parse", file_arg=0 )
+def IEC_to_array( filepath ):
+    """Converts .IEC file to a numpy array (IEC1455 standard)
+
+    Parameters:
+        filepath (string): filepath of iec file of raw data
+
+    Returns:
+        data (array): 2D array, first row is channels and second row is counts
+        cal_pts (array): 2D array of calibration points from the SPARE block,
+            first row is channels and second row is the corresponding energies
+    """
+
+    if ".IEC" not in filepath.upper():
+        print("File Type Error: File must be of .IEC type")
+        return None, None
+
+    try:
+        fin = open( filepath, "r" )
+    except:
+        print("File Path Error: File not found")
+        return None, None
+
+    lines = fin.read().splitlines()
+    fin.close()
+
+    return parse_IEC( lines )
+
+###############################################################################
+
+def parse_IEC( lines ):
+    """Converts the rows of an IEC file to a numpy array. Split out of
+    IEC_to_array() for callers that already hold the file contents.
+
+    Parameters:
+        lines (list): rows of the IEC file
+
+    Returns:
+        data (array): 2D array, first row is channels and second row is counts
+        cal_pts (array): 2D array of calibration points from the SPARE block
+    """
+
+    #ROW 1 CONTAINS RUNTIME AND CHANNEL INFO (fixed width, fields may touch)
+    channels = int( lines[1][32:].split()[0] )
+
+    cal_pts = read_cal_pts( lines )
+
+    #everything after USERDEFINED is "index c0 c1 c2 c3 c4"
+    start = find_row( lines, "USERDEFINED" ) + 1
+    block = " ".join( row[4:] for row in lines[start:] if row.startswith("A004") )
+    values = np.array( block.split(), dtype=float ).reshape(-1,6)
+
+    first = int( values[0,0] )
+    counts = values[:,1:].ravel()[:channels-first]
+
+    data = np.zeros( (2,channels), dtype=float )
+    data[0] = np.arange( channels )
+    data[1,first:first+len(counts)] = counts
+
+    return data, cal_pts
+
+###############################################################################
+
+@profiling.timed( "parse", file_arg=0 )
+def CSV_to_array( filepath, dtype=float ):
+    """Converts two-column .csv file (channel, counts) to a numpy array
+
+    Parameters:
+        filepath (string): filepath of csv file
+        dtype (type, optional): data type for numpy array. Defaults to float
+
+    Returns:
+        data (array): 2D array, data as listed in .csv file
+    """
+
+    if ".csv" not in filepath:
+        print("File Type Error: File must be of .csv type")
+        return None
+
+    try:
+        data = np.loadtxt( filepath, delimiter=",", skiprows=1, usecols=(0,1), dtype=float, ndmin=2 )
+    except OSError:
+        print("File Path Error: File not found")
+        return None
+
+    return data.T.astype( dtype )
+
+###############################################################################
+
+def IEC_header( filepath ):
+    """Reads only the header rows of an .IEC file (title, times, channels, date),
+    without parsing the counts
+
+    Parameters:
+        filepath (string): filepath of iec file
+
+    Returns:
+        header (dict): see read_header(), or None if the file could not be read
+    """
+
+    if ".IEC" not in filepath.upper():
+        print("File Type Error: File must be of .IEC type")
+        return None
+
+    try:
+        fin = open( filepath, "r" )
+    except:
+        print("File Path Error: File not found")
+        return None
+
+    lines = [ fin.readline().rstrip("\r\n") for i in range(3) ]
+    fin.close()
+
+    return read_header( lines )
+
+###############################################################################
+
+def read_spectrum( filepath ):
+    """Reads any supported spectrum file based on its extension
+
+    Parameters:
+        filepath (string): filepath of .IEC or .csv file
+
+    Returns:
+        data (array): 2D array, first row is channels and second row is counts
+        cal_pts (array): calibration points stored in the file (empty for csv)
+    """
+
+    if filepath.upper().endswith(".IEC"):
+        return IEC_to_array( filepath )
+
+    if filepath.endswith(".csv"):
+        return CSV_to_array( filepath ), np.zeros( (2,0) )
+
+    print("File Type Error: File must be of .IEC or .csv type")
+    return None, None
+
+###############################################################################
+
+_read_cache = {}
+_read_lock = threading.Lock()
+
+def cached_read_spectrum( filepath ):
+    """Same as read_spectrum(), but keeps parsed files in memory so that many
+    jobs using the same file only parse it once. Entries are keyed by the
+    modification time and size of the file, so rewritten files are re-parsed.
+    The returned arrays are read-only since they are shared between callers.
+    """
+
+    filepath = os.path.abspath( filepath )
+
+    try:
+        stat = os.stat( filepath )
+    except OSError:
+        print("File Path Error: File not found")
+        return None, None
+
+    key = ( filepath, stat.st_mtime_ns, stat.st_size )
+
+    with _read_lock:
+        if key in _read_cache:
+            return _read_cache[key]
+
+    data, cal_pts = read_spectrum( filepath )
+
+    if data is None:
+        return None, None
+
+    data.setflags( write=False )
+    cal_pts.setflags( write=False )
+
+    with _read_lock:
+        _read_cache[key] = ( data, cal_pts )
+
+    return data, cal_pts
+
+###############################################################################
+
+def clear_cache():
+    """Empties the cache used by cached_read_spectrum()"""
+
+    with _read_lock:
+        _read_cache.clear()
+
+###############################################################################
+#############################  HELPER FUNCTIONS  ##############################
+###############################################################################
+
+def find_row( lines, key ):
+    """Returns index of first row containing key, or -1 if not found"""
+
+    for ( i, row ) in enumerate( lines ):
+        if key in row:
+            return i
+
+    return -1
+
+###############################################################################
+
+def read_times( lines ):
+    """Live and real time (seconds) from row 1 of an IEC file. The row is fixed
+    width and the fields may touch (e.g. "1204727.8490001204728.413000").
+
+    Parameters:
+        lines (list): rows of the IEC file (at least the first two)
+
+    Returns:
+        live_time, real_time (float): acquisition times in seconds
+    """
+
+    return float( lines[1][4:18] ), float( lines[1][18:32] )
+
+###############################################################################
+
+def read_header( lines ):
+    """Header of an IEC file
+
+    Parameters:
+        lines (list): rows of the IEC file (at least the first three)
+
+    Returns:
+        header (dict): title (detector/experiment name from row 0), live_time and
+            real_time (seconds), channels and date (as written, dd/mm/yy hh:mm:ss)
+    """
+
+    live_time, real_time = read_times( lines )
+
+    return { "title":lines[0][4:].split()[0] if len( lines[0][4:].split() )>0 else "",
+             "live_time":live_time, "real_time":real_time,
+             "channels":int( lines[1][32:].split()[0] ), "date":lines[2][4:].strip() }
+
+###############################################################################
+
+def read_cal_pts( lines ):
+    """Reads calibration points from the SPARE block of an IEC file. Each row
+    holds two (energy, channel) pairs, and the list ends at the first zero pair.
+
+    Parameters:
+        lines (list): rows of the IEC file
+
+    Returns:
+        cal_pts (array): 2D array, first row is channels and second row is energies
+    """
+
+    start = find_row( lines, "SPARE" )
+
+    if start<0:
+        return np.zeros( (2,0) )
+
+    pairs = []
+
+    for row in lines[start+1:start+13]:
+
+        row = row[4:].split()
+
+        for i in [0,2]:
+
+            energy = float( row[i] )
+            channel = float( row[i+1] )
+
+            if energy==0 and channel==0:
+                return np.array( pairs, dtype=float ).reshape(-1,2).T
+
+            pairs.append( (channel, energy) )
+
+    return np.array( pairs, dtype=float ).reshape(-1,2).T
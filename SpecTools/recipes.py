@@ -0,0 +1,554 @@
+# Filename: recipes.py
+# Purpose: Runs declarative analysis recipes in place of the parameters that
+#          used to be typed into the top of main.py, error_bars.py and convert.py.
+#          Many recipes can be run at once on a pool of workers, sharing parsed
+#          files and calibrations between jobs.
+# Date Created: 10/19/26
+#
+# A recipe is a TOML (or JSON) file with the following sections. Paths are
+# relative to the recipe file, and input paths may contain glob wildcards, in
+# which case the recipe is run once per matching file and "{stem}" in output
+# paths is replaced by the name of the input file.
+#
+#   title = "Speed of Light"
+#
+#   [input]
+#   path = "../../SoL 2021/csv files/Trial 5.csv"   (.IEC or .csv)
+#   x = [...]  y = [...]  yerr = [...]              (point data instead of a file)
+#   rebin = 4                                       sum channels in groups of 4 first
+#
+#   [calibration]
+#   mode = "file"       use SPARE points of the input (or of source = "...")
+#          "points"     points = [[channel, energy], ...]
+#          "linear"     slope = ..., intercept = ...
+#          "period"     period = ..., channels = ... (time calibration of lab_3)
+#          "auto"       lines = "Cs-137" (nuclides or energies), found from the peaks
+#                       of source = "..." or of the calibration*.IEC file next to
+#                       the input, degree = 1 (or 2 for quadratic)
+#          "none"       keep channels (default for csv files)
+#   fit = "piecewise"   piecewise-linear through every point (default), "gain"
+#                       through the origin as lab_3 and lab_4 (see calibration.py,
+#                       it sits a few keV above "piecewise" for the Compton trials)
+#                       or "linear" regression
+#
+#   [roi]
+#   lower = ...  upper = ...   bounds on the calibrated x axis
+#   auto = "strongest"         find the bounds with peaks.py instead ("strongest"
+#                              or "highest" peak, or "decay" for expon_decay)
+#          "compton"           scattered photopeak of a Compton trial at angle = ...
+#                              (degrees), or at the angle of each trial in angles =
+#                              "RESULTS.csv" (Trial and Angle columns, trial number
+#                              from the file name). Strongest peak if it is not known
+#   E_gamma = 662              source line of "compton" (keV)
+#   min_channel = ...          ignore peaks below this channel when auto
+#   threshold = ...            minimum peak significance when auto (default 5)
+#   min_counts = ...           counts below this are set to 0 (threshold of lab_1)
+#   max_counts = ...           counts above this are clipped
+#
+#   [model]
+#   name = "gauss", "expon_decay", "norm", "skewnorm", "line" or "none"
+#   p0 = [...]                 optional initial parameters
+#
+#   [output]
+#   results = "out/{stem}.json"   fitted parameters and errors
+#   csv = "out/{stem}.csv"        calibrated data
+#   figure = "out/{stem}.png"     plot of data and fit (png, pdf or svg)
+#   xlabel = "..."  ylabel = "..."
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:     #python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+import readers
+import calibration
+import autocal
+import arithmetic
+import models
+import peaks
+import profiling
+import waterfall
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def load_recipe( filepath ):
+    """Reads a recipe file and expands it into one job per input file
+
+    Parameters:
+        filepath (string): filepath of .toml or .json recipe
+
+    Returns:
+        jobs (list): list of recipe dictionaries with absolute paths filled in
+    """
+
+    if filepath.endswith(".json"):
+        with open( filepath, "r" ) as fin:
+            recipe = json.load( fin )
+
+    elif filepath.endswith(".toml"):
+        if tomllib is None:
+            print("Import Error: reading .toml recipes needs python 3.11+ or the tomli package")
+            return []
+        with open( filepath, "rb" ) as fin:
+            recipe = tomllib.load( fin )
+
+    else:
+        print("File Type Error: recipe must be of .toml or .json type")
+        return []
+
+    base = os.path.dirname( os.path.abspath( filepath ) )
+    recipe["recipe"] = os.path.abspath( filepath )
+    recipe.setdefault( "input", {} )
+
+    if "path" not in recipe["input"]:
+        stem = os.path.splitext( os.path.basename( filepath ) )[0]
+        return [ resolve_outputs( recipe, base, stem ) ]
+
+    pattern = os.path.join( base, recipe["input"]["path"] )
+    matches = sorted( glob.glob( pattern ) ) if glob.has_magic( pattern ) else [pattern]
+
+    if len(matches)==0:
+        print("File Path Error: no files match "+pattern)
+
+    jobs = []
+
+    for path in matches:
+        job = json.loads( json.dumps( recipe ) )    #deep copy
+        job["input"]["path"] = path
+
+        source = job.get( "calibration", {} ).get( "source" )
+        if source is not None:
+            job["calibration"]["source"] = os.path.join( base, source )
+
+        angles = job.get( "roi", {} ).get( "angles" )
+        if angles is not None:
+            job["roi"]["angles"] = os.path.join( base, angles )
+
+        stem = os.path.splitext( os.path.basename( path ) )[0]
+        jobs.append( resolve_outputs( job, base, stem ) )
+
+    return jobs
+
+###############################################################################
+
+def resolve_outputs( job, base, stem ):
+    """Fills in {stem} and makes output paths absolute"""
+
+    outputs = job.setdefault( "output", {} )
+
+    for key in ["results","csv","figure"]:
+        if key in outputs:
+            outputs[key] = os.path.join( base, outputs[key].replace( "{stem}", stem ) )
+
+    job["stem"] = stem
+
+    return job
+
+###############################################################################
+
+_cal_cache = {}
+_cal_lock = threading.Lock()
+
+def get_calibration( job, cal_pts ):
+    """Works out the calibration of a job. Results are cached, so that a
+    calibration shared by many jobs (e.g. a separate calibration file) is only
+    read and fitted once.
+
+    Parameters:
+        job (dict): recipe of the job
+        cal_pts (2D array): calibration points stored in the input file
+
+    Returns:
+        kind (string): "piecewise", "linear", "auto" or "none"
+        value: calibration points for "piecewise", (slope, intercept) for "linear",
+            autocal.Calibration for "auto"
+    """
+
+    settings = job.get( "calibration", {} )
+    path = job["input"]["path"]
+    mode = settings.get( "mode", "file" if path.upper().endswith(".IEC") else "none" )
+    fit = settings.get( "fit", "piecewise" )
+
+    if mode=="none":
+        return "none", None
+
+    if mode=="linear":
+        return "linear", ( settings["slope"], settings.get( "intercept", 0. ) )
+
+    if mode=="period":
+        return "linear", ( settings["period"]/settings["channels"], 0. )
+
+    if mode=="auto":
+        #fitted once per calibration spectrum by autocal itself
+        if "source" in settings:
+            folder, pattern = os.path.split( settings["source"] )
+            pattern = glob.escape( pattern )
+        else:
+            folder, pattern = path, "calibration*.IEC"
+
+        cal = autocal.session_calibration( folder, settings["lines"], pattern, settings.get( "degree", 1 ) )
+        return ( "auto", cal ) if cal is not None else ( "none", None )
+
+    if mode=="points":
+        key = ( "points", fit, json.dumps( settings["points"] ) )
+        points = lambda: np.array( settings["points"], dtype=float ).T
+
+    elif mode=="file":
+        source = settings.get( "source" )
+
+        if source is None:
+            key = None
+            points = lambda: cal_pts
+
+        else:
+            stat = os.stat( source )
+            key = ( "file", fit, source, stat.st_mtime_ns, stat.st_size )
+            points = lambda: readers.cached_read_spectrum( source )[1]
+
+    else:
+        print("Value Error: unknown calibration mode "+str(mode))
+        return "none", None
+
+    if key is not None:
+        with _cal_lock:
+            if key in _cal_cache:
+                return _cal_cache[key]
+
+    pts = points()
+
+    if np.size( pts )==0:
+        result = ( "none", None )
+    elif fit=="linear":
+        result = ( "linear", calibration.linear_calibration( pts ) )
+    elif fit=="gain":
+        result = ( "linear", ( calibration.gain_calibration( pts ), 0. ) )
+    else:
+        result = ( "piecewise", pts )
+
+    if key is not None:
+        with _cal_lock:
+            _cal_cache[key] = result
+
+    return result
+
+###############################################################################
+
+def apply_roi( data, roi ):
+    """Applies the count floor/ceiling of a job. Returns a copy."""
+
+    data = np.array( data, dtype=float )
+
+    if "min_counts" in roi:
+        data[1,data[1]<roi["min_counts"]] = 0
+
+    if "max_counts" in roi:
+        np.minimum( data[1], roi["max_counts"], out=data[1] )
+
+    return data
+
+###############################################################################
+
+def auto_roi( data, roi, filepath=None ):
+    """Returns copy of roi with lower/upper found by the peak search (and the
+    angle used for "compton")"""
+
+    roi = dict( roi )
+
+    if roi["auto"]=="compton":
+        angle = roi.get( "angle" )
+        if angle is None and "angles" in roi and filepath is not None:
+            sheet = waterfall.read_results( roi["angles"] ) or {}
+            angle = sheet.get( waterfall.trial_number( filepath ), (None,) )[0]
+
+        if angle is not None:
+            roi["angle"] = float( angle )
+            roi["lower"], roi["upper"] = peaks.compton_roi( data, angle, roi.get( "E_gamma", 662. ),
+                                                            min_channel=roi.get( "min_channel", 20 ),
+                                                            threshold=roi.get( "threshold", 10. ) )
+            return roi
+
+    if roi["auto"]=="decay":
+        roi["lower"], roi["upper"] = peaks.decay_roi( data )
+    else:
+        roi["lower"], roi["upper"] = peaks.propose_roi( data, highest=(roi["auto"]=="highest"),
+                                                        min_channel=roi.get( "min_channel", 0 ),
+                                                        threshold=roi.get( "threshold", 5. ) )
+
+    return roi
+
+###############################################################################
+
+def fit_model( data, model, roi ):
+    """Fits the model of a job to the data inside its ROI
+
+    Returns:
+        results (dict): fitted parameters and their errors
+        curve (2D array): points of fit curve for plotting, or None
+    """
+
+    name = model.get( "name", "none" )
+    lower, upper = models.get_bounds( data, roi.get("lower"), roi.get("upper") )
+    sub = data[:,lower:upper]
+
+    if name in ["gauss","expon_decay"]:
+        params, covars, sub = models.fit_to_curve( data, name, roi.get("lower"), roi.get("upper"), p0=model.get("p0") )
+        names = { "gauss":["std","mean","norm"], "expon_decay":["A","tau"] }[name]
+        errors = np.sqrt( np.diag( covars ) )
+        results = { n:float(p) for (n,p) in zip( names, params ) }
+        results.update( { n+"_error":float(e) for (n,e) in zip( names, errors ) } )
+
+        x = np.linspace( sub[0,0], sub[0,-1], 1000 )
+        return results, np.array( [x, models.MODELS[name](x,*params)] )
+
+    if name=="norm":
+        mean, std = models.norm_fit( sub )
+        x = np.linspace( sub[0,0], sub[0,-1], 1000 )
+        y = models.gauss( x, std, mean, np.sum(sub[1])*np.mean(np.diff(sub[0])) )
+        return { "mean":float(mean), "std":float(std) }, np.array( [x, y] )
+
+    if name=="skewnorm":
+        skew, mean, std = models.skew_fit( sub )
+        return { "skew":float(skew), "mean":float(mean), "std":float(std) }, None
+
+    if name=="line":
+        slope, intercept, r_value, p_value, std_err = models.line_fit( sub[0], sub[1] )
+        results = { "slope":slope, "intercept":intercept, "r2":r_value**2, "slope_error":std_err }
+        return { k:float(v) for (k,v) in results.items() }, np.array( [sub[0], intercept+slope*sub[0]] )
+
+    return {}, None
+
+###############################################################################
+
+def run_job( job ):
+    """Runs a single job from load_recipe()
+
+    Parameters:
+        job (dict): recipe of the job
+
+    Returns:
+        results (dict): summary of the job, including any fit results
+    """
+
+    source = job["input"]
+    roi = job.get( "roi", {} )
+    outputs = job["output"]
+    title = job.get( "title", job["stem"] )
+
+    if "path" in source:
+        raw, cal_pts = readers.cached_read_spectrum( source["path"] )
+        if raw is None:
+            return { "recipe":job["recipe"], "input":source["path"], "error":"could not read input" }
+
+        kind, value = get_calibration( job, cal_pts )
+
+        if kind=="piecewise":
+            data = calibration.scale_data( raw, value )
+        elif kind=="linear":
+            data = calibration.apply_linear( raw, *value )
+        elif kind=="auto":
+            data = value.apply( raw )
+        else:
+            data = np.array( raw, dtype=float )
+
+        #fewer, fuller channels make every later step faster
+        if "rebin" in source:
+            data = arithmetic.rebin_data( data, source["rebin"] )[0]
+
+        yerr = None
+
+    else:
+        data = np.array( [ source["x"], source["y"] ], dtype=float )
+        yerr = source.get( "yerr" )
+        kind = "none"
+
+    data = apply_roi( data, roi )
+
+    if "auto" in roi:
+        roi = auto_roi( data, roi, source.get( "path" ) )
+    fit, curve = fit_model( data, job.get( "model", {} ), roi )
+
+    results = { "recipe":job["recipe"], "input":source.get( "path", "points" ), "title":title,
+                "calibration":kind, "total_counts":float( np.sum( data[1] ) ) }
+
+    #rates from the acquisition times of IEC files
+    if source.get( "path", "" ).upper().endswith(".IEC"):
+        header = readers.IEC_header( source["path"] )
+        if header is not None:
+            results["live_time"] = header["live_time"]
+            results["real_time"] = header["real_time"]
+            results["count_rate"] = results["total_counts"]/header["live_time"]
+
+    if "auto" in roi:
+        results["lower"] = float( roi["lower"] )
+        results["upper"] = float( roi["upper"] )
+    if "angle" in roi:
+        results["angle"] = roi["angle"]
+    results.update( fit )
+
+    if "results" in outputs:
+        make_dir( outputs["results"] )
+        with open( outputs["results"], "w" ) as out:
+            json.dump( results, out, indent=4 )
+
+    if "csv" in outputs:
+        make_dir( outputs["csv"] )
+        np.savetxt( outputs["csv"], data.T, delimiter=",", header="Channel,Counts", comments="" )
+
+    if "figure" in outputs:
+        save_figure( outputs["figure"], data, curve, yerr, title, outputs )
+
+    return results
+
+###############################################################################
+
+@profiling.timed( "figure" )
+def save_figure( filepath, data, curve, yerr, title, outputs ):
+    """Saves data and fit curve without touching pyplot, so it is safe to call
+    from several worker threads at once"""
+
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.add_subplot()
+
+    if yerr is None:
+        ax.plot( data[0], data[1], label="Data" )
+    else:
+        ax.errorbar( data[0], data[1], yerr=yerr, fmt="o", capsize=3, label="Data" )
+
+    if curve is not None:
+        ax.plot( curve[0], curve[1], label="Fit curve" )
+
+    ax.set_title( title )
+    ax.set_xlabel( outputs.get( "xlabel", "Channels" ) )
+    ax.set_ylabel( outputs.get( "ylabel", "Counts" ) )
+    ax.legend()
+
+    make_dir( filepath )
+    fig.savefig( filepath )
+
+###############################################################################
+
+def make_dir( filepath ):
+    """Creates folder of output file if needed"""
+
+    folder = os.path.dirname( filepath )
+    if folder:
+        os.makedirs( folder, exist_ok=True )
+
+###############################################################################
+
+def _run_safely( job ):
+    """run_job() that reports errors instead of stopping the whole batch"""
+
+    try:
+        with profiling.stage( "job", job["input"].get( "path", "points" ) ):
+            return run_job( job )
+    except Exception as err:
+        return { "recipe":job["recipe"], "input":job["input"].get( "path", "points" ), "error":repr(err) }
+
+###############################################################################
+
+def find_recipes( paths ):
+    """Expands folders into the recipe files they contain"""
+
+    found = []
+
+    for path in paths:
+        if os.path.isdir( path ):
+            found += sorted( glob.glob( os.path.join( path, "*.toml" ) ) )
+            found += sorted( glob.glob( os.path.join( path, "*.json" ) ) )
+        else:
+            found.append( path )
+
+    return found
+
+###############################################################################
+
+def run_recipes( paths, workers=None, processes=False ):
+    """Runs many recipes concurrently
+
+    Parameters:
+        paths (list): recipe files or folders of recipe files
+        workers (int, optional): size of worker pool. Defaults to number of cpus
+        processes (bool, optional): if true, uses processes instead of threads.
+            Parse and calibration caches are then only shared within each process
+
+    Returns:
+        results (list): one results dictionary per job, in order
+    """
+
+    jobs = []
+    for path in find_recipes( paths ):
+        jobs += load_recipe( path )
+
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+    with pool( max_workers=workers ) as executor:
+        results = list( executor.map( _run_safely, jobs ) )
+
+    return results
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    parser = argparse.ArgumentParser( description="Run analysis recipes" )
+    parser.add_argument( "recipes", nargs="+", help="recipe files or folders of recipes" )
+    parser.add_argument( "-j", "--workers", type=int, default=None, help="number of workers" )
+    parser.add_argument( "--processes", action="store_true", help="use processes instead of threads" )
+    parser.add_argument( "--profile", action="store_true", help="print time spent in each stage and file" )
+    parser.add_argument( "--trace", default=None, help="write the stages as a Chrome trace (.json)" )
+    args = parser.parse_args()
+
+    if args.profile or args.trace:
+        profiling.enable()
+
+    results = run_recipes( args.recipes, args.workers, args.processes )
+
+    failed = 0
+
+    for res in results:
+        name = os.path.basename( res["input"] )
+
+        if "error" in res:
+            failed += 1
+            print( name+": ERROR "+res["error"] )
+        else:
+            fit = { k:v for (k,v) in res.items() if k not in ["recipe","input","title","calibration"] }
+            print( name+": "+", ".join( "%s = %.5g"%(k,v) for (k,v) in fit.items() ) )
+
+    print("\n%d jobs, %d failed"%( len(results), failed ))
+
+    if args.profile:
+        print( "\n"+profiling.format_summary() )
+        print( "\n"+profiling.format_summary( by_file=True ) )
+
+    if args.trace:
+        profiling.write_trace( args.trace )
+
+    sys.exit( 1 if failed else 0 )
@@ -0,0 +1,225 @@
+# Filename: registration.py
+# Purpose: Gain drift between runs (e.g. Compton trials taken over hours, or SoL
+#          trials on different days). The gain and offset of every run relative
+#          to a reference spectrum are found by FFT cross-correlation over a grid
+#          of stretches, and the counts are then resampled onto the channels of
+#          the reference, so that runs can be summed or compared directly.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import readers
+import background
+import arithmetic
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def resample( counts, gain, offset=0., num_channels=None ):
+    """Moves counts onto the channels of a reference, given the map
+    reference channel = gain*channel + offset. Counts are spread over the
+    reference channels in proportion to overlap, so totals are kept (apart from
+    counts mapped outside the reference).
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        gain, offset (float or array): map of each spectrum to the reference
+        num_channels (int, optional): channels of the reference. Defaults to the
+            channels of counts
+
+    Returns:
+        resampled (array): counts on the reference channels, same number of rows
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    rows = np.atleast_2d( counts ).shape[0]
+    n = counts.shape[-1]
+
+    if num_channels is None:
+        num_channels = n
+
+    gain = np.broadcast_to( np.asarray( gain, dtype=float ), (rows,) )[:,None]
+    offset = np.broadcast_to( np.asarray( offset, dtype=float ), (rows,) )[:,None]
+
+    #edges of every channel on the reference axis
+    edges = gain*arithmetic.channel_edges( n )[None,:] + offset
+
+    return arithmetic.rebin_edges( counts, edges, arithmetic.channel_edges( num_channels ) )[0]
+
+###############################################################################
+
+def features( counts, window=24 ):
+    """Peaks of each spectrum without the continuum, so that the correlation
+    follows the peaks rather than the shape of the Compton continuum"""
+
+    counts = np.atleast_2d( np.asarray( counts, dtype=float ) )
+
+    return np.maximum( counts - background.snip( counts, window ), 0 )
+
+###############################################################################
+
+def correlate( stretched, reference_fft, size ):
+    """Cross-correlation of a stack of stretched spectra with the reference
+
+    Parameters:
+        stretched (2D array): spectra on the reference channels, one per row
+        reference_fft (array): rfft of the reference, zero padded to size
+        size (int): padded length, at least twice the channels
+
+    Returns:
+        corr (2D array): correlation at each lag, lag 0 first and negative lags
+            wrapped to the end (as np.fft)
+    """
+
+    spectra = np.fft.rfft( stretched, size, axis=-1 )
+
+    return np.fft.irfft( reference_fft[None,:]*np.conj( spectra ), size, axis=-1 )
+
+###############################################################################
+
+def parabola( left, middle, right ):
+    """Offset of the vertex of a parabola through three equally spaced points"""
+
+    curvature = left - 2*middle + right
+
+    return np.where( curvature<0, 0.5*( left-right )/np.where( curvature<0, curvature, -1 ), 0. )
+
+###############################################################################
+
+def estimate_drift( stack, reference, gains=(0.9,1.1), num_gains=41, max_offset=None, passes=2, window=24 ):
+    """Gain and offset of each spectrum relative to a reference spectrum
+
+    Every spectrum is stretched by each gain of a logarithmic grid and
+    cross-correlated with the reference by FFT, which gives the best offset for
+    that gain at once. The best (gain, offset) is refined by parabolic
+    interpolation, and later passes repeat the search on a finer grid around it.
+
+    Parameters:
+        stack (array): 1D spectrum or 2D stack of spectra (one per row)
+        reference (array): reference spectrum
+        gains (tuple, optional): smallest and largest gain searched
+        num_gains (int, optional): number of gains in the grid
+        max_offset (float, optional): largest offset searched (channels).
+            Defaults to a quarter of the channels
+        passes (int, optional): number of grid searches
+        window (int, optional): SNIP window used to remove the continuum
+
+    Returns:
+        gain, offset (array): reference channel = gain*channel + offset, one per spectrum
+        score (array): normalized correlation at the best match (1 is perfect)
+    """
+
+    stack = np.atleast_2d( np.asarray( stack, dtype=float ) )
+    rows, n = stack.shape
+    m = len(reference)
+
+    if max_offset is None:
+        max_offset = m/4
+
+    #square root, so that strong and weak peaks count alike
+    ref = np.sqrt( features( reference, window )[0] )
+    spectra = features( stack, window )
+
+    size = 2*max( n, m )
+    reference_fft = np.fft.rfft( ref, size )
+    lags = np.fft.fftfreq( size, 1/size )           #0, 1, ..., -1
+    allowed = np.abs( lags )<=max_offset
+
+    low = np.full( rows, np.log( gains[0] ) )
+    high = np.full( rows, np.log( gains[1] ) )
+
+    for p in range( passes ):
+
+        grid = np.linspace( 0, 1, num_gains )
+        log_gain = low[:,None] + ( high-low )[:,None]*grid[None,:]        #(rows, gains)
+        step = ( high-low )/( num_gains-1 )
+
+        #stretch every spectrum by every gain of its grid at once
+        stretched = resample( np.repeat( spectra, num_gains, axis=0 ), np.exp( log_gain ).ravel(), 0., m )
+        stretched = np.sqrt( np.maximum( stretched, 0 ) )
+
+        corr = correlate( stretched, reference_fft, size )
+        norm = np.sqrt( np.sum( stretched**2, axis=1 )*np.sum( ref**2 ) )
+        corr /= np.maximum( norm, 1e-12 )[:,None]
+        corr[:,~allowed] = -np.inf
+        corr = corr.reshape( rows, num_gains, size )
+
+        best = corr.reshape( rows, -1 ).argmax( axis=1 )
+        g, lag = np.unravel_index( best, ( num_gains, size ) )
+        r = np.arange( rows )
+        score = corr[r,g,lag]
+
+        #sub-channel offset and sub-grid gain from the neighbouring correlations
+        shift = parabola( corr[r,g,(lag-1)%size], score, corr[r,g,(lag+1)%size] )
+        shift = np.where( np.isfinite( shift ), shift, 0. )
+        inner = ( g>0 ) & ( g<num_gains-1 )
+        g_shift = np.where( inner, parabola( corr[r,np.maximum(g-1,0),lag], score, corr[r,np.minimum(g+1,num_gains-1),lag] ), 0. )
+        g_shift = np.where( np.isfinite( g_shift ), g_shift, 0. )
+
+        best_log_gain = log_gain[r,g] + g_shift*step
+        offset = lags[lag] + shift
+
+        low = best_log_gain - 2*step
+        high = best_log_gain + 2*step
+
+    return np.exp( best_log_gain ), offset, score
+
+###############################################################################
+
+def register( stack, reference, **kwargs ):
+    """Aligns a stack of spectra with a reference spectrum
+
+    Parameters:
+        stack (array): 1D spectrum or 2D stack of spectra (one per row)
+        reference (array): reference spectrum
+        **kwargs: passed on to estimate_drift()
+
+    Returns:
+        aligned (array): counts on the reference channels, same shape as stack
+        gain, offset, score (array): see estimate_drift()
+    """
+
+    gain, offset, score = estimate_drift( stack, reference, **kwargs )
+    aligned = resample( stack, gain, offset, len(reference) )
+
+    return aligned, gain, offset, score
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Gain drift of spectra relative to a reference" )
+    parser.add_argument( "paths", nargs="+", help="spectra (.IEC or .csv) of the same number of channels" )
+    parser.add_argument( "--reference", help="reference spectrum. Defaults to the first file" )
+    parser.add_argument( "--gains", type=float, nargs=2, default=(0.9,1.1), help="range of gains searched" )
+    args = parser.parse_args()
+
+    paths = args.paths
+    reference = args.reference if args.reference is not None else paths[0]
+
+    ref, cal_pts = readers.read_spectrum( reference )
+    spectra = [ readers.read_spectrum( path )[0] for path in paths ]
+
+    if ref is None or any( s is None for s in spectra ):
+        sys.exit(1)
+
+    stack = np.array( [ s[1] for s in spectra ] )
+    aligned, gain, offset, score = register( stack, ref[1], gains=args.gains )
+
+    print( "reference: "+os.path.basename( reference ) )
+    for ( path, g, o, s, before, after ) in zip( paths, gain, offset, score, stack.sum(axis=1), aligned.sum(axis=1) ):
+        print( "%s: gain %.5f, offset %+.2f channels, match %.3f, counts %.0f -> %.0f"%(
+               os.path.basename( path ), g, o, s, before, after ) )
+
+    sys.exit(0)
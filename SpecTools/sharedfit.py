@@ -0,0 +1,226 @@
+# Filename: sharedfit.py
+# Purpose: Fits a stack of spectra on a pool of processes without pickling the
+#          spectra to every worker. The stack is copied once into shared memory,
+#          each worker maps it as a numpy array when it starts, and jobs only
+#          carry a range of row indices. Results are written straight into a
+#          shared results array.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import readers
+import models
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+#parameter names of each model, results hold these followed by their errors
+PARAMS = { "gauss":["std","mean","norm"], "expon_decay":["A","tau"],
+           "norm":["mean","std"], "skewnorm":["skew","mean","std"] }
+
+def fit_row( data, model, lowerbound=None, upperbound=None ):
+    """Fits one spectrum with the model of fit_to_curve(), norm_fit() or skew_fit()
+
+    Parameters:
+        data (2D array): first row is x-axis and second row is counts
+        model (string): name of model in PARAMS
+        lowerbound, upperbound (float, optional): bounds on the x axis
+
+    Returns:
+        values (array): parameters followed by their errors (nan if unknown)
+    """
+
+    num = len( PARAMS[model] )
+    values = np.full( 2*num, np.nan )
+
+    if model in ["gauss","expon_decay"]:
+        params, covars, sub = models.fit_to_curve( data, model, lowerbound, upperbound )
+        if params is not None:
+            values[:num] = params
+            values[num:] = np.sqrt( np.diag( covars ) )
+        return values
+
+    lower, upper = models.get_bounds( data, lowerbound, upperbound )
+    sub = data[:,lower:upper]
+
+    values[:num] = models.norm_fit( sub ) if model=="norm" else models.skew_fit( sub )
+
+    return values
+
+###############################################################################
+
+class SharedArray:
+    """Numpy array in a named block of shared memory. The process that creates
+    it owns the memory and frees it in close(); other processes attach by name.
+
+    Parameters:
+        shape (tuple): shape of the array
+        name (string, optional): name of an existing block to attach to
+        fill (float, optional): initial value of a new array
+    """
+
+    def __init__( self, shape, name=None, fill=None ):
+
+        self.shape = tuple( shape )
+        self.owner = name is None
+        size = max( int( np.prod( self.shape ) )*8, 1 )
+
+        self.memory = shared_memory.SharedMemory( name=name, create=self.owner, size=size )
+        self.array = np.ndarray( self.shape, dtype=float, buffer=self.memory.buf )
+
+        if fill is not None:
+            self.array[...] = fill
+
+    @property
+    def name( self ):
+        return self.memory.name
+
+    def close( self ):
+
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+###############################################################################
+
+#views of the shared arrays inside each worker process
+_worker = {}
+
+def _attach( stack_spec, results_spec ):
+    """Initializer of worker processes: maps the shared stack and results"""
+
+    _worker["stack"] = SharedArray( stack_spec[1], name=stack_spec[0] )
+    _worker["results"] = SharedArray( results_spec[1], name=results_spec[0] )
+
+def _fit_range( job ):
+    """Fits rows start to stop of the shared stack into the shared results"""
+
+    start, stop, model, lowerbounds, upperbounds = job
+    stack = _worker["stack"].array
+    results = _worker["results"].array
+
+    for ( i, lower, upper ) in zip( range( start, stop ), lowerbounds, upperbounds ):
+        try:
+            results[i] = fit_row( stack[i], model, lower, upper )
+        except (RuntimeError, ValueError, TypeError):
+            pass            #row keeps nan
+
+    return stop-start
+
+###############################################################################
+
+def fit_stack( stack, model="gauss", lowerbound=None, upperbound=None, workers=None, chunk=None ):
+    """Fits every spectrum of a stack on a pool of processes sharing the stack
+
+    Parameters:
+        stack (3D array): spectra stacked along first axis, each 2 x channels
+            (x-axis and counts)
+        model (string, optional): "gauss", "expon_decay", "norm" or "skewnorm"
+        lowerbound, upperbound (float or array, optional): bounds on the x axis,
+            the same for every spectrum or one per spectrum
+        workers (int, optional): number of processes. Defaults to the number of
+            CPUs. With 1 worker the fits run in this process
+        chunk (int, optional): spectra per job. Defaults to an even split into
+            4 jobs per worker
+
+    Returns:
+        params (2D array): fitted parameters, one row per spectrum (nan if the fit failed)
+        errors (2D array): errors of the parameters (nan where not available)
+    """
+
+    stack = np.asarray( stack, dtype=float )
+    rows = len(stack)
+    num = len( PARAMS[model] )
+
+    lowerbounds = np.broadcast_to( np.array( lowerbound, dtype=object ), (rows,) )
+    upperbounds = np.broadcast_to( np.array( upperbound, dtype=object ), (rows,) )
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers==1:
+        results = np.full( (rows, 2*num), np.nan )
+        for i in range( rows ):
+            try:
+                results[i] = fit_row( stack[i], model, lowerbounds[i], upperbounds[i] )
+            except (RuntimeError, ValueError, TypeError):
+                pass
+        return results[:,:num], results[:,num:]
+
+    if chunk is None:
+        chunk = max( 1, int( np.ceil( rows/( 4*workers ) ) ) )
+
+    shared = SharedArray( stack.shape )
+    results = SharedArray( (rows, 2*num), fill=np.nan )
+
+    try:
+        shared.array[...] = stack
+
+        jobs = [ ( start, min( start+chunk, rows ), model, lowerbounds[start:start+chunk].tolist(),
+                   upperbounds[start:start+chunk].tolist() ) for start in range( 0, rows, chunk ) ]
+
+        with mp.Pool( workers, initializer=_attach,
+                      initargs=( ( shared.name, shared.shape ), ( results.name, results.shape ) ) ) as pool:
+            pool.map( _fit_range, jobs )
+
+        output = results.array.copy()
+
+    finally:
+        shared.close()
+        results.close()
+
+    return output[:,:num], output[:,num:]
+
+###############################################################################
+
+def read_stack( paths ):
+    """Reads files with the same number of channels into a stack for fit_stack()"""
+
+    spectra = [ readers.cached_read_spectrum( path )[0] for path in paths ]
+
+    if any( s is None for s in spectra ) or len( { s.shape for s in spectra } )>1:
+        print("Value Error: files must be readable and have the same number of channels")
+        return None
+
+    return np.array( spectra )
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Fit many spectra on a pool of processes" )
+    parser.add_argument( "paths", nargs="+", help="spectra (.IEC or .csv) with the same number of channels" )
+    parser.add_argument( "--model", default="gauss", choices=sorted( PARAMS ) )
+    parser.add_argument( "--bounds", type=float, nargs=2, default=(None,None), help="lower and upper bound (channels)" )
+    parser.add_argument( "-j", "--workers", type=int, default=None, help="number of processes" )
+    args = parser.parse_args()
+
+    stack = read_stack( args.paths )
+    if stack is None:
+        sys.exit(1)
+
+    start = time.perf_counter()
+    params, errors = fit_stack( stack, args.model, args.bounds[0], args.bounds[1], args.workers )
+    elapsed = time.perf_counter() - start
+
+    names = PARAMS[args.model]
+    for ( path, p, e ) in zip( args.paths, params, errors ):
+        print( os.path.basename( path )+": "+", ".join( "%s = %.5g ± %.2g"%( n, v, s ) for ( n, v, s ) in zip( names, p, e ) ) )
+
+    print( "%d fits in %.2f s"%( len(stack), elapsed ) )
+
+    sys.exit(0)
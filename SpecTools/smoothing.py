@@ -0,0 +1,159 @@
+# Filename: smoothing.py
+# Purpose: Smoothing of one spectrum or a stack of spectra (one per row) along
+#          the channel axis in a single call. Savitzky-Golay gives the same
+#          result as scipy.signal.savgol_filter, but keeps the coefficients of
+#          each (window, order) pair, and wide windows are convolved by FFT.
+#          Gaussian smoothing keeps the total counts, for peak searches on
+#          sparse spectra.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import functools
+
+import numpy as np
+from scipy.signal import savgol_coeffs, fftconvolve
+from scipy.ndimage import convolve1d
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+#kernels at least this long are convolved by FFT when method="auto"
+FFT_LENGTH = 64
+
+#np.pad equivalents of the scipy.ndimage boundary modes
+PAD_MODES = { "mirror":"reflect", "reflect":"symmetric", "nearest":"edge", "constant":"constant", "wrap":"wrap" }
+
+###############################################################################
+
+@functools.lru_cache( maxsize=64 )
+def savgol_kernel( window, order ):
+    """Savitzky-Golay coefficients of a (window, order) pair, and the matrices
+    that give the polynomial fitted to the first and last window channels at
+    the edge channels (mode "interp"). Cached, and read-only for that reason.
+
+    Returns:
+        coeffs (array): convolution coefficients
+        left, right (2D array): edge values are left @ counts[:window] and
+            right @ counts[-window:]
+    """
+
+    coeffs = savgol_coeffs( window, order )
+
+    #least squares fit of a polynomial over the window, evaluated at its ends
+    t = np.arange( window, dtype=float )
+    fit = np.vander( t, order+1 ) @ np.linalg.pinv( np.vander( t, order+1 ) )
+    half = window//2
+
+    left = fit[:half]
+    right = fit[window-half:]
+
+    for array in ( coeffs, left, right ):
+        array.setflags( write=False )
+
+    return coeffs, left, right
+
+###############################################################################
+
+def convolve( counts, kernel, mode="reflect", method="auto" ):
+    """Convolves every spectrum with a kernel along the last axis, with the
+    boundary modes and centering of scipy.ndimage.convolve1d
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        kernel (array): 1D kernel
+        mode (string, optional): "reflect", "mirror", "nearest", "constant" or "wrap"
+        method (string, optional): "direct", "fft" or "auto" (FFT for kernels of
+            FFT_LENGTH or more)
+
+    Returns:
+        convolved (array): same shape as counts
+    """
+
+    counts = np.asarray( counts, dtype=float )
+
+    if method=="direct" or ( method=="auto" and len(kernel)<FFT_LENGTH ):
+        return convolve1d( counts, kernel, axis=-1, mode=mode )
+
+    #pad as convolve1d would, then keep only the fully overlapping part
+    after = len(kernel)//2
+    before = len(kernel)-1-after
+    pad = [ (0,0) ]*( counts.ndim-1 ) + [ ( before, after ) ]
+    padded = np.pad( counts, pad, mode=PAD_MODES[mode] )
+
+    return fftconvolve( padded, np.reshape( kernel, (1,)*( counts.ndim-1 )+(-1,) ), mode="valid", axes=-1 )
+
+###############################################################################
+
+def savgol( counts, window, order, mode="interp", method="auto" ):
+    """Savitzky-Golay smoothing of one spectrum or a stack of spectra, the same
+    as scipy.signal.savgol_filter( counts, window, order, axis=-1, mode=mode )
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        window (int): window length (channels)
+        order (int): order of the fitted polynomial, less than window
+        mode (string, optional): "interp" (fit the edge windows, default, needs
+            a window no longer than the spectrum), or a boundary mode of convolve()
+        method (string, optional): "direct", "fft" or "auto"
+
+    Returns:
+        smoothed (array): same shape as counts
+    """
+
+    counts = np.asarray( counts, dtype=float )
+    coeffs, left, right = savgol_kernel( int(window), int(order) )
+
+    if mode!="interp":
+        return convolve( counts, coeffs, mode, method )
+
+    if window>counts.shape[-1]:
+        raise ValueError( "window must not be longer than the spectrum in mode interp" )
+
+    smoothed = convolve( counts, coeffs, "constant", method )
+
+    half = window//2
+    if half>0:
+        smoothed[...,:half] = counts[...,:window] @ left.T
+        smoothed[...,-half:] = counts[...,-window:] @ right.T
+
+    return smoothed
+
+###############################################################################
+
+@functools.lru_cache( maxsize=64 )
+def gaussian_kernel( sigma, truncate=4. ):
+    """Normalized Gaussian kernel out to truncate standard deviations (cached)"""
+
+    half = max( int( truncate*sigma+0.5 ), 1 )
+    x = np.arange( -half, half+1, dtype=float )
+
+    kernel = np.exp( -x**2/( 2*sigma**2 ) )
+    kernel /= np.sum( kernel )
+    kernel.setflags( write=False )
+
+    return kernel
+
+###############################################################################
+
+def gaussian_smooth( counts, sigma, truncate=4., method="auto" ):
+    """Gaussian smoothing that keeps the total counts of each spectrum: the
+    kernel sums to one and counts spread past an end are reflected back in
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        sigma (float): standard deviation of the Gaussian (channels)
+        truncate (float, optional): kernel extends this many sigma each side
+        method (string, optional): "direct", "fft" or "auto"
+
+    Returns:
+        smoothed (array): same shape as counts, same totals
+    """
+
+    if sigma<=0:
+        return np.array( counts, dtype=float )
+
+    return convolve( counts, gaussian_kernel( float(sigma), float(truncate) ), "reflect", method )
@@ -0,0 +1,306 @@
+# Filename: streaming.py
+# Purpose: Reads spectra in blocks of channels instead of all at once, for MCA
+#          exports with 16k-64k channels or many spectra in one file. Memory use
+#          depends on the block size only. Statistics, ROI integrals and the
+#          SNIP background are worked out block by block as the file is read.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import argparse
+import itertools
+
+import numpy as np
+
+import readers
+import background
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def iter_IEC( filepath, block=4096 ):
+    """Reads an .IEC file as a stream of channel blocks. Files holding several
+    spectra one after another (e.g. time slices) give the blocks of each
+    spectrum in turn.
+
+    Parameters:
+        filepath (string): filepath of iec file
+        block (int, optional): channels per block (the last block may be shorter)
+
+    Yields:
+        spectrum (int): index of the spectrum in the file, starting at 0
+        header (dict): header of the spectrum (see readers.read_header())
+        start (int): channel of the first count in the block
+        counts (array): counts of the block
+    """
+
+    if ".IEC" not in filepath.upper():
+        print("File Type Error: File must be of .IEC type")
+        return
+
+    try:
+        fin = open( filepath, "r" )
+    except:
+        print("File Path Error: File not found")
+        return
+
+    spectrum = -1
+    header_rows = []
+    at_data = False
+
+    with fin:
+        for row in fin:
+
+            row = row.rstrip("\r\n")
+
+            if not at_data:
+                header_rows.append( row )
+
+                if "USERDEFINED" in row:
+                    at_data = True
+                    spectrum += 1
+                    header = readers.read_header( header_rows )
+                    buffer = np.zeros( block )
+                    start = 0           #channel of buffer[0]
+                    filled = 0
+                    channels = header["channels"]
+                continue
+
+            fields = row[4:].split()
+
+            #any row that is not "index c0 c1 c2 c3 c4" starts the next spectrum
+            if len(fields)!=6 or not row.startswith("A004"):
+                if filled>0:
+                    yield spectrum, header, start, buffer[:filled].copy()
+                at_data = False
+                header_rows = [row]
+                continue
+
+            index = int( fields[0] )
+            values = np.array( fields[1:], dtype=float )[:max( channels-index, 0 )]
+
+            #flush when the row does not continue the current block
+            if index!=start+filled or filled+len(values)>block:
+                if filled>0:
+                    yield spectrum, header, start, buffer[:filled].copy()
+                start = index
+                filled = 0
+
+            buffer[filled:filled+len(values)] = values
+            filled += len(values)
+
+        if at_data and filled>0:
+            yield spectrum, header, start, buffer[:filled].copy()
+
+###############################################################################
+
+def iter_csv( filepath, block=4096 ):
+    """Reads a two-column (channel, counts) .csv file as a stream of channel
+    blocks, in the same form as iter_IEC() (always spectrum 0, empty header)"""
+
+    if ".csv" not in filepath:
+        print("File Type Error: File must be of .csv type")
+        return
+
+    try:
+        fin = open( filepath, "r" )
+    except:
+        print("File Path Error: File not found")
+        return
+
+    with fin:
+        fin.readline()
+
+        while True:
+            rows = list( itertools.islice( fin, block ) )
+            if len(rows)==0:
+                break
+
+            values = np.loadtxt( rows, delimiter=",", usecols=(0,1), ndmin=2 )
+            yield 0, {}, int( values[0,0] ), values[:,1]
+
+###############################################################################
+
+def iter_spectrum( filepath, block=4096 ):
+    """iter_IEC() or iter_csv() depending on the file extension"""
+
+    if filepath.upper().endswith(".IEC"):
+        return iter_IEC( filepath, block )
+
+    return iter_csv( filepath, block )
+
+###############################################################################
+
+def with_background( blocks, window=24 ):
+    """Adds the SNIP background to a stream of blocks. Each block is clipped
+    together with enough channels of its neighbours that the result is the same
+    as snip() of the whole spectrum, so a block is only given out once the next
+    one has been read. Blocks should be longer than window*(window+1)/2 channels
+    for the result to be exact.
+
+    Parameters:
+        blocks (iterable): (spectrum, header, start, counts) as from iter_IEC()
+        window (int, optional): SNIP clipping window (channels)
+
+    Yields:
+        spectrum, header, start, counts: as the input blocks
+        background (array): SNIP background of the block
+    """
+
+    #clipping at distance p moves information p channels, p = window, ..., 1
+    halo = window*( window+1 )//2
+
+    previous = None         #(spectrum, header, start, counts) waiting for its right neighbour
+    left = np.zeros(0)      #channels just before the waiting block
+
+    def finish( block, right ):
+        spectrum, header, start, counts = block
+        values = np.concatenate( ( left, counts, right ) )
+        clipped = background.snip( values, window )
+        return spectrum, header, start, counts, clipped[ len(left):len(left)+len(counts) ]
+
+    for block in blocks:
+
+        if previous is not None and block[0]==previous[0] and block[2]==previous[2]+len(previous[3]):
+            #neighbour may be shorter than the halo, so take what the two blocks hold
+            yield finish( previous, block[3][:halo] )
+            left = np.concatenate( ( left, previous[3] ) )[-halo:]
+
+        else:
+            if previous is not None:
+                yield finish( previous, np.zeros(0) )
+            left = np.zeros(0)
+
+        previous = block
+
+    if previous is not None:
+        yield finish( previous, np.zeros(0) )
+
+###############################################################################
+
+class StreamStats:
+    """Statistics of a spectrum gathered one block at a time: total counts,
+    centroid and spread, the largest channel, and counts (gross and, if a
+    background is given, net) inside fixed regions of interest.
+
+    Parameters:
+        rois (list, optional): (lower, upper) channel bounds, upper exclusive
+    """
+
+    def __init__( self, rois=() ):
+
+        self.rois = np.array( rois, dtype=int ).reshape( -1, 2 )
+        self.total = 0.
+        self.first = 0.         #sum of channel*counts
+        self.second = 0.        #sum of channel^2*counts
+        self.channels = 0
+        self.peak_channel = -1
+        self.peak_counts = -np.inf
+        self.gross = np.zeros( len(self.rois) )
+        self.background = np.zeros( len(self.rois) )
+
+    def update( self, start, counts, background_counts=None ):
+        """Adds a block of counts starting at channel start"""
+
+        counts = np.asarray( counts, dtype=float )
+        channel = start + np.arange( len(counts) )
+
+        self.total += np.sum( counts )
+        self.first += channel @ counts
+        self.second += ( channel**2 ) @ counts
+        self.channels = max( self.channels, start+len(counts) )
+
+        if len(counts)>0 and np.max( counts )>self.peak_counts:
+            self.peak_counts = float( np.max( counts ) )
+            self.peak_channel = int( start + np.argmax( counts ) )
+
+        #overlap of every roi with this block, summed from cumulative counts
+        lower = np.clip( self.rois[:,0]-start, 0, len(counts) )
+        upper = np.clip( self.rois[:,1]-start, 0, len(counts) )
+
+        cumsum = np.r_[ 0., np.cumsum( counts ) ]
+        self.gross += cumsum[upper] - cumsum[lower]
+
+        if background_counts is not None:
+            cumsum = np.r_[ 0., np.cumsum( background_counts ) ]
+            self.background += cumsum[upper] - cumsum[lower]
+
+    @property
+    def mean( self ):
+        return self.first/self.total if self.total>0 else np.nan
+
+    @property
+    def std( self ):
+        return np.sqrt( max( self.second/self.total - self.mean**2, 0. ) ) if self.total>0 else np.nan
+
+    @property
+    def net( self ):
+        return self.gross - self.background
+
+    def summary( self ):
+        """Statistics as a dictionary"""
+
+        return { "channels":self.channels, "total_counts":self.total, "mean":self.mean, "std":self.std,
+                 "peak_channel":self.peak_channel, "peak_counts":self.peak_counts,
+                 "roi_gross":self.gross.tolist(), "roi_net":self.net.tolist() }
+
+###############################################################################
+
+def stream_stats( filepath, rois=(), block=4096, window=None ):
+    """Statistics of every spectrum in a file, read in blocks
+
+    Parameters:
+        filepath (string): filepath of .IEC or .csv file
+        rois (list, optional): (lower, upper) channel bounds, upper exclusive
+        block (int, optional): channels per block
+        window (int, optional): if given, net roi counts use the SNIP background
+            with this window
+
+    Returns:
+        stats (list): one (header, StreamStats) tuple per spectrum in the file
+    """
+
+    blocks = iter_spectrum( filepath, block )
+    if window is not None:
+        blocks = with_background( blocks, window )
+
+    stats = []
+
+    for item in blocks:
+        if len(stats)<=item[0]:
+            stats.append( ( item[1], StreamStats( rois ) ) )
+        stats[item[0]][1].update( *item[2:] )
+
+    return stats
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Statistics of large spectra, read in blocks" )
+    parser.add_argument( "paths", nargs="+", help=".IEC or .csv files" )
+    parser.add_argument( "--block", type=int, default=4096, help="channels per block" )
+    parser.add_argument( "--roi", type=int, nargs=2, action="append", default=[],
+                         help="lower and upper channel of a region of interest (repeatable)" )
+    parser.add_argument( "--window", type=int, default=None, help="SNIP window for net roi counts" )
+    args = parser.parse_args()
+
+    for path in args.paths:
+        for ( i, ( header, stats ) ) in enumerate( stream_stats( path, args.roi, args.block, args.window ) ):
+
+            result = stats.summary()
+            print( "%s [%d]: %d channels, %.0f counts, mean %.2f, std %.2f, max %.0f at %d"%(
+                   os.path.basename( path ), i, result["channels"], result["total_counts"], result["mean"],
+                   result["std"], result["peak_counts"], result["peak_channel"] ) )
+
+            for ( roi, gross, net ) in zip( args.roi, result["roi_gross"], result["roi_net"] ):
+                print( "    roi %d-%d: gross %.0f, net %.0f"%( roi[0], roi[1], gross, net ) )
+
+    sys.exit(0)
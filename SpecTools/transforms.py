@@ -0,0 +1,190 @@
+# Filename: transforms.py
+# Purpose: Channel and count cuts (channel or energy windows, count floors and
+#          ceilings, clipping) as whole-array numpy operations on one spectrum
+#          or a stack of spectra (one per row), instead of loops over channels.
+#          Every cut writes to out (a copy by default, or counts itself to cut
+#          in place), windows can also be taken as views, and cuts are chained
+#          with compose().
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import functools
+
+import numpy as np
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def channel_window( counts, lower=None, upper=None, out=None ):
+    """Zeroes every channel outside lower..upper (both kept)
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        lower, upper (int, optional): first and last channel kept. None for no limit
+        out (array, optional): result array, counts itself to cut in place.
+            Defaults to a copy
+
+    Returns:
+        out (array): cut counts
+    """
+
+    out = _output( counts, out )
+
+    if lower is not None:
+        out[...,:max( int(lower), 0 )] = 0
+    if upper is not None:
+        out[...,max( int(upper)+1, 0 ):] = 0
+
+    return out
+
+###############################################################################
+
+def energy_window( counts, x, lower=None, upper=None, out=None ):
+    """Zeroes every channel whose x value (e.g. energy) is outside lower..upper
+
+    Parameters:
+        counts (array): 1D spectrum or 2D stack of spectra (one per row)
+        x (array): x value of each channel, one row for all spectra or one per spectrum
+        lower, upper (float, optional): x range kept. None for no limit
+        out (array, optional): result array, see channel_window()
+
+    Returns:
+        out (array): cut counts
+    """
+
+    out = _output( counts, out )
+    x = np.asarray( x )
+
+    if lower is not None and upper is not None:
+        outside = ( x<lower ) | ( x>upper )
+    elif lower is not None:
+        outside = x<lower
+    elif upper is not None:
+        outside = x>upper
+    else:
+        return out
+
+    np.copyto( out, 0, where=np.broadcast_to( outside, out.shape ) )
+
+    return out
+
+###############################################################################
+
+def floor( counts, minimum, out=None ):
+    """Zeroes channels with fewer than minimum counts (e.g. a noise threshold)"""
+
+    out = _output( counts, out )
+    np.copyto( out, 0, where=np.asarray( counts )<minimum )
+
+    return out
+
+def ceiling( counts, maximum, out=None ):
+    """Caps channels with more than maximum counts at maximum"""
+
+    out = _output( counts, out )
+
+    return np.minimum( out, maximum, out=out, casting="unsafe" )
+
+def clip( counts, lower=0, upper=None, out=None ):
+    """Limits counts to lower..upper, by default only zeroing negative counts
+    (e.g. after a background subtraction)"""
+
+    out = _output( counts, out )
+
+    if lower is not None:
+        np.maximum( out, lower, out=out, casting="unsafe" )
+    if upper is not None:
+        np.minimum( out, upper, out=out, casting="unsafe" )
+
+    return out
+
+###############################################################################
+
+def crop( data, lower=None, upper=None ):
+    """Channels lower..upper (both kept) of a spectrum, a data array or a stack,
+    as a view of the original (no copy)
+
+    Parameters:
+        data (array): counts, a data array (x in the first row, counts in the
+            second) or a stack of either, channels along the last axis
+        lower, upper (int, optional): first and last channel kept. None for no limit
+
+    Returns:
+        view (array): data[...,lower:upper+1]
+    """
+
+    start = None if lower is None else max( int(lower), 0 )
+    stop = None if upper is None else max( int(upper)+1, 0 )
+
+    return data[...,start:stop]
+
+def energy_crop( data, lower=None, upper=None ):
+    """crop() between x values of a data array (x increasing along the first
+    row, as from calibration.scale_data), as a view
+
+    Returns:
+        view (2D array): columns of data with lower <= x <= upper
+    """
+
+    start = None if lower is None else int( np.searchsorted( data[0], lower, side="left" ) )
+    stop = None if upper is None else int( np.searchsorted( data[0], upper, side="right" ) )
+
+    return data[...,start:stop]
+
+###############################################################################
+
+def compose( *steps ):
+    """Chains cuts into one function. The first cut writes to out (a copy by
+    default), the others cut that result in place, so a chain costs one copy at
+    most however long it is.
+
+    Parameters:
+        *steps (function): cuts taking counts and out, e.g.
+            functools.partial( floor, minimum=2 )
+
+    Returns:
+        apply (function): apply( counts, out=None ) -> out
+    """
+
+    def apply( counts, out=None ):
+
+        out = _output( counts, out )
+        for step in steps:
+            out = step( out, out=out )
+
+        return out
+
+    return apply
+
+def cuts( lower=None, upper=None, minimum=None, maximum=None ):
+    """The usual chain: channel window, noise floor and count ceiling (any of
+    them left out if None), see compose()"""
+
+    steps = []
+    if lower is not None or upper is not None:
+        steps.append( functools.partial( channel_window, lower=lower, upper=upper ) )
+    if minimum is not None:
+        steps.append( functools.partial( floor, minimum=minimum ) )
+    if maximum is not None:
+        steps.append( functools.partial( ceiling, maximum=maximum ) )
+
+    return compose( *steps )
+
+###############################################################################
+#############################  HELPER FUNCTIONS  ##############################
+###############################################################################
+
+def _output( counts, out ):
+    """out, or a copy of counts to cut if there is none"""
+
+    if out is None:
+        return np.array( counts )
+
+    if out is not counts:
+        np.copyto( out, counts, casting="unsafe" )
+
+    return out
@@ -0,0 +1,240 @@
+# Filename: watch.py
+# Purpose: Live analysis of a spectrum while the MCA software is still
+#          acquiring it. Watches an .IEC file (or a folder of them), re-parses
+#          only when the contents change, and refits starting from the previous
+#          parameters so that tau or the peak mean updates within a fraction of
+#          a second of the export being rewritten.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+
+import numpy as np
+
+import readers
+import calibration
+import models
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def list_targets( target, pattern="*.IEC" ):
+    """Returns files being watched: the target itself, or files in the folder"""
+
+    if os.path.isdir( target ):
+        return sorted( glob.glob( os.path.join( target, pattern ) ) )
+
+    return [ target ]
+
+###############################################################################
+
+def read_if_changed( filepath, state ):
+    """Reads a file only if it changed since the last call
+
+    Parameters:
+        filepath (string): filepath of iec file
+        state (dict): per-file state, updated in place
+
+    Returns:
+        data (array): 2D array of raw data, or None if unchanged or unreadable
+        cal_pts (array): calibration points in the file
+    """
+
+    try:
+        stat = os.stat( filepath )
+    except OSError:
+        return None, None
+
+    signature = ( stat.st_mtime_ns, stat.st_size )
+
+    if state.get( "signature" )==signature:
+        return None, None
+
+    with open( filepath, "rb" ) as fin:
+        raw = fin.read()
+
+    digest = hashlib.blake2b( raw, digest_size=16 ).digest()
+    state["signature"] = signature
+
+    #touched but not rewritten
+    if state.get( "digest" )==digest:
+        return None, None
+
+    try:
+        data, cal_pts = readers.parse_IEC( raw.decode( "latin-1" ).splitlines() )
+    except (IndexError, ValueError):
+        #file is halfway through being written, try again on next poll
+        state["signature"] = None
+        return None, None
+
+    state["digest"] = digest
+    state["modified"] = stat.st_mtime
+
+    return data, cal_pts
+
+###############################################################################
+
+def refit( data, state, settings ):
+    """Fits the model, warm-started from the parameters of the previous fit
+
+    Parameters:
+        data (2D array): calibrated data
+        state (dict): per-file state holding previous parameters
+        settings (dict): model, lowerbound and upperbound
+
+    Returns:
+        params (array): fit parameters, or None if the fit failed
+        errors (array): standard errors of params
+    """
+
+    model = settings["model"]
+    lower = settings.get( "lowerbound" )
+    upper = settings.get( "upperbound" )
+
+    for p0 in [ state.get( "params" ), None ]:
+        try:
+            params, covars, sub = models.fit_to_curve( data, model, lower, upper, p0=p0 )
+        except (RuntimeError, ValueError):
+            continue
+
+        if params is not None:
+            state["params"] = params
+            return params, np.sqrt( np.diag( covars ) )
+
+    return None, None
+
+###############################################################################
+
+def calibrate( data, cal_pts, settings ):
+    """Calibrates raw data with the period of lab_3 or the points in the file"""
+
+    if settings.get( "period" ) and settings.get( "channels" ):
+        return calibration.apply_linear( data, settings["period"]/settings["channels"] )
+
+    return calibration.scale_data( data, cal_pts )
+
+###############################################################################
+
+def summary( filepath, data, params, errors, settings, latency ):
+    """One line summary of the latest fit"""
+
+    name = os.path.basename( filepath )
+    total = np.sum( data[1] )
+
+    if params is None:
+        return "%s: %d counts, fit failed"%( name, total )
+
+    if settings["model"]=="expon_decay":
+        result = "tau = %.5f ± %.5f"%( params[1], errors[1] )
+    else:
+        result = "mean = %.5f ± %.5f, std = %.5f"%( params[1], errors[1], params[0] )
+
+    return "%s: %d counts, %s (%.0f ms after write)"%( name, total, result, 1000*latency )
+
+###############################################################################
+
+def watch( target, model="gauss", lowerbound=None, upperbound=None, period=None, channels=None,
+           interval=0.1, plot=True, max_updates=None, callback=None ):
+    """Watches a file or folder and refits whenever a spectrum changes
+
+    Parameters:
+        target (string): .IEC file or folder of .IEC files
+        model (string, optional): "gauss" or "expon_decay". Defaults to "gauss"
+        lowerbound, upperbound (float, optional): bounds of the fit, in calibrated units
+        period, channels (float, optional): time calibration as in lab_3. If not
+            given, the calibration points in the file are used
+        interval (float, optional): seconds between polls. Defaults to 0.1
+        plot (bool, optional): if true, keeps a live plot of data and fit
+        max_updates (int, optional): stop after this many refits (for scripting)
+        callback (function, optional): called as callback(filepath, data, params, errors)
+
+    Returns:
+        states (dict): final per-file state, including last fit parameters
+    """
+
+    settings = { "model":model, "lowerbound":lowerbound, "upperbound":upperbound,
+                 "period":period, "channels":channels }
+    states = {}
+    updates = 0
+
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.ion()
+        fig, ax = plt.subplots()
+        data_line, = ax.plot( [], [], label="Raw data" )
+        fit_line, = ax.plot( [], [], label="Fit curve" )
+        ax.set_ylabel("Counts")
+        ax.set_xlabel("Decay time (microseconds)" if model=="expon_decay" else "Energy (keV)")
+        ax.legend()
+
+    while max_updates is None or updates<max_updates:
+
+        for filepath in list_targets( target ):
+
+            state = states.setdefault( filepath, {} )
+            raw, cal_pts = read_if_changed( filepath, state )
+
+            if raw is None:
+                continue
+
+            data = calibrate( raw, cal_pts, settings )
+            params, errors = refit( data, state, settings )
+            updates += 1
+
+            print( summary( filepath, data, params, errors, settings, time.time()-state["modified"] ) )
+
+            if callback is not None:
+                callback( filepath, data, params, errors )
+
+            if plot:
+                data_line.set_data( data[0], data[1] )
+
+                if params is not None:
+                    lower, upper = models.get_bounds( data, lowerbound, upperbound )
+                    x = np.linspace( data[0,lower], data[0,upper], 1000 )
+                    fit_line.set_data( x, models.MODELS[model]( x, *params ) )
+
+                ax.set_title( os.path.basename( filepath ) )
+                ax.relim()
+                ax.autoscale_view()
+                fig.canvas.draw_idle()
+
+        if plot:
+            plt.pause( interval )
+        else:
+            time.sleep( interval )
+
+    return states
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Refit a spectrum every time the MCA export changes" )
+    parser.add_argument( "target", help=".IEC file or folder of .IEC files" )
+    parser.add_argument( "--model", default="gauss", choices=["gauss","expon_decay"] )
+    parser.add_argument( "--lower", type=float, default=None, help="lower bound of fit" )
+    parser.add_argument( "--upper", type=float, default=None, help="upper bound of fit" )
+    parser.add_argument( "--period", type=float, default=None, help="period of time calibration (microseconds)" )
+    parser.add_argument( "--channels", type=float, default=None, help="avg. number of channels per period" )
+    parser.add_argument( "--interval", type=float, default=0.1, help="seconds between polls" )
+    parser.add_argument( "--no-plot", action="store_true", help="only print a summary line per update" )
+    args = parser.parse_args()
+
+    try:
+        watch( args.target, args.model, args.lower, args.upper, args.period, args.channels,
+               args.interval, not args.no_plot )
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+        sys.exit(0)
@@ -0,0 +1,306 @@
+# Filename: waterfall.py
+# Purpose: Shows a whole Compton angle sweep at once. The calibrated spectra of
+#          all trials are moved onto one energy grid (keeping counts) and drawn
+#          as a single image, one row per trial in order of angle, with the
+#          expected scattered energy energy(theta, 662) and the fitted peaks on
+#          top. One image draws and saves far faster than dozens of line plots,
+#          and a trial whose peak is off the curve stands out.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import csv
+import glob
+import argparse
+
+import numpy as np
+
+import readers
+import calibration
+import autocal
+import arithmetic
+import models
+import peaks
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+def trial_number( filepath ):
+    """Number in a file name such as "Trial 12.IEC" (0 if there is none)"""
+
+    return int( "0"+"".join( c for c in os.path.basename( filepath ) if c.isdigit() ) )
+
+###############################################################################
+
+def read_results( filepath ):
+    """Reads angle and fitted peak of each trial from a results sheet with the
+    columns of ComptonScatter/RESULTS.csv (Trial, Mean, Error, ..., Angle)
+
+    Returns:
+        results (dict): trial number -> (angle in degrees, mean, error), or None
+    """
+
+    try:
+        fin = open( filepath, "r", encoding="utf-8-sig" )
+    except OSError:
+        print("File Path Error: File not found")
+        return None
+
+    with fin:
+        rows = list( csv.reader( fin ) )
+
+    header = rows[0]
+    columns = [ header.index( name ) for name in ["Trial","Angle","Mean","Error"] ]
+
+    return { int( float( row[columns[0]] ) ):( float( row[columns[1]] ), float( row[columns[2]] ), float( row[columns[3]] ) )
+             for row in rows[1:] if len(row)>max(columns) and row[columns[0]].strip() }
+
+###############################################################################
+
+def bin_edges( x ):
+    """Edges of bins centered on increasing (calibrated) channel positions, one
+    set per row for a 2D array"""
+
+    x = np.asarray( x, dtype=float )
+    middle = ( x[...,1:]+x[...,:-1] )/2
+
+    return np.concatenate( [ 2*x[...,:1]-middle[...,:1], middle, 2*x[...,-1:]-middle[...,-1:] ], axis=-1 )
+
+###############################################################################
+
+def stack_spectra( spectra, edges, live_times=None, normalize="max" ):
+    """Moves calibrated spectra onto a common energy grid
+
+    Parameters:
+        spectra (list): 2D arrays, first row is energy and second row is counts
+        edges (array): edges of the common energy bins
+        live_times (array, optional): live time of each spectrum, for normalize="rate"
+        normalize (string, optional): "max" scales each row to a peak of 1 (default),
+            "rate" divides by live time, "none" keeps counts
+
+    Returns:
+        image (2D array): one row per spectrum, one column per energy bin
+    """
+
+    if len( { s.shape for s in spectra } )==1:
+        #same channels: one call for the whole stack
+        stack = np.array( spectra, dtype=float )
+        image = arithmetic.rebin_edges( stack[:,1], bin_edges( stack[:,0] ), edges )[0]
+    else:
+        image = np.array( [ arithmetic.rebin_edges( s[1], bin_edges( s[0] ), edges )[0] for s in spectra ] )
+
+    if normalize=="rate" and live_times is not None:
+        image /= np.asarray( live_times, dtype=float )[:,None]
+
+    elif normalize=="max":
+        top = np.max( image, axis=1, keepdims=True )
+        image /= np.where( top>0, top, 1 )
+
+    return image
+
+###############################################################################
+
+def fit_peak( data, angle=None ):
+    """Photopeak of a Compton trial: Gaussian fit of the peak nearest the
+    expected scattered energy (peaks.compton_roi), or of the strongest peak
+    above channel 20 if the angle is not known
+
+    Parameters:
+        data (2D array): calibrated spectrum
+        angle (float, optional): scattering angle (degrees)
+
+    Returns:
+        mean, error (float): fitted mean and its error, nan if the fit fails
+    """
+
+    try:
+        if angle is None:
+            lower, upper = peaks.propose_roi( data, min_channel=20, threshold=10 )
+        else:
+            lower, upper = peaks.compton_roi( data, angle )
+        params, covars, sub = models.fit_to_curve( data, "gauss", lower, upper )
+        return params[1], np.sqrt( covars[1,1] )
+    except (RuntimeError, ValueError, TypeError, IndexError):
+        return np.nan, np.nan
+
+###############################################################################
+
+def plot_sweep( ax, image, edges, angles, labels=None, means=None, errors=None, E_gamma=662., log=True ):
+    """Draws the stacked spectra as one image in order of angle, with the
+    predicted scattered energy and fitted peaks on top
+
+    Parameters:
+        ax (Axes): axes to draw on
+        image (2D array): from stack_spectra()
+        edges (array): energy bin edges of image
+        angles (array): scattering angle of each row (degrees)
+        labels (list, optional): name of each row (e.g. trial number)
+        means, errors (array, optional): fitted peak energy of each row and its error
+        E_gamma (float, optional): energy of the source line (keV)
+        log (bool, optional): logarithmic color scale
+
+    Returns:
+        im (AxesImage): the image, e.g. for a colorbar
+    """
+
+    from matplotlib.colors import LogNorm
+
+    angles = np.asarray( angles, dtype=float )
+    order = np.argsort( angles, kind="stable" )
+    rows = np.arange( len(order) )
+
+    shown = image[order]
+    norm = None
+    if log:
+        positive = shown[shown>0]
+        norm = LogNorm( vmin=np.min( positive ) if len(positive)>0 else 1e-3, vmax=max( np.max( shown ), 1e-3 ) )
+        shown = np.where( shown>0, shown, np.nan )
+
+    im = ax.imshow( shown, aspect="auto", origin="lower", interpolation="nearest", norm=norm,
+                    extent=( edges[0], edges[-1], -0.5, len(order)-0.5 ) )
+
+    ax.plot( models.energy( np.radians( angles[order] ), E_gamma ), rows, "w--", label="energy(theta, %g)"%E_gamma )
+
+    if means is not None:
+        ax.errorbar( np.asarray( means )[order], rows, xerr=None if errors is None else np.asarray( errors )[order],
+                     fmt="o", color="red", markersize=3, label="Fitted peaks" )
+
+    names = [ "%g°"%a for a in angles[order] ]
+    if labels is not None:
+        names = [ "%s (%s)"%( name, labels[i] ) for ( name, i ) in zip( names, order ) ]
+
+    ax.set_yticks( rows )
+    ax.set_yticklabels( names, fontsize=6 )
+    ax.set_xlim( edges[0], edges[-1] )
+    ax.set_xlabel( "Energy (keV)" )
+    ax.set_ylabel( "Angle (trial)" )
+    ax.legend( loc="upper right", fontsize=7 )
+
+    return im
+
+###############################################################################
+
+def sweep( paths, results=None, bins=512, emin=0., emax=800., normalize="max", fit=True,
+           calibrate=calibration.scale_data ):
+    """Reads, calibrates and stacks the trials of a sweep
+
+    Parameters:
+        paths (list): .IEC files of the trials
+        results (dict, optional): from read_results(), gives angles (and fitted
+            peaks if fit is false). Trials missing from it are left out
+        bins (int, optional): number of energy bins
+        emin, emax (float, optional): energy range (keV)
+        normalize (string, optional): see stack_spectra()
+        fit (bool, optional): fits each trial at its angle (fit_peak) instead of using results.
+            The peaks of a results sheet are only in place if calibrate is the
+            calibration they were found with
+        calibrate (function, optional): calibrate( data, cal_pts ) gives the
+            calibrated copy of a trial. Defaults to calibration.scale_data, lab_4
+            passes its own calibration so the image matches its other plots
+
+    Returns:
+        sweep (dict): image, edges, angles, trials, means and errors
+    """
+
+    if results is None:
+        print("Value Error: angles of the trials are needed (results sheet)")
+        return None
+
+    paths = sorted( [ p for p in paths if trial_number( p ) in results ], key=trial_number )
+
+    spectra, live_times, trials = [], [], []
+
+    for path in paths:
+        data, cal_pts = readers.cached_read_spectrum( path )
+        header = readers.IEC_header( path )
+        if data is None or header is None:
+            continue
+
+        spectra.append( calibrate( data, cal_pts ) )
+        live_times.append( header["live_time"] )
+        trials.append( trial_number( path ) )
+
+    if len(spectra)==0:
+        print("Value Error: no trials with known angles")
+        return None
+
+    edges = np.linspace( emin, emax, bins+1 )
+
+    if fit:
+        means, errors = np.array( [ fit_peak( s, results[t][0] ) for ( s, t ) in zip( spectra, trials ) ] ).T
+    else:
+        means = np.array( [ results[t][1] for t in trials ] )
+        errors = np.array( [ results[t][2] for t in trials ] )
+
+    return { "image":stack_spectra( spectra, edges, live_times, normalize ), "edges":edges,
+             "angles":np.array( [ results[t][0] for t in trials ] ), "trials":trials,
+             "means":means, "errors":errors }
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Angle vs energy image of a Compton sweep" )
+    parser.add_argument( "folder", help="folder of Trial N.IEC files" )
+    parser.add_argument( "--results", default=None, help="results sheet with Trial and Angle columns "
+                                                          "(defaults to RESULTS.csv next to the folder)" )
+    parser.add_argument( "--bins", type=int, default=512 )
+    parser.add_argument( "--range", type=float, nargs=2, default=(0.,800.), help="energy range (keV)" )
+    parser.add_argument( "--normalize", default="max", choices=["max","rate","none"] )
+    parser.add_argument( "--linear", action="store_true", help="linear color scale" )
+    parser.add_argument( "--sheet-peaks", action="store_true", help="show the peaks of the results sheet instead of refitting" )
+    parser.add_argument( "--calibration", default="gain", choices=["gain","points","session"],
+                         help="gain of the SPARE points as lab_4 (default, as the results sheet), piecewise through "
+                              "the points, or the Cs-137 calibration spectrum of the folder" )
+    parser.add_argument( "-o", "--output", default=None, help="save to file (png, pdf, svg) instead of showing" )
+    args = parser.parse_args()
+
+    results_path = args.results or os.path.join( os.path.dirname( os.path.abspath( args.folder ) ), "RESULTS.csv" )
+    results = read_results( results_path )
+
+    paths = glob.glob( os.path.join( glob.escape( args.folder ), "*.IEC" ) )
+    paths = [ p for p in paths if not os.path.basename( p ).lower().startswith("calibration") ]
+
+    #the sheet peaks were fitted by lab_4, on its gain calibration
+    if args.sheet_peaks and args.calibration!="gain":
+        print("Value Error: the peaks of the results sheet are only in place with --calibration gain")
+        sys.exit(1)
+
+    if args.calibration=="session":
+        cal = autocal.session_calibration( args.folder, "Cs-137" )
+        if cal is None:
+            print("Value Error: no calibration spectrum of Cs-137 found in "+args.folder)
+            sys.exit(1)
+        calibrate = lambda data, cal_pts: cal.apply( data )
+    else:
+        calibrate = calibration.scale_gain if args.calibration=="gain" else calibration.scale_data
+
+    result = sweep( paths, results, args.bins, args.range[0], args.range[1], args.normalize, not args.sheet_peaks,
+                    calibrate )
+    if result is None:
+        sys.exit(1)
+
+    if args.output:
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots( figsize=(8,8) )
+    im = plot_sweep( ax, result["image"], result["edges"], result["angles"], result["trials"],
+                     result["means"], result["errors"], log=not args.linear )
+    fig.colorbar( im, ax=ax, label={ "max":"Counts / peak", "rate":"Counts/s", "none":"Counts" }[args.normalize] )
+    ax.set_title( "Compton sweep, %d trials"%len(result["trials"]) )
+
+    if args.output:
+        fig.savefig( args.output, dpi=150 )
+    else:
+        plt.show()
+
+    sys.exit(0)
@@ -0,0 +1,195 @@
+# Filename: xraylines.py
+# Purpose: Identifies elements in XRF spectra (lab_2) from their peak energies,
+#          using the packaged table of K and L emission lines. Every element is
+#          scored across all peaks of a spectrum, so the result is a ranked
+#          composition guess rather than a per-peak lookup. Peaks are matched
+#          within their fitted width, since the lines of the lab detector
+#          are a few tenths of a keV wide and sit about as far off the table.
+# Date Created: 10/19/26
+
+###############################################################################
+##################################  MODULES  ##################################
+###############################################################################
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+
+import linelib
+import readers
+import calibration
+import multipeak
+
+###############################################################################
+#################################  FUNCTIONS  #################################
+###############################################################################
+
+LIBRARY = "xray_lines.csv"
+
+def identify( energies, errors=None, areas=None, tolerance=0.15, emin=None, emax=None, library=LIBRARY,
+              widths=None ):
+    """Ranks elements by how well their emission lines explain a set of peaks
+
+    An element scores for each of its lines close to a peak (the nearest one),
+    weighted by the relative intensity of the line and how close it is. The
+    score is then scaled by the fraction of the element's line intensity inside
+    [emin, emax] that was actually seen, so a lone match to a weak Kb line
+    without its Ka counts for little.
+
+    Parameters:
+        energies (array): peak energies (keV)
+        errors (array, optional): uncertainty of each energy (keV)
+        areas (array, optional): peak areas, used to estimate composition
+        tolerance (float, optional): largest energy difference for a match (keV)
+            on top of the peak width, for the calibration
+        emin, emax (float, optional): energy range searched for peaks. Defaults
+            to the range of the energies given
+        library (string, optional): line table in SpecTools/data
+        widths (array, optional): fitted sigma of each peak (keV), added in
+            quadrature to the tolerance and errors
+
+    Returns:
+        ranking (list): one dictionary per candidate element, best first, with
+            Z, element, score, share (fraction of peak area assigned to it) and
+            lines (list of (line, table energy, peak index))
+        assigned (array): Z assigned to each peak (0 if unmatched)
+    """
+
+    energies = np.atleast_1d( np.asarray( energies, dtype=float ) )
+    lib = linelib.load_library( library )
+
+    if len(energies)==0:
+        return [], np.zeros( 0, dtype=int )
+
+    if areas is None:
+        areas = np.ones( len(energies) )
+    if emin is None:
+        emin = np.min( energies ) - tolerance
+    if emax is None:
+        emax = np.max( energies ) + tolerance
+    if widths is not None:
+        tolerance = np.sqrt( tolerance**2 + np.asarray( widths, dtype=float )**2 )
+
+    peak, line, distance = linelib.candidates( energies, lib, tolerance, errors )
+
+    #a line explains one peak at most (its nearest), and only lines in range count
+    order = np.lexsort( ( np.abs( distance ), line ) )
+    first = order[ np.r_[ True, line[order][1:]!=line[order][:-1] ] ] if len(line)>0 else order
+    first = first[ ( lib["Energy"][ line[first] ]>=emin ) & ( lib["Energy"][ line[first] ]<=emax ) ]
+    peak, line, distance = peak[first], line[first], distance[first]
+
+    if len(line)==0:
+        return [], np.zeros( len(energies), dtype=int )
+
+    intensity = lib["Intensity"][line]/100.
+    weight = intensity*np.exp( -0.5*distance**2 )
+
+    Z = lib["Z"][line]
+    elements, which = np.unique( Z, return_inverse=True )
+    score = np.bincount( which, weights=weight, minlength=len(elements) )
+
+    #intensity seen vs. intensity expected in the searched range
+    visible = linelib.in_range( lib, emin, emax )
+    visible = visible[ np.isin( visible["Z"], elements ) ]
+    expected = np.bincount( np.searchsorted( elements, visible["Z"] ), weights=visible["Intensity"]/100.,
+                            minlength=len(elements) )
+
+    seen = np.bincount( which, weights=intensity, minlength=len(elements) )
+
+    score *= seen/np.maximum( expected, 1e-12 )
+
+    #each peak goes to the candidate with the best element score times closeness
+    pair_score = score[which]*np.exp( -0.5*distance**2 )
+    order = np.lexsort( ( -pair_score, peak ) )
+    first = order[ np.r_[ True, peak[order][1:]!=peak[order][:-1] ] ]
+
+    assigned = np.zeros( len(energies), dtype=int )
+    assigned[ peak[first] ] = Z[first]
+
+    share = np.bincount( np.searchsorted( elements, Z[first] ), weights=np.asarray( areas, dtype=float )[ peak[first] ],
+                         minlength=len(elements) )
+    share /= max( np.sum( share ), 1e-12 )
+
+    #best explained elements first
+    ranking = []
+
+    for i in np.argsort( -score, kind="stable" ):
+        if score[i]<=0:
+            continue
+
+        matched = [ ( str(lib["Line"][l]), float(lib["Energy"][l]), int(p) ) for (p,l) in zip( peak[which==i], line[which==i] ) ]
+        ranking.append( { "Z":int(elements[i]), "element":str(lib["Element"][line[which==i][0]]),
+                          "score":float(score[i]), "share":float(share[i]), "lines":matched } )
+
+    return ranking, assigned
+
+###############################################################################
+
+def identify_spectrum( data, tolerance=0.15, min_energy=2.5, **kwargs ):
+    """Fits the lines of a calibrated XRF spectrum and identifies the elements.
+    Each line is matched within its fitted width (the detector sigma at its
+    energy, see multipeak.fit_lines), plus tolerance for the calibration.
+
+    Parameters:
+        data (2D array): first row is energy (keV) and second row is counts
+        tolerance (float, optional): energy difference allowed on top of the line
+            width (keV)
+        min_energy (float, optional): ignore lines below this energy (noise edge,
+            and L lines absorbed in air)
+        **kwargs: passed on to multipeak.fit_lines()
+
+    Returns:
+        ranking, assigned: see identify()
+        lines (structured array): fitted lines from multipeak.fit_lines()
+    """
+
+    emin = max( min_energy, np.min( data[0] ) )
+    emax = np.max( data[0] )
+
+    try:
+        lines, result = multipeak.fit_lines( data, emin=emin, emax=emax, **kwargs )
+    except ValueError:
+        print("Value Error: lines could not be fitted, check the calibration")
+        return [], np.zeros( 0, dtype=int ), np.empty( 0, dtype=multipeak.LINE_DTYPE )
+
+    lines = lines[ lines["area"]>0 ]
+
+    ranking, assigned = identify( lines["energy"], errors=lines["energy_error"], areas=lines["area"], tolerance=tolerance,
+                                  emin=emin, emax=emax, widths=lines["sigma"] )
+
+    return ranking, assigned, lines
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser( description="Identify elements in XRF spectra" )
+    parser.add_argument( "paths", nargs="+", help=".IEC files or folders of .IEC files" )
+    parser.add_argument( "--tolerance", type=float, default=0.15, help="match tolerance on top of the line width (keV)" )
+    parser.add_argument( "--top", type=int, default=3, help="number of elements to list" )
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        files += sorted( glob.glob( os.path.join( path, "*.IEC" ) ) ) if os.path.isdir( path ) else [path]
+
+    for filepath in files:
+
+        data, cal_pts = readers.IEC_to_array( filepath )
+        if data is None:
+            continue
+
+        start = time.perf_counter()
+        ranking, assigned, lines = identify_spectrum( calibration.scale_data( data, cal_pts ), args.tolerance )
+        elapsed = time.perf_counter() - start
+
+        guess = ", ".join( "%s (%.0f%%)"%( r["element"], 100*r["share"] ) for r in ranking[:args.top] )
+        print( "%s: %s [%.1f ms]"%( os.path.basename( filepath ), guess if guess else "no match", 1000*elapsed ) )
+
+    sys.exit(0)
@@ -1,15 +1,28 @@
 #last updated 10/5/21 by Isaiah Mumaw
 
 #import modules
+import os
+import sys
 from scipy.stats import linregress
-from scipy.signal import savgol_filter
 import numpy as np
 import matplotlib.pyplot as plt
 
+#shared tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SpecTools"))
+from background import snip
+from readers import IEC_to_array, IEC_header
+from calibration import scale_data
+from multipeak import fit_lines, write_moseley_csv
+from xraylines import identify
+from profiling import laps, stage, timed
+from smoothing import savgol
+from transforms import clip
+
 ##############################################################################
 ##############################################################################
 
-def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degree=2, cal_pts = 6):
+@timed("convert", file_arg=0)
+def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degree=2, cal_pts = 6, snip_window=0):
     """Converts .iec file to a readable format. Accounts for noise floor
     
     Parameters:
@@ -17,11 +30,14 @@ def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degr
         num_channels (int): number of channels being analyzed
         noisepath (bool or string): filepath of csv file of noise floor data. If false, does not account for noise
         smooth (bool): whether or not to smooth plot
+        snip_window (int): if nonzero, subtracts continuum background estimated with SNIP, using this clipping window (channels)
     
     Returns:
         raw_data (array): 1D array, data as listed in .csv file
     """
     
+    lap = laps(filepath)    #stage timings, only recorded when profiling is on
+    
     fin = open(filepath,"r")
     raw_data = np.zeros((2,num_channels),dtype=float)     #empty array for data
     
@@ -72,6 +88,8 @@ def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degr
             raw_data[1,index+3] = float(row[5])
             raw_data[1,index+4] = float(row[6])
     
+    lap("parse")
+    
     n=1
     
     for (i,element) in enumerate(raw_data[0]):
@@ -110,7 +128,8 @@ def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degr
             m = (e_n - e_m)/(x_n-x_m)
             
             raw_data[0,i] = m*(element-x_n) + e_n
-        
+    
+    lap("calibrate")
       
     if noisepath != False:
       
@@ -213,12 +232,20 @@ def convert(filepath,num_channels,noisepath=False, smooth=False, window=10, degr
             else:    
                 raw_data[1,i] -= approximate(noisedata[0,neg],noisedata[0,pos],noisedata[1,neg],noisedata[1,pos],energy)
     
-        raw_data[raw_data<0]=0
+        clip(raw_data,0,out=raw_data)
+        
+        lap("noise subtraction")
+    
+    if snip_window>0:
+        
+        raw_data[1] -= snip(raw_data[1],snip_window)
+        clip(raw_data,0,out=raw_data)
     
     if smooth:
         
-        raw_data[1] = savgol_filter(raw_data[1],window,degree)
-        raw_data[raw_data<0]=0
+        with stage("smooth", filepath):
+            raw_data[1] = savgol(raw_data[1],window,degree)
+        clip(raw_data,0,out=raw_data)
     
     return raw_data
 
@@ -335,6 +362,12 @@ def get_input():
         noise_floor = noise_floor.replace("\\ "," ").strip()
     else:
         noise_floor = False
+    
+    continuum = input("\nSubtract continuum background (SNIP)? (y/n): ")
+    if continuum=="y":
+        snip_window=int(input("Clipping window (channels, about the width of the widest peak): "))
+    else:
+        snip_window=0
         
     smoothing = input("\nApply smoothing algorithm (Savitzky-Golay)? (y/n): ")
     if smoothing=="y":
@@ -348,7 +381,7 @@ def get_input():
     
     chart_title = input("\nChart title: ")
     
-    return filepath, chart_title, noise_floor, smooth, window, degree
+    return filepath, chart_title, noise_floor, smooth, window, degree, snip_window
 
 ##############################################################################
 ##############################################################################
@@ -371,11 +404,12 @@ def options(choice):
     
     if choice==1:
 
-        filepath, chart_title, noise_floor, smooth, window, degree = get_input()
+        filepath, chart_title, noise_floor, smooth, window, degree, snip_window = get_input()
 
-        num_channels=4100
+        #channel count from the file header, rounded up to whole rows of 5 channels
+        num_channels=5*((IEC_header(filepath)["channels"]+4)//5)
 
-        raw_data = convert(filepath,num_channels,noise_floor,smooth,window,degree)
+        raw_data = convert(filepath,num_channels,noise_floor,smooth,window,degree,snip_window=snip_window)
         
         plotter(raw_data,chart_title)
         plt.show()
@@ -415,6 +449,59 @@ def options(choice):
         plt.show()
         
     elif choice==3:
+        
+        filepath = input("\nInput filepath for .iec file (or drag/drop file into command terminal): ")
+        filepath = filepath.replace("\\ "," ").strip()
+        
+        emin, emax = input("\nEnergy range to fit (keV, separated by spaces): ").split()
+        
+        raw_data, cal_pts = IEC_to_array(filepath)
+        raw_data = scale_data(raw_data, cal_pts)
+        
+        lines, result = fit_lines(raw_data, emin=float(emin), emax=float(emax))
+        ranking, suggested = identify(lines["energy"], errors=lines["energy_error"], areas=lines["area"], emin=float(emin), emax=float(emax), widths=lines["sigma"])
+        
+        #suggestions are often wrong (calibration offsets), so each one shows how well its
+        #element fits, and elements holding none of the fitted area are not suggested
+        elements = {r["Z"]:r for r in ranking}
+        suggested = [z if z in elements and elements[z]["share"]>0 else 0 for z in suggested]
+        
+        print("\nFitted lines:")
+        for (i,line) in enumerate(lines):
+            if suggested[i]>0:
+                r = elements[suggested[i]]
+                guess = "Suggested Z = %d (%s, score %.2f, %.0f%% of area)"%(r["Z"],r["element"],r["score"],100*r["share"])
+            else:
+                guess = "no suggestion"
+            print("%d: Energy = %.4f ± %.4f keV, Area = %.0f ± %.0f counts, %s"%(i+1,line["energy"],line["energy_error"],line["area"],line["area_error"],guess))
+        print("Likely elements: "+", ".join("%s (score %.2f, %.0f%%)"%(r["element"],r["score"],100*r["share"]) for r in ranking[:3]))
+        print("Reduced chi squared: %.3f"%result["chi2"])
+        
+        plt.plot(raw_data[0],raw_data[1],color="tab:blue",label="Data")
+        plt.plot(result["x"],result["model"]+snip(raw_data[1])[(raw_data[0]>=float(emin))&(raw_data[0]<=float(emax))],color="tab:red",label="Fit")
+        plt.xlim([float(emin),float(emax)])
+        plt.xlabel("Energy (keV)")
+        plt.ylabel("Counts")
+        plt.legend()
+        plt.show()
+        
+        Z = input("\nAtomic number of each line for Moseley fit (separated by spaces, 0 to skip), \"s\" to go through the suggestions, or press Enter to skip: ").split()
+        
+        #every suggestion is confirmed or replaced line by line
+        if Z==["s"]:
+            Z = []
+            for (i,line) in enumerate(lines):
+                if suggested[i]>0:
+                    answer = input("Line %d at %.3f keV: Z = %d (%s)? Enter to accept, or type Z (0 to skip): "%(i+1,line["energy"],suggested[i],elements[suggested[i]]["element"])).strip()
+                    Z.append(answer if answer else suggested[i])
+                else:
+                    Z.append(input("Line %d at %.3f keV: Z (0 to skip): "%(i+1,line["energy"])).strip() or 0)
+        
+        if len(Z)==len(lines):
+            outpath = input("Output .csv filepath: ").replace("\\ "," ").strip()
+            write_moseley_csv(outpath, lines, [int(z) for z in Z])
+        
+    elif choice==4:
         print("Program ended\n")
         return True
         
@@ -434,7 +521,7 @@ if __name__ == "__main__":
     
     while not quit:
         print("\n---------------------------------------------------------------------------")
-        print("\nSelect one of the following: \n1: Plot raw data \n2: Plot linear data with error bars and fit line \n3: Exit Program")
+        print("\nSelect one of the following: \n1: Plot raw data \n2: Plot linear data with error bars and fit line \n3: Fit line energies (overlapping peaks) \n4: Exit Program")
         choice = input("\nYour choice: ")
         
         try: